@@ -0,0 +1,78 @@
+""" Compares sending homogeneous records one object at a time with
+sending them in columnar batches through a :class:`picklepipe.ColumnarPipe`.
+
+Usage: python benchmarks/bench_columnar.py [--records N] [--batch-size N] """
+import argparse
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import picklepipe  # noqa: E402
+
+
+def make_records(count):
+    return [{'timestamp': 1500000000.0 + i, 'host_id': i % 64, 'cpu': (i % 100) / 100.0,
+             'requests': i * 3, 'region': 'us-east-%d' % (i % 4)} for i in range(count)]
+
+
+def bench_objects(pipe_type, records):
+    rd, wr = picklepipe.make_pipe_pair(pipe_type)
+    wire = sum(len(wr._dumps(record)) for record in records)
+
+    def send():
+        for record in records:
+            wr.send_object(record)
+    start = timeit.default_timer()
+    thread = threading.Thread(target=send)
+    thread.start()
+    for _ in records:
+        rd.recv_object(timeout=10.0)
+    thread.join()
+    elapsed = timeit.default_timer() - start
+    rd.close()
+    wr.close()
+    return elapsed, wire
+
+
+def bench_columnar(pipe_type, records, batch_size):
+    rd, wr = picklepipe.make_pipe_pair(pipe_type)
+    rd, wr = picklepipe.ColumnarPipe(rd), picklepipe.ColumnarPipe(wr, batch_size=batch_size)
+    wire = sum(len(picklepipe.columnar._encode_batch(records[i:i + batch_size],
+                                                     list(records[0]), wr._pipe._dumps))
+               for i in range(0, len(records), batch_size))
+
+    def send():
+        for record in records:
+            wr.send_record(record)
+        wr.flush()
+    start = timeit.default_timer()
+    thread = threading.Thread(target=send)
+    thread.start()
+    for _ in records:
+        rd.recv_record(timeout=10.0)
+    thread.join()
+    elapsed = timeit.default_timer() - start
+    rd.close()
+    wr.close()
+    return elapsed, wire
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    for pipe_type in (picklepipe.PicklePipe, picklepipe.MarshalPipe, picklepipe.JSONPipe):
+        objects_time, objects_wire = bench_objects(pipe_type, records)
+        columnar_time, columnar_wire = bench_columnar(pipe_type, records, args.batch_size)
+        print('%s objects:  %.3f s %d bytes' % (pipe_type.__name__, objects_time, objects_wire))
+        print('%s columnar: %.3f s %d bytes' % (pipe_type.__name__, columnar_time, columnar_wire))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+""" Compares pickling with ``pickle.dumps`` for every object, which is
+what :class:`picklepipe.PicklePipe` does without reducers, with the
+pipe's kept pickler and a reducer registered for a hot type.
+
+Usage: python benchmarks/bench_pickler.py [--number N] """
+import argparse
+import os
+import pickle
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import picklepipe  # noqa: E402
+
+
+class Sample(object):
+    def __init__(self, timestamp, host, value):
+        self.timestamp = timestamp
+        self.host = host
+        self.value = value
+
+
+def reduce_sample(sample):
+    return Sample, (sample.timestamp, sample.host, sample.value)
+
+
+def bench(name, dumps, loads, obj, number):
+    data = dumps(obj)
+    dumps_time = timeit.timeit(lambda: dumps(obj), number=number)
+    loads_time = timeit.timeit(lambda: loads(data), number=number)
+    print('%-18s dumps %6.2f us  loads %6.2f us  %6d bytes' % (
+        name, dumps_time / number * 1000000, loads_time / number * 1000000, len(data)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe)
+    wr.poll_handshake(timeout=1.0)
+    protocol = wr.protocol
+    samples = {
+        'one sample': Sample(1500000000.0, 'host-1', 0.5),
+        '100 samples': [Sample(1500000000.0 + i, 'host-%d' % (i % 8), i * 0.5)
+                        for i in range(100)]
+    }
+    for label, obj in sorted(samples.items()):
+        print(label)
+        bench('pickle.dumps', lambda o: pickle.dumps(o, protocol=protocol),
+              pickle.loads, obj, args.number)
+        wr.register_reducer(Sample, reduce_sample)
+        bench('PicklePipe reducer', wr._serializer.dumps, wr._serializer.loads, obj, args.number)
+        wr._dispatch_table.clear()
+        wr._serializer = wr._make_serializer(protocol)
+    rd.close()
+    wr.close()
+
+
+if __name__ == '__main__':
+    main()
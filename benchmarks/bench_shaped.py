@@ -0,0 +1,69 @@
+""" Measures round trips and throughput of pipes connected through a
+simulated link made with :func:`picklepipe.make_shaped_pipe_pair`.
+
+Usage: python benchmarks/bench_shaped.py [--latency S] [--bandwidth B] [--max-chunk N] """
+import argparse
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import picklepipe  # noqa: E402
+
+
+def bench_round_trips(shape, count):
+    a, b = picklepipe.make_shaped_pipe_pair(picklepipe.PicklePipe, shape)
+    start = timeit.default_timer()
+    for i in range(count):
+        a.send_object(i)
+        b.send_object(b.recv_object(timeout=10.0))
+        a.recv_object(timeout=10.0)
+    elapsed = timeit.default_timer() - start
+    a.close()
+    b.close()
+    return elapsed / count
+
+
+def bench_throughput(shape, total, size):
+    rd, wr = picklepipe.make_shaped_pipe_pair(picklepipe.PicklePipe, shape)
+    payload = b'x' * size
+    count = total // size
+
+    def send():
+        for _ in range(count):
+            wr.send_object(payload)
+    start = timeit.default_timer()
+    thread = threading.Thread(target=send)
+    thread.start()
+    for _ in range(count):
+        rd.recv_object(timeout=60.0)
+    thread.join()
+    elapsed = timeit.default_timer() - start
+    rd.close()
+    wr.close()
+    return count * size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.001)
+    parser.add_argument('--bandwidth', type=int, default=None)
+    parser.add_argument('--max-chunk', type=int, default=1460)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--round-trips', type=int, default=100)
+    parser.add_argument('--bytes', type=int, default=32 * 1024 * 1024)
+    args = parser.parse_args()
+
+    shape = picklepipe.LinkShape(latency=args.latency, bandwidth=args.bandwidth,
+                                 max_chunk=args.max_chunk, seed=args.seed)
+    print('%r' % shape)
+    print('round trip: %.3f ms' % (bench_round_trips(shape, args.round_trips) * 1000))
+    for size in (1024, 65536, 1024 * 1024):
+        print('throughput %7d byte objects: %.1f MB/s' % (
+            size, bench_throughput(shape, args.bytes, size) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+""" Measures how long ``import picklepipe`` takes in a fresh interpreter
+and how quickly pipes can be constructed and closed, which dominates
+the startup of short-lived worker processes.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--pipes N] """
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import picklepipe  # noqa: E402
+
+
+def bench_import(runs):
+    """ Returns the median number of seconds ``import picklepipe``
+    takes, less the time of starting an interpreter that doesn't. """
+    def median_run(code):
+        times = []
+        for _ in range(runs):
+            start = timeit.default_timer()
+            subprocess.check_call([sys.executable, '-c', code], cwd=_ROOT)
+            times.append(timeit.default_timer() - start)
+        return sorted(times)[len(times) // 2]
+    return median_run('import picklepipe') - median_run('import socket')
+
+
+def bench_construct(count, pipe_type):
+    """ Returns the number of seconds that constructing
+    and closing a pair of connected pipes takes. """
+    start = timeit.default_timer()
+    for _ in range(count):
+        rd, wr = picklepipe.make_pipe_pair(pipe_type)
+        rd.close()
+        wr.close()
+    return (timeit.default_timer() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=21)
+    parser.add_argument('--pipes', type=int, default=2000)
+    args = parser.parse_args()
+
+    print('import picklepipe: %.2f ms' % (bench_import(args.runs) * 1000))
+    for pipe_type in (picklepipe.PicklePipe, picklepipe.MarshalPipe, picklepipe.JSONPipe):
+        print('%s pair: %.1f us' % (pipe_type.__name__,
+                                    bench_construct(args.pipes, pipe_type) * 1000000))
+
+
+if __name__ == '__main__':
+    main()
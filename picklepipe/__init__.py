@@ -1,3 +1,6 @@
+import sys
+import importlib
+
 from .pipe import (BaseSerializingPipe,
                    PipeClosed,
                    PipeError,
@@ -5,10 +8,62 @@ from .pipe import (BaseSerializingPipe,
                    PipeSerializingError,
                    PipeDeserializingError,
                    PipeObjectTooLargeError,
+                   PipeSessionLost,
+                   CAPABILITY_TRACE,
                    make_pipe_pair)
-from .picklepipe import PicklePipe
-from .marshalpipe import MarshalPipe
-from .jsonpipe import JSONPipe
+from .envelope import Envelope
+from .tracing import FrameTrace
+
+# Pipe types and helpers are imported from their submodule the first
+# time they're used so that importing picklepipe doesn't import every
+# serializer. Python before 3.7 can't do this and imports them eagerly.
+_LAZY_IMPORTS = {
+    'PicklePipe': 'picklepipe',
+    'MarshalPipe': 'marshalpipe',
+    'JSONPipe': 'jsonpipe',
+    'BufferPool': 'bufferpool',
+    'ColumnarPipe': 'columnar',
+    'RecordBatch': 'columnar',
+    'PipeHub': 'hub',
+    'DROP_OLDEST': 'hub',
+    'DROP_NEWEST': 'hub',
+    'DISCONNECT': 'hub',
+    'LanePipe': 'lanes',
+    'PipeListener': 'listener',
+    'PipelinedPipe': 'pipeline',
+    'PipePool': 'pool',
+    'PayloadProfiler': 'profiler',
+    'ResumablePipe': 'resumable',
+    'LinkShape': 'shaping',
+    'make_shaped_socketpair': 'shaping',
+    'make_shaped_pipe_pair': 'shaping'
+}
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        module = _LAZY_IMPORTS.get(name)
+        if module is None:
+            raise AttributeError('module %r has no attribute %r' % (__name__, name))
+        value = getattr(importlib.import_module('.' + module, __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY_IMPORTS))
+else:  # Skip coverage.
+    from .picklepipe import PicklePipe
+    from .marshalpipe import MarshalPipe
+    from .jsonpipe import JSONPipe
+    from .bufferpool import BufferPool
+    from .columnar import ColumnarPipe, RecordBatch
+    from .hub import PipeHub, DROP_OLDEST, DROP_NEWEST, DISCONNECT
+    from .lanes import LanePipe
+    from .listener import PipeListener
+    from .pipeline import PipelinedPipe
+    from .pool import PipePool
+    from .profiler import PayloadProfiler
+    from .resumable import ResumablePipe
+    from .shaping import LinkShape, make_shaped_socketpair, make_shaped_pipe_pair
 
 __author__ = 'Seth Michael Larson'
 __email__ = 'sethmichaellarson@protonmail.com'
@@ -17,14 +72,34 @@ __version__ = 'dev'
 
 __all__ = [
     'BaseSerializingPipe',
+    'Envelope',
+    'FrameTrace',
     'PicklePipe',
     'MarshalPipe',
     'JSONPipe',
+    'BufferPool',
+    'ColumnarPipe',
+    'RecordBatch',
+    'PipeHub',
+    'DROP_OLDEST',
+    'DROP_NEWEST',
+    'DISCONNECT',
+    'LanePipe',
+    'PipeListener',
+    'PipelinedPipe',
+    'PipePool',
+    'PayloadProfiler',
+    'ResumablePipe',
     'PipeClosed',
     'PipeError',
     'PipeTimeout',
     'PipeSerializingError',
     'PipeDeserializingError',
     'PipeObjectTooLargeError',
-    'make_pipe_pair'
+    'PipeSessionLost',
+    'CAPABILITY_TRACE',
+    'make_pipe_pair',
+    'LinkShape',
+    'make_shaped_socketpair',
+    'make_shaped_pipe_pair'
 ]
@@ -0,0 +1,69 @@
+import collections
+
+__all__ = [
+    'BufferPool'
+]
+
+# Default smallest and largest size classes, 4KB and 16MB.
+DEFAULT_MIN_SIZE = 0x1000
+DEFAULT_MAX_SIZE = 0x1000000
+
+# Default number of buffers kept for each size class.
+DEFAULT_MAX_BUFFERS = 4
+
+
+class BufferPool(object):
+    """ Recycles receive buffers so that pipes receiving frames of
+    steady sizes don't allocate a new buffer for every frame. Buffers
+    are grouped into power of two size classes and only a few buffers
+    of each size class are kept. A pool may be shared by several
+    pipes, see :meth:`picklepipe.BaseSerializingPipe.set_buffer_pool`. """
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, max_size=DEFAULT_MAX_SIZE,
+                 max_buffers=DEFAULT_MAX_BUFFERS):
+        """
+        Creates a :class:`picklepipe.BufferPool` instance.
+
+        :param int min_size: Size of the smallest size class.
+        :param int max_size:
+            Size of the largest size class. Larger buffers aren't kept.
+        :param int max_buffers: Number of buffers kept for each size class.
+        """
+        if min_size <= 0 or max_size < min_size:
+            raise ValueError('min_size must be positive and no more than max_size.')
+        if max_buffers < 0:
+            raise ValueError('max_buffers cannot be negative.')
+        self._min_bits = (min_size - 1).bit_length()
+        self._max_bits = (max_size - 1).bit_length()
+        self._max_buffers = max_buffers
+        self._classes = [collections.deque() for _ in range(self._max_bits + 1)]
+
+    @property
+    def retained(self):
+        """ Number of bytes of the buffers that are kept. """
+        return sum(len(buffer) for buffers in self._classes for buffer in list(buffers))
+
+    def acquire(self, size):
+        """ Returns a buffer of at least a size, reusing a kept buffer if possible.
+
+        :param int size: Number of bytes needed.
+        :return: ``bytearray`` that may be longer than the size.
+        """
+        bits = max(self._min_bits, (size - 1).bit_length())
+        if bits > self._max_bits:
+            return bytearray(size)
+        try:
+            return self._classes[bits].pop()
+        except IndexError:
+            return bytearray(1 << bits)
+
+    def release(self, buffer):
+        """ Gives a buffer from :meth:`acquire` back to the pool.
+
+        :param bytearray buffer: Buffer to keep for reuse.
+        """
+        bits = (len(buffer) - 1).bit_length()
+        if len(buffer) != 1 << bits or not self._min_bits <= bits <= self._max_bits:
+            return
+        buffers = self._classes[bits]
+        if len(buffers) < self._max_buffers:
+            buffers.append(buffer)
@@ -0,0 +1,52 @@
+import heapq
+import weakref
+import threading
+import itertools
+
+from .timeout import monotonic
+
+__all__ = [
+    'schedule_flush'
+]
+
+
+class _Flusher(object):
+    """ Background thread which flushes the coalesced writes of
+    pipes once their linger time is up. A single thread serves
+    every pipe in the process and only holds weak references. """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._thread = None
+
+    def schedule(self, pipe, deadline):
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, next(self._counter), weakref.ref(pipe)))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='picklepipe-flusher')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                _, _, ref = heapq.heappop(self._heap)
+            pipe = ref()
+            if pipe is not None:
+                pipe._flush_due()
+            del pipe
+
+
+_flusher = _Flusher()
+
+
+def schedule_flush(pipe, delay):
+    """ Calls ``pipe._flush_due()`` from the flusher thread after a delay. """
+    _flusher.schedule(pipe, monotonic() + delay)
@@ -0,0 +1,309 @@
+import sys
+import array
+import struct
+
+from .pipe import (FRAME_BATCH,
+                   PipeTimeout,
+                   PipeSerializingError,
+                   PipeDeserializingError)
+from .timeout import Timeout
+
+__all__ = [
+    'ColumnarPipe',
+    'RecordBatch'
+]
+
+# Default number of records that are collected into one batch.
+DEFAULT_BATCH_SIZE = 1024
+
+# Batch header is the number of records and the number of columns,
+# followed by the serialized keys and then each column.
+_BATCH_HEADER = struct.Struct('>IH')
+_LENGTH = struct.Struct('>I')
+# Column header is the kind of column and the length of its data.
+_COLUMN_HEADER = struct.Struct('>cI')
+
+# Columns where every value has the same numeric type are packed into an
+# array with that typecode, other columns are serialized by the pipe.
+_NUMERIC_KINDS = [(b'q', int), (b'd', float)]
+_OBJECT_KIND = b'o'
+try:
+    array.array('q')
+except ValueError:  # Skip coverage.
+    _NUMERIC_KINDS = [(b'd', float)]
+
+# Numeric columns are always little-endian on the wire.
+_SWAP_BYTES = sys.byteorder == 'big'
+
+
+def _encode_column(values, dumps):
+    for kind, value_type in _NUMERIC_KINDS:
+        if all(type(value) is value_type for value in values):
+            try:
+                column = array.array(kind.decode('ascii'), values)
+            except OverflowError:
+                break
+            if _SWAP_BYTES:  # Skip coverage.
+                column.byteswap()
+            return kind, column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+    return _OBJECT_KIND, dumps(values)
+
+
+def _decode_column(kind, data, count, loads):
+    if kind == _OBJECT_KIND:
+        values = loads(data)
+        if not isinstance(values, (list, tuple)):
+            raise PipeDeserializingError(ValueError('Column is not a list.'))
+    else:
+        try:
+            values = array.array(kind.decode('ascii'))
+        except ValueError as e:
+            raise PipeDeserializingError(e)
+        if len(data) != count * values.itemsize:
+            raise PipeDeserializingError(ValueError('Column has the wrong length.'))
+        if hasattr(values, 'frombytes'):
+            values.frombytes(data)
+        else:  # Skip coverage.
+            values.fromstring(data)
+        if _SWAP_BYTES:  # Skip coverage.
+            values.byteswap()
+    if len(values) != count:
+        raise PipeDeserializingError(ValueError('Column has the wrong length.'))
+    return values
+
+
+def _encode_batch(records, keys, dumps):
+    parts = [_BATCH_HEADER.pack(len(records), len(keys))]
+    keys_data = dumps(list(keys))
+    parts.append(_LENGTH.pack(len(keys_data)))
+    parts.append(keys_data)
+    for key in keys:
+        try:
+            values = [record[key] for record in records]
+        except (KeyError, TypeError) as e:
+            raise PipeSerializingError(e)
+        kind, data = _encode_column(values, dumps)
+        parts.append(_COLUMN_HEADER.pack(kind, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def _decode_batch(data, loads):
+    try:
+        count, num_columns = _BATCH_HEADER.unpack_from(data, 0)
+        offset = _BATCH_HEADER.size
+        keys_len, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        keys = loads(data[offset:offset + keys_len])
+        offset += keys_len
+        columns = []
+        for _ in range(num_columns):
+            kind, column_len = _COLUMN_HEADER.unpack_from(data, offset)
+            offset += _COLUMN_HEADER.size
+            columns.append((kind, data[offset:offset + column_len]))
+            offset += column_len
+    except struct.error as e:
+        raise PipeDeserializingError(e)
+    if (offset != len(data) or not isinstance(keys, (list, tuple)) or
+            len(keys) != num_columns):
+        raise PipeDeserializingError(ValueError('Batch has the wrong length.'))
+    return RecordBatch(keys, columns, count, loads)
+
+
+class RecordBatch(object):
+    """ A batch of records received from a :class:`picklepipe.ColumnarPipe`.
+    Columns are only decoded when they're first accessed and records are
+    only rebuilt into dicts when they're indexed or iterated over. """
+    def __init__(self, keys, columns, count, loads, start=0):
+        self._keys = keys
+        self._columns = columns
+        self._count = count
+        self._loads = loads
+        self._start = start
+
+    @property
+    def keys(self):
+        """ Keys that every record in the batch has. """
+        return list(self._keys)
+
+    def column(self, key):
+        """ Returns every value of one key without rebuilding any records.
+        Numeric columns are returned as an ``array.array``.
+
+        :param key: Key of the column.
+        :return: Sequence of the values in the column.
+        :raises: :class:`picklepipe.PipeDeserializingError` if the column can't be deserialized.
+        """
+        values = self._decoded(self._keys.index(key))
+        return values[self._start:] if self._start else values
+
+    def __len__(self):
+        return self._count - self._start
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('RecordBatch index out of range.')
+        index += self._start
+        return dict((key, self._decoded(i)[index]) for i, key in enumerate(self._keys))
+
+    def __iter__(self):
+        columns = [self._decoded(i) for i in range(len(self._keys))]
+        for index in range(self._start, self._count):
+            yield dict((key, column[index]) for key, column in zip(self._keys, columns))
+
+    def __repr__(self):
+        return '<RecordBatch keys=%r records=%d>' % (self._keys, len(self))
+
+    def _decoded(self, i):
+        kind, data = self._columns[i]
+        if kind is not None:
+            self._columns[i] = (None, _decode_column(kind, data, self._count, self._loads))
+        return self._columns[i][1]
+
+    def _tail(self, start):
+        """ Returns a batch of the records starting at an index. """
+        return RecordBatch(self._keys, self._columns, self._count,
+                           self._loads, self._start + start)
+
+
+class ColumnarPipe(object):
+    """ Wraps a :class:`picklepipe.BaseSerializingPipe` and sends
+    records, dicts that share the same keys, in columnar batches.
+    Each batch is a single frame with the keys sent once and a column
+    per key. Columns of only ``int`` or only ``float`` values are
+    packed into arrays and other columns are serialized by the pipe.
+
+    Both ends of the pipe must use a :class:`picklepipe.ColumnarPipe`
+    to receive batches, objects sent on the wrapped pipe are
+    received as single records. """
+    def __init__(self, pipe, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Creates a :class:`picklepipe.ColumnarPipe` wrapping a pipe.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` to wrap.
+        :param int batch_size: Number of records that are sent as a batch.
+        """
+        if batch_size <= 0:
+            raise ValueError('batch_size must be positive.')
+        self._pipe = pipe
+        self._batch_size = batch_size
+        self._records = []
+        self._keys = None
+        self._batch = None
+        self._index = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def closed(self):
+        """ Attribute is True if the wrapped pipe is closed. """
+        return self._pipe.closed
+
+    @property
+    def pending(self):
+        """ Number of records collected that haven't been sent yet. """
+        return len(self._records)
+
+    def close(self):
+        """ Closes the wrapped pipe without sending collected records. """
+        self._pipe.close()
+
+    def fileno(self):
+        """ Returns the file descriptor of the wrapped pipe. """
+        return self._pipe.fileno()
+
+    def send_record(self, record):
+        """ Collects a record into the current batch. The batch is sent
+        once it holds ``batch_size`` records or before a record with
+        different keys is collected. Call :meth:`flush` to send the
+        current batch sooner.
+
+        :param dict record: Record to send to the peer.
+        :raises: :class:`picklepipe.PipeSerializingError` if a batch can't be serialized.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        keys = self._keys
+        if keys is None or len(record) != len(keys) or any(key not in record for key in keys):
+            self.flush()
+            self._keys = list(record)
+        self._records.append(record)
+        if len(self._records) >= self._batch_size:
+            self.flush()
+
+    def send_batch(self, records):
+        """ Sends records that all have the same keys as a single batch.
+
+        :param list records: Records to send to the peer.
+        :raises: :class:`picklepipe.PipeSerializingError` if the records
+            don't have the same keys or can't be serialized.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        records = list(records)
+        if not records:
+            return
+        keys = list(records[0])
+        if any(len(record) != len(keys) for record in records):
+            raise PipeSerializingError(ValueError('Records don\'t have the same keys.'))
+        self._pipe._poll_protocol(0.0)
+        self._pipe._send_frame(FRAME_BATCH, _encode_batch(records, keys, self._pipe._dumps))
+
+    def flush(self):
+        """ Sends the current batch if it has any records.
+
+        :raises: :class:`picklepipe.PipeSerializingError` if the batch can't be serialized.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        records, self._records = self._records, []
+        self.send_batch(records)
+
+    def recv_batch(self, timeout=None):
+        """ Receives the next batch of records. If some records of a batch
+        were already received with :meth:`recv_record` the rest of that
+        batch is returned instead.
+
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: :class:`picklepipe.RecordBatch` or a list with a single
+            object that was sent on the wrapped pipe.
+        :raises: :class:`picklepipe.PipeTimeout` if no batch arrived in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        if self._batch is not None:
+            batch = self._batch._tail(self._index)
+            self._batch = None
+            return batch
+        with Timeout(timeout) as t:
+            if not self._pipe.poll_handshake(t.remaining):
+                raise PipeTimeout()
+            frame_type, data = self._pipe._recv_frame(t)
+        if frame_type == FRAME_BATCH:
+            return _decode_batch(data, self._pipe._load_payload)
+        return [self._pipe._load_frame(frame_type, data)]
+
+    def recv_record(self, timeout=None):
+        """ Receives the next record, rebuilding it from its batch.
+
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: Record received from the peer.
+        :raises: :class:`picklepipe.PipeTimeout` if no record arrived in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        while self._batch is None:
+            batch = self.recv_batch(timeout)
+            if len(batch):
+                self._batch = batch
+                self._index = 0
+        try:
+            record = self._batch[self._index]
+        except PipeDeserializingError:
+            self._batch = None
+            raise
+        self._index += 1
+        if self._index == len(self._batch):
+            self._batch = None
+        return record
@@ -0,0 +1,60 @@
+import struct
+
+__all__ = [
+    'Envelope'
+]
+
+# Envelope payload starts with the length of the serialized header.
+_ENVELOPE_HEADER = struct.Struct('>I')
+
+
+def _pack_envelope(header_data, payload):
+    return _ENVELOPE_HEADER.pack(len(header_data)) + header_data + payload
+
+
+def _unpack_envelope(data):
+    header_len = _ENVELOPE_HEADER.unpack(data[:_ENVELOPE_HEADER.size])[0]
+    header_end = _ENVELOPE_HEADER.size + header_len
+    if header_end > len(data):
+        raise ValueError('Envelope header is longer than the frame.')
+    return data[_ENVELOPE_HEADER.size:header_end], data[header_end:]
+
+
+class Envelope(object):
+    """ A small routing header next to an opaque serialized payload.
+    Routers can receive envelopes with :meth:`picklepipe.BaseSerializingPipe.recv_raw`,
+    look at the header and forward the payload bytes untouched with
+    :meth:`picklepipe.BaseSerializingPipe.send_raw`. Only the final
+    consumer pays for deserializing the payload.
+
+    The payload is forwarded as it was serialized by the original sender
+    so every pipe along the route must be able to load it, for example
+    by using the same pipe type and protocol. """
+    def __init__(self, header, payload):
+        """
+        Creates an :class:`picklepipe.Envelope` to send with
+        :meth:`picklepipe.BaseSerializingPipe.send_raw`.
+
+        :param header: Routing header, serialized by the sending pipe.
+        :param bytes payload: Payload that is already serialized.
+        """
+        self.header = header
+        self.payload = payload
+        self._header_data = None
+        self._loads = None
+        self._raw = False
+
+    def load(self):
+        """ Deserializes the payload with the pipe the envelope was received on.
+
+        :return: The object that the payload was serialized from.
+        :raises: :class:`picklepipe.PipeDeserializingError` if the payload can't be deserialized.
+        """
+        if self._loads is None:
+            raise ValueError('Only received envelopes can be loaded.')
+        if self._raw:
+            return self.payload
+        return self._loads(self.payload)
+
+    def __repr__(self):
+        return '<Envelope header=%r payload=%d bytes>' % (self.header, len(self.payload))
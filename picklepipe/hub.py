@@ -0,0 +1,225 @@
+import collections
+
+from .pipe import (PipeClosed,
+                   _RAW_TYPES,
+                   _pack_frame)
+from .selector import selectors
+from .timeout import Timeout
+
+__all__ = [
+    'PipeHub',
+    'DROP_OLDEST',
+    'DROP_NEWEST',
+    'DISCONNECT'
+]
+
+# Policies for subscribers whose queue is full.
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DISCONNECT = 'disconnect'
+
+# Default number of frames queued for a single subscriber.
+DEFAULT_MAX_QUEUE = 1024
+
+
+class _Subscriber(object):
+    __slots__ = ['pipe', 'topics', 'queue', 'offset']
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.topics = set()
+        self.queue = collections.deque()
+        self.offset = 0
+
+
+class PipeHub(object):
+    """ Publishes objects to subscriber pipes by topic. Each published
+    object is serialized once for every group of subscribers that share
+    a pipe type and protocol rather than once per subscriber.
+
+    Every subscriber has a bounded queue of outgoing frames that is written
+    without blocking so a slow subscriber doesn't stall the others. When a
+    subscriber's queue is full the hub's policy decides to drop the oldest
+    queued object, drop the newly published object or disconnect the subscriber.
+    A :class:`picklepipe.PipeHub` is not thread-safe. """
+    def __init__(self, max_queue=DEFAULT_MAX_QUEUE, policy=DROP_OLDEST):
+        """
+        Creates a :class:`picklepipe.PipeHub` instance.
+
+        :param int max_queue: Maximum number of objects queued per subscriber.
+        :param str policy:
+            One of ``DROP_OLDEST``, ``DROP_NEWEST`` or ``DISCONNECT``
+            for subscribers whose queue is full.
+        """
+        if max_queue <= 0:
+            raise ValueError('max_queue must be positive.')
+        if policy not in (DROP_OLDEST, DROP_NEWEST, DISCONNECT):
+            raise ValueError('policy must be DROP_OLDEST, DROP_NEWEST or DISCONNECT.')
+        self._max_queue = max_queue
+        self._policy = policy
+        self._subscribers = {}  # pipe -> _Subscriber
+        self._topics = {}  # topic -> set of pipes
+        self._dropped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def subscribers(self):
+        """ List of the subscribed pipes. """
+        return list(self._subscribers)
+
+    @property
+    def dropped(self):
+        """ Number of objects that were dropped for slow subscribers. """
+        return self._dropped
+
+    def pending(self, pipe):
+        """ Number of objects queued for a subscriber. """
+        return len(self._subscribers[pipe].queue)
+
+    def subscribe(self, pipe, *topics):
+        """ Subscribes a pipe to one or more topics.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` of the subscriber.
+        :param topics: Topics to subscribe the pipe to.
+        """
+        subscriber = self._subscribers.get(pipe)
+        if subscriber is None:
+            subscriber = self._subscribers[pipe] = _Subscriber(pipe)
+        for topic in topics:
+            subscriber.topics.add(topic)
+            self._topics.setdefault(topic, set()).add(pipe)
+
+    def unsubscribe(self, pipe, *topics):
+        """ Unsubscribes a pipe from topics or from every topic if none
+        are given. The pipe is removed from the hub once it has no topics
+        left, objects that are still queued for it are discarded.
+
+        :param pipe: Pipe of the subscriber.
+        :param topics: Topics to unsubscribe the pipe from.
+        """
+        subscriber = self._subscribers.get(pipe)
+        if subscriber is None:
+            return
+        for topic in topics or list(subscriber.topics):
+            subscriber.topics.discard(topic)
+            pipes = self._topics.get(topic)
+            if pipes is not None:
+                pipes.discard(pipe)
+                if not pipes:
+                    del self._topics[topic]
+        if not subscriber.topics:
+            del self._subscribers[pipe]
+
+    def publish(self, topic, obj):
+        """ Queues an object for every subscriber of a topic and
+        writes as much as possible to the subscribers without blocking.
+
+        :param topic: Topic to publish the object on.
+        :param obj: Object to publish.
+        :return: Number of subscribers the object was queued for.
+        :raises: :class:`picklepipe.PipeSerializingError` if the object can't be serialized.
+        """
+        frames = {}
+        queued = 0
+        raw = isinstance(obj, _RAW_TYPES)
+        for pipe in list(self._topics.get(topic, ())):
+            # Subscribers with the same serializer and reducers share one serialized
+            # frame and raw bytes are the same frame for every subscriber.
+            key = None if raw else pipe._serializer_key()
+            frame = frames.get(key)
+            if frame is None:
+                frame = frames[key] = _pack_frame(*pipe._encode_object(obj))
+            if self._enqueue(self._subscribers[pipe], frame):
+                queued += 1
+        self.pump()
+        return queued
+
+    def pump(self, timeout=0.0):
+        """ Writes queued objects to subscribers that are ready for them.
+
+        :param float timeout:
+            Number of seconds to wait for subscribers to become writable.
+        :return: Number of subscribers that still have queued objects.
+        """
+        with Timeout(timeout) as t:
+            while True:
+                waiting = [subscriber for subscriber in list(self._subscribers.values())
+                           if not self._write(subscriber)]
+                if not waiting or t.timed_out:
+                    return len(waiting)
+                selector = selectors.DefaultSelector()
+                try:
+                    for subscriber in waiting:
+                        selector.register(subscriber.pipe, selectors.EVENT_WRITE)
+                    selector.select(t.remaining)
+                finally:
+                    selector.close()
+
+    def flush(self, timeout=None):
+        """ Waits until every queued object has been written.
+
+        :param float timeout: Number of seconds to wait.
+        :return: True if every queued object has been written.
+        """
+        return self.pump(timeout) == 0
+
+    def close(self):
+        """ Closes every subscribed pipe and removes it from the hub. """
+        for pipe in list(self._subscribers):
+            pipe.close()
+        self._subscribers = {}
+        self._topics = {}
+
+    def _enqueue(self, subscriber, frame):
+        queue = subscriber.queue
+        if len(queue) < self._max_queue:
+            queue.append(frame)
+            return True
+        if self._policy == DISCONNECT:
+            self._disconnect(subscriber)
+            return False
+        self._dropped += 1
+        if self._policy == DROP_NEWEST:
+            return False
+
+        # A frame that is partially written can't be dropped
+        # without corrupting the stream so drop the one after it.
+        if subscriber.offset:
+            if len(queue) == 1:
+                return False
+            del queue[1]
+        else:
+            queue.popleft()
+        queue.append(frame)
+        return True
+
+    def _write(self, subscriber):
+        """ Writes a subscriber's queue without blocking. Returns
+        True if there's nothing left to write for the subscriber. """
+        pipe = subscriber.pipe
+        queue = subscriber.queue
+        try:
+            if not pipe.handshake_complete:
+                pipe.poll_handshake()
+            while queue:
+                frame = queue[0]
+                sent = pipe._write_nonblocking(memoryview(frame)[subscriber.offset:])
+                if not sent:
+                    return False
+                subscriber.offset += sent
+                if subscriber.offset == len(frame):
+                    queue.popleft()
+                    subscriber.offset = 0
+        except PipeClosed:
+            self._disconnect(subscriber)
+        return True
+
+    def _disconnect(self, subscriber):
+        subscriber.pipe.close()
+        subscriber.queue.clear()
+        self.unsubscribe(subscriber.pipe)
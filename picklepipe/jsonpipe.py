@@ -1,3 +1,4 @@
+import codecs
 import json
 from .pipe import BaseSerializingPipe
 
@@ -8,7 +9,8 @@ __all__ = [
 
 class _JSONSerializer(object):
     def loads(self, data):
-        return json.loads(data.decode('utf-8'))
+        # codecs.decode() also accepts memoryviews of pooled buffers.
+        return json.loads(codecs.decode(data, 'utf-8'))
 
     def dumps(self, obj):
         return json.dumps(obj).encode('utf-8')
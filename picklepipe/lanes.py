@@ -0,0 +1,304 @@
+import struct
+import threading
+import collections
+
+from .pipe import (FRAME_OBJECT,
+                   FRAME_LANE,
+                   PipeClosed,
+                   PipeError,
+                   PipeTimeout,
+                   PipeDeserializingError,
+                   PipeObjectTooLargeError)
+from .timeout import Timeout
+
+__all__ = [
+    'LanePipe'
+]
+
+# Default size of a chunk is 64KB.
+DEFAULT_CHUNK_SIZE = 0x10000
+
+# Lane chunk header is the lane number and flags.
+_LANE_HEADER = struct.Struct('>BB')
+_LANE_END = 0x1
+
+
+class _LaneMessage(object):
+    __slots__ = ['data', 'offset', 'sent', 'error']
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+        self.sent = False
+        self.error = None
+
+
+class LanePipe(object):
+    """ Multiplexes several logical lanes over a single
+    :class:`picklepipe.BaseSerializingPipe`. Serialized objects are
+    split into chunks so that an object on a high priority lane can
+    be sent in between the chunks of a large object on another lane.
+
+    Lanes are scheduled by strict priority where lane ``0`` is
+    the highest priority or by weighted round-robin if weights
+    are given. Each lane has its own receive queue.
+    Both ends of the pipe must use a :class:`picklepipe.LanePipe`
+    and the wrapped pipe shouldn't be used directly afterwards. """
+    def __init__(self, pipe, lanes=2, weights=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Creates a :class:`picklepipe.LanePipe` wrapping a pipe.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` to wrap.
+        :param int lanes: Number of lanes, at most 256.
+        :param list weights:
+            Weight of each lane for weighted round-robin scheduling.
+            If not given lanes are scheduled by strict priority.
+        :param int chunk_size: Maximum number of bytes sent at once for one lane.
+        """
+        if not 0 < lanes <= 256:
+            raise ValueError('lanes must be between 1 and 256.')
+        if weights is not None:
+            weights = list(weights)
+            if len(weights) != lanes or any(w <= 0 for w in weights):
+                raise ValueError('weights must be a positive weight for every lane.')
+        if chunk_size <= 0:
+            raise ValueError('chunk_size must be positive.')
+
+        self._pipe = pipe
+        self._lanes = lanes
+        self._weights = weights
+        self._current_weights = [0] * lanes
+        self._chunk_size = chunk_size
+
+        self._send_cond = threading.Condition()
+        self._send_queues = [collections.deque() for _ in range(lanes)]
+        self._draining = False
+
+        self._recv_cond = threading.Condition()
+        self._recv_queues = [collections.deque() for _ in range(lanes)]
+        self._partial = [[] for _ in range(lanes)]
+        self._partial_size = [0] * lanes
+        self._reading = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def lanes(self):
+        """ Number of lanes on the pipe. """
+        return self._lanes
+
+    @property
+    def closed(self):
+        """ Attribute is True if the wrapped pipe is closed. """
+        return self._pipe.closed
+
+    def close(self):
+        """ Closes the wrapped pipe. """
+        self._pipe.close()
+
+    def fileno(self):
+        """ Returns the file descriptor of the wrapped pipe. """
+        return self._pipe.fileno()
+
+    def send_object(self, obj, lane=0):
+        """ Serializes and sends an object to the peer on a lane.
+        Returns once the whole object has been written. Objects on
+        other lanes may be written while this object is being sent.
+
+        :param obj: Object to send to the peer.
+        :param int lane: Lane to send the object on.
+        :raises: :class:`picklepipe.PipeTimeout` if the peer stops reading. If part
+            of the object was already written the pipe is closed.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        self._check_lane(lane)
+        if self._pipe.closed:
+            raise PipeClosed()
+
+        # Only receiving reads from the socket, objects sent before the
+        # handshake completes use the pipe's baseline protocol.
+        data = self._pipe._dumps(obj)
+        message = _LaneMessage(data)
+
+        with self._send_cond:
+            self._send_queues[lane].append(message)
+            while not message.sent:
+                if self._pipe.closed:
+                    raise PipeClosed()
+                if self._draining:
+                    self._send_cond.wait()
+                    continue
+                self._draining = True
+                try:
+                    self._drain()
+                finally:
+                    self._draining = False
+                    self._send_cond.notify_all()
+        if message.error is not None:
+            raise message.error
+
+    def recv_object(self, lane=0, timeout=None):
+        """ Receives an object from the peer on a lane. Objects that
+        arrive on other lanes are queued for their lane.
+
+        :param int lane: Lane to receive an object from.
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: Object received on the lane.
+        :raises: :class:`picklepipe.PipeTimeout` if no object arrived in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        self._check_lane(lane)
+        queue = self._recv_queues[lane]
+        with Timeout(timeout) as t:
+            with self._recv_cond:
+                while not queue:
+                    if self._reading:
+                        self._recv_cond.wait(t.remaining)
+                        if not queue and t.timed_out:
+                            raise PipeTimeout()
+                        continue
+                    self._reading = True
+                    self._recv_cond.release()
+                    try:
+                        if not self._pipe.poll_handshake(t.remaining):
+                            raise PipeTimeout()
+                        frame_type, data = self._pipe._recv_frame(
+                            t, prefix_size=_LANE_HEADER.size)
+                    except PipeObjectTooLargeError as e:
+                        frame_type, data = None, e
+                    finally:
+                        self._recv_cond.acquire()
+                        self._reading = False
+                        self._recv_cond.notify_all()
+                    if frame_type is None:
+                        self._deliver_too_large(data)
+                    else:
+                        self._deliver(frame_type, data)
+                item = queue.popleft()
+        if isinstance(item, Exception):
+            raise item
+        return self._pipe._load_frame(FRAME_OBJECT, item)
+
+    def _check_lane(self, lane):
+        if not 0 <= lane < self._lanes:
+            raise ValueError('lane must be between 0 and %d.' % (self._lanes - 1))
+
+    def _next_lane(self):
+        """ Picks the lane to send the next chunk from. """
+        if self._weights is None:
+            for lane, queue in enumerate(self._send_queues):
+                if queue:
+                    return lane
+            return None
+
+        # Smooth weighted round-robin between the lanes with queued objects.
+        best = None
+        total = 0
+        for lane, queue in enumerate(self._send_queues):
+            if not queue:
+                continue
+            self._current_weights[lane] += self._weights[lane]
+            total += self._weights[lane]
+            if best is None or self._current_weights[lane] > self._current_weights[best]:
+                best = lane
+        if best is not None:
+            self._current_weights[best] -= total
+        return best
+
+    def _drain(self):
+        """ Writes chunks until every queue is empty. Must be called while
+        holding the send condition, which is released during writes so
+        other threads can queue objects with a higher priority. """
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            queue = self._send_queues[lane]
+            message = queue[0]
+            chunk = message.data[message.offset:message.offset + self._chunk_size]
+            last = message.offset + len(chunk) >= len(message.data)
+
+            self._send_cond.release()
+            try:
+                header = _LANE_HEADER.pack(lane, _LANE_END if last else 0)
+                self._pipe._send_frame(FRAME_LANE, header + chunk)
+            except PipeError as e:
+                self._send_cond.acquire()
+                self._fail(queue, message, e)
+                continue
+            except BaseException:
+                self._send_cond.acquire()
+                raise
+            self._send_cond.acquire()
+
+            # The offset only moves once the chunk has been written.
+            message.offset += len(chunk)
+            if last:
+                queue.popleft()
+                message.sent = True
+                self._send_cond.notify_all()
+
+    def _fail(self, queue, message, error):
+        """ Removes a message whose chunk couldn't be written and fails its
+        sender. If the peer already received some of the message's chunks
+        the rest can't be skipped without corrupting the lane so the pipe
+        is closed. Must be called while holding the send condition. """
+        queue.popleft()
+        message.error = error
+        message.sent = True
+        if message.offset:
+            self._pipe.close()
+        self._send_cond.notify_all()
+
+    def _deliver(self, frame_type, data):
+        """ Adds a received frame to its lane. Must be called
+        while holding the receive condition. """
+        if frame_type == FRAME_OBJECT:
+            self._recv_queues[0].append(data)
+            return
+        if frame_type != FRAME_LANE or len(data) < _LANE_HEADER.size:
+            self._recv_queues[0].append(
+                PipeDeserializingError(ValueError('Unexpected frame for a lane.')))
+            return
+        lane, flags = _LANE_HEADER.unpack(data[:_LANE_HEADER.size])
+        if lane >= self._lanes:
+            self._recv_queues[0].append(
+                PipeDeserializingError(ValueError('Unknown lane %d.' % lane)))
+            return
+
+        # Chunks of objects larger than max_size are voided rather than kept.
+        chunk = data[_LANE_HEADER.size:]
+        self._partial_size[lane] += len(chunk)
+        if self._partial_size[lane] <= self._pipe.max_size:
+            self._partial[lane].append(chunk)
+        else:
+            self._partial[lane] = []
+
+        if flags & _LANE_END:
+            if self._partial_size[lane] > self._pipe.max_size:
+                self._recv_queues[lane].append(PipeObjectTooLargeError())
+            else:
+                self._recv_queues[lane].append(b''.join(self._partial[lane]))
+            self._partial[lane] = []
+            self._partial_size[lane] = 0
+
+    def _deliver_too_large(self, error):
+        """ Voids the object on the lane of a chunk that was larger
+        than max_size. Must be called while holding the receive condition. """
+        if error.frame_type != FRAME_LANE or len(error.prefix) != _LANE_HEADER.size:
+            self._recv_queues[0].append(error)
+            return
+        lane, flags = _LANE_HEADER.unpack(error.prefix)
+        if lane >= self._lanes:
+            self._recv_queues[0].append(
+                PipeDeserializingError(ValueError('Unknown lane %d.' % lane)))
+            return
+        self._partial[lane] = []
+        self._partial_size[lane] = self._pipe.max_size + 1
+        if flags & _LANE_END:
+            self._recv_queues[lane].append(PipeObjectTooLargeError())
+            self._partial_size[lane] = 0
@@ -0,0 +1,119 @@
+import errno
+import socket
+
+from .pipe import (PipeClosed,
+                   PipeTimeout)
+from .selector import selectors, SelectorError
+from .socketpair import _ASYNC_BLOCKING_ERRNOS
+from .timeout import Timeout
+
+__all__ = [
+    'PipeListener'
+]
+
+_RETRY_ERRNOS = _ASYNC_BLOCKING_ERRNOS | {errno.ECONNABORTED}
+
+
+class PipeListener(object):
+    """ Listens on an address for incoming connections and wraps
+    each accepted socket in a :class:`picklepipe.BaseSerializingPipe`. """
+    def __init__(self, pipe_type, address=('127.0.0.1', 0), backlog=128, **kwargs):
+        """
+        Creates a :class:`picklepipe.PipeListener` bound to an address.
+
+        :param type pipe_type: Type of pipe to wrap accepted sockets in.
+        :param tuple address: Address to bind the listening socket to.
+        :param int backlog: Maximum number of queued connections.
+        :param kwargs: Key-word arguments to pass to the pipes init.
+        """
+        self._pipe_type = pipe_type
+        self._kwargs = kwargs
+
+        family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind(address)
+            self._sock.listen(backlog)
+            self._sock.setblocking(False)
+        except Exception:
+            self._sock.close()
+            raise
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __iter__(self):
+        """ Accept loop which yields pipes until the listener is closed. """
+        while True:
+            try:
+                yield self.accept()
+            except PipeClosed:
+                return
+
+    @property
+    def address(self):
+        """ Address that the listener is bound to. """
+        return self._sock.getsockname()
+
+    @property
+    def closed(self):
+        """ Attribute is True if the listener is closed. """
+        return self._sock is None
+
+    def fileno(self):
+        """ Returns the file descriptor of the listening socket. """
+        return self._sock.fileno()
+
+    def accept(self, timeout=None):
+        """ Accepts a single connection and returns it wrapped in a pipe.
+        The pipe is returned without waiting for the peer's handshake,
+        objects can be sent right away and the handshake completes
+        on the first receive or with :meth:`poll_handshake`.
+
+        :param float timeout: Number of seconds to wait for a connection.
+        :return: Pipe instance wrapping the accepted connection.
+        :raises: :class:`picklepipe.PipeTimeout` if no connection arrives in time.
+        :raises: :class:`picklepipe.PipeClosed` if the listener is closed.
+        """
+        with Timeout(timeout) as t:
+            while True:
+                listening_sock, selector = self._sock, self._selector
+                if listening_sock is None:
+                    raise PipeClosed()
+                try:
+                    if not selector.select(t.remaining):
+                        raise PipeTimeout()
+                    sock, _ = listening_sock.accept()
+                    break
+                except (OSError, socket.error, ValueError, SelectorError) as e:
+                    # The listener may have been closed from another thread.
+                    if self.closed:
+                        raise PipeClosed()
+                    # Another thread accepted the connection first or the
+                    # connection was aborted before it could be accepted.
+                    if getattr(e, 'errno', None) not in _RETRY_ERRNOS:
+                        raise
+                    if t.timed_out:
+                        raise PipeTimeout()
+        return self._pipe_type(sock, **self._kwargs)
+
+    def close(self):
+        """ Closes the listening socket. Pipes which have already
+        been accepted are not affected. """
+        if self._sock is None:
+            return
+        try:
+            self._selector.unregister(self._sock)
+            self._selector.close()
+            self._sock.close()
+        except Exception:  # Skip coverage.
+            pass
+        self._sock = None
+        self._selector = None
@@ -1,9 +1,6 @@
-import socket
-import struct
 import marshal
 
-from .pipe import (BaseSerializingPipe,
-                   PipeClosed)
+from .pipe import BaseSerializingPipe
 
 __all__ = [
     'MarshalPipe'
@@ -27,6 +24,11 @@ class MarshalPipe(BaseSerializingPipe):
 
     See the `Python docs on the marshal module <https://docs.python.org/3/library/marshal.html>`_
     for more information. """
+    highest_protocol = marshal.version
+
+    # Version 2 is the highest version that every supported Python can load.
+    baseline_protocol = 2
+
     def __init__(self, sock, protocol=None, max_size=None):
         """
         Creates a :class:`picklepipe.MarshalPipe` instance wrapping
@@ -35,50 +37,7 @@ class MarshalPipe(BaseSerializingPipe):
         :param sock: Socket to wrap.
         :param protocol: Marshal protocol to favor.
         """
-        super(MarshalPipe, self).__init__(sock, None, max_size=max_size)
-        self._protocol = protocol
-        self._protocol_sent = False
-        self._protocol_recv = False
-
-        self._send_protocol()
-
-    @property
-    def protocol(self):
-        """ Highest protocol available between a peer
-        and the current pipe owner. """
-        self._recv_protocol()
-        return self._protocol
-
-    def send_object(self, obj):
-        self._recv_protocol()
-        super(MarshalPipe, self).send_object(obj)
-
-    def recv_object(self, timeout=None):
-        self._recv_protocol()
-        return super(MarshalPipe, self).recv_object(timeout)
-
-    def fileno(self):
-        self._recv_protocol()
-        return super(MarshalPipe, self).fileno()
-
-    def _send_protocol(self):
-        if not self._protocol_sent:
-            self._sock.sendall(struct.pack('>B', self._protocol or marshal.version))
-            self._protocol_sent = True
+        super(MarshalPipe, self).__init__(sock, None, max_size=max_size, protocol=protocol)
 
-    def _recv_protocol(self):
-        """ Resolves what the highest protocol number for
-        pickling that is allowed by the peer. """
-        if not self._protocol_recv:
-            try:
-                data = self._read_bytes(1, timeout=1.0)
-                if len(data) == 0:
-                    self.close()
-                    raise PipeClosed()
-                peer_protocol = struct.unpack('>B', data)[0]
-                self._protocol = min(self._protocol or marshal.version, peer_protocol)
-                self._protocol_recv = True
-                self._serializer = _MarshalSerializer(self._protocol)
-            except (OSError, socket.error):
-                self.close()
-                raise PipeClosed()
+    def _make_serializer(self, protocol):
+        return _MarshalSerializer(protocol)
@@ -1,27 +1,93 @@
-import socket
-import struct
+import io
+import sys
+import threading
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
+try:
+    import copyreg
+except ImportError:  # Skip coverage.
+    import copy_reg as copyreg
 
-from .pipe import (BaseSerializingPipe,
-                   PipeClosed)
+from .pipe import BaseSerializingPipe
+from .timeout import monotonic
 
 __all__ = [
     'PicklePipe'
 ]
 
+# Picklers support a per-pickler dispatch_table
+# on Python 3.3+ and reducer_override on Python 3.8+.
+_HAS_DISPATCH_TABLE = sys.version_info >= (3, 3)
+_HAS_REDUCER_OVERRIDE = sys.version_info >= (3, 8)
+
+if _HAS_REDUCER_OVERRIDE:
+    class _OverridePickler(pickle.Pickler):
+        def __init__(self, file, protocol, reducer_override):
+            pickle.Pickler.__init__(self, file, protocol)
+            self._reducer_override = reducer_override
+
+        def reducer_override(self, obj):
+            return self._reducer_override(obj)
+
 
 class _PickleSerializer(object):
-    def __init__(self, protocol):
+    def __init__(self, protocol, dispatch_table=None, reducer_override=None):
         self._protocol = protocol
+        self._dispatch_table = dispatch_table
+        self._reducer_override = reducer_override
+
+        # A pickler and its output buffer are kept for reducing custom types.
+        # Plain pickle.dumps is faster when there's nothing to customize.
+        self._custom = bool(dispatch_table) or reducer_override is not None
+        self._lock = threading.Lock()
+        self._output = None
+        self._pickler = None
+
+    def __getstate__(self):
+        # Picklers can't be pickled, workers in other processes make their own.
+        return self._protocol, self._dispatch_table, self._reducer_override
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     def loads(self, data):
         return pickle.loads(data)
 
     def dumps(self, obj):
-        return pickle.dumps(obj, protocol=self._protocol)
+        if not self._custom:
+            return pickle.dumps(obj, protocol=self._protocol)
+
+        # Another thread is using the kept pickler, use a new one instead of waiting.
+        if not self._lock.acquire(False):
+            output = io.BytesIO()
+            self._make_pickler(output).dump(obj)
+            return output.getvalue()
+        try:
+            if self._pickler is None:
+                self._output = io.BytesIO()
+                self._pickler = self._make_pickler(self._output)
+            try:
+                self._pickler.dump(obj)
+                return self._output.getvalue()
+            finally:
+                self._output.seek(0)
+                self._output.truncate()
+                self._pickler.clear_memo()
+        finally:
+            self._lock.release()
+
+    def _make_pickler(self, output):
+        if self._reducer_override is not None:
+            pickler = _OverridePickler(output, self._protocol, self._reducer_override)
+        else:
+            pickler = pickle.Pickler(output, self._protocol)
+        if self._dispatch_table:
+            dispatch_table = dict(copyreg.dispatch_table)
+            dispatch_table.update(self._dispatch_table)
+            pickler.dispatch_table = dispatch_table
+        return pickler
 
 
 class PicklePipe(BaseSerializingPipe):
@@ -30,58 +96,84 @@ class PicklePipe(BaseSerializingPipe):
 
     See the `Python docs on the pickle module <https://docs.python.org/3/library/pickle.html>`_
     for more information. """
-    def __init__(self, sock, protocol=None, max_size=None):
+    highest_protocol = pickle.HIGHEST_PROTOCOL
+
+    # Protocol 2 is the highest protocol that every supported Python can load.
+    baseline_protocol = 2
+
+    def __init__(self, sock, protocol=None, max_size=None,
+                 dispatch_table=None, reducer_override=None):
         """
         Creates a :class:`picklepipe.PicklePipe` instance wrapping
         a given socket.
 
         :param sock: Socket to wrap.
         :param protocol: Pickling protocol to favor.
+        :param dict dispatch_table:
+            Reducers by type that are used instead of ``copyreg``
+            when pickling, see :meth:`register_reducer`.
+        :param reducer_override:
+            Function called with every object that is pickled which returns
+            a reduce tuple or ``NotImplemented``. Requires Python 3.8+.
         """
-        super(PicklePipe, self).__init__(sock, None, max_size=max_size)
-        self._protocol = protocol
-        self._protocol_sent = False
-        self._protocol_recv = False
-
-        self._send_protocol()
+        if dispatch_table and not _HAS_DISPATCH_TABLE:
+            raise ValueError('dispatch_table requires Python 3.3 or later.')
+        if reducer_override is not None and not _HAS_REDUCER_OVERRIDE:
+            raise ValueError('reducer_override requires Python 3.8 or later.')
+        self._dispatch_table = dict(dispatch_table or {})
+        self._reducer_override = reducer_override
+        self._profiler = None
+        super(PicklePipe, self).__init__(sock, None, max_size=max_size, protocol=protocol)
+
+    def register_reducer(self, cls, reducer):
+        """
+        Registers a reducer for pickling instances of a type on this pipe.
+        A reducer for a hot type can return the type and a tuple of
+        primitives, for example ``lambda p: (Point, (p.x, p.y))``, which
+        is cheaper than what ``__reduce_ex__`` returns by default.
+        The peer only needs to be able to import the type.
+
+        :param type cls: Type to register the reducer for.
+        :param reducer: Function that returns a reduce tuple for an instance.
+        """
+        if not _HAS_DISPATCH_TABLE:
+            raise ValueError('Reducers require Python 3.3 or later.')
+        self._dispatch_table[cls] = reducer
+        self._serializer = self._make_serializer(self._protocol)
 
     @property
-    def protocol(self):
-        """ Highest protocol available between a peer
-        and the current pipe owner. """
-        self._recv_protocol()
-        return self._protocol
-
-    def fileno(self):
-        self._recv_protocol()
-        return super(PicklePipe, self).fileno()
-
-    def send_object(self, obj):
-        self._recv_protocol()
-        super(PicklePipe, self).send_object(obj)
-
-    def recv_object(self, timeout=None):
-        self._recv_protocol()
-        return super(PicklePipe, self).recv_object(timeout)
-
-    def _send_protocol(self):
-        if not self._protocol_sent:
-            self._sock.sendall(struct.pack('>B', self._protocol or pickle.HIGHEST_PROTOCOL))
-            self._protocol_sent = True
-
-    def _recv_protocol(self):
-        """ Resolves what the highest protocol number for
-        pickling that is allowed by the peer. """
-        if not self._protocol_recv:
-            try:
-                data = self._read_bytes(1, timeout=1.0)
-                if len(data) == 0:
-                    self.close()
-                    raise PipeClosed()
-                peer_protocol = struct.unpack('>B', data)[0]
-                self._protocol = min(self._protocol or pickle.HIGHEST_PROTOCOL, peer_protocol)
-                self._protocol_recv = True
-                self._serializer = _PickleSerializer(self._protocol)
-            except (OSError, socket.error):
-                self.close()
-                raise PipeClosed()
+    def profiler(self):
+        """ :class:`picklepipe.PayloadProfiler` recording sent objects or ``None``. """
+        return self._profiler
+
+    def set_profiler(self, profiler):
+        """
+        Sets a profiler that records the serialized size and ``dumps``
+        time of every object sent on this pipe and samples which types
+        and attributes inside the objects the bytes come from. Objects
+        sent through a :class:`picklepipe.LanePipe` or
+        :class:`picklepipe.PipelinedPipe` wrapping the pipe are recorded too.
+
+        :param profiler: :class:`picklepipe.PayloadProfiler` to use or ``None``.
+        """
+        self._profiler = profiler
+
+    def _dumps(self, obj):
+        if self._profiler is None:
+            return BaseSerializingPipe._dumps(self, obj)
+        start = monotonic()
+        data = BaseSerializingPipe._dumps(self, obj)
+        self._record_dumps(obj, len(data), monotonic() - start)
+        return data
+
+    def _record_dumps(self, obj, size, elapsed):
+        if self._profiler is not None:
+            self._profiler._record(obj, size, elapsed, self._protocol,
+                                   self._dispatch_table, self._reducer_override)
+
+    def _serializer_key(self):
+        return (super(PicklePipe, self)._serializer_key() +
+                (frozenset(self._dispatch_table.items()), self._reducer_override))
+
+    def _make_serializer(self, protocol):
+        return _PickleSerializer(protocol, self._dispatch_table, self._reducer_override)
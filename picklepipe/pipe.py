@@ -1,9 +1,15 @@
+import os
+import time
+import errno
 import socket
 import struct
-import selectors2
+import collections
 
-from .socketpair import socketpair
-from .timeout import Timeout
+from .envelope import Envelope, _pack_envelope, _unpack_envelope
+from .selector import selectors, SelectorError
+from .socketpair import socketpair, _ASYNC_BLOCKING_ERRNOS
+from .timeout import Timeout, monotonic
+from .tracing import _pack_trace, _mark_received, _unpack_trace
 
 __all__ = [
     'BaseSerializingPipe',
@@ -13,11 +19,71 @@ __all__ = [
     'PipeTimeout',
     'PipeSerializingError',
     'PipeDeserializingError',
-    'PipeObjectTooLargeError'
+    'PipeObjectTooLargeError',
+    'PipeSessionLost',
+    'CAPABILITY_TRACE'
 ]
 # Default size is 16MB.
 DEFAULT_MAX_SIZE = 0xFFFFFF
 
+# Number of seconds to wait for the peer's handshake
+# when an operation can't continue without it.
+DEFAULT_HANDSHAKE_TIMEOUT = 1.0
+
+# Number of seconds to wait for the socket to become
+# writable before giving up on sending a frame.
+DEFAULT_SEND_TIMEOUT = 10.0
+
+# Default number of bytes that coalesced writes are
+# buffered up to before they're flushed right away.
+DEFAULT_COALESCE_BYTES = 0x10000
+
+# Version of the frame layout that is sent during the handshake.
+FRAMING_VERSION = 1
+
+# Frame types that are sent in the frame header.
+FRAME_OBJECT = 0
+FRAME_LANE = 1
+FRAME_ENVELOPE = 2
+FRAME_CREDIT = 3
+FRAME_STREAM_END = 4
+FRAME_BYTES = 5
+FRAME_FILE = 6
+FRAME_BATCH = 7
+FRAME_SESSION = 8
+FRAME_SEQ = 9
+FRAME_ACK = 10
+FRAME_TRACED = 11
+
+# Capabilities that are advertised in the handshake.
+CAPABILITY_TRACE = 0x1
+
+# Default number of objects a receiver lets a
+# stream sender have outstanding at once.
+DEFAULT_STREAM_WINDOW = 16
+
+# Handshake is the protocol, framing version and capability bitmap.
+_HANDSHAKE = struct.Struct('>BBI')
+# Frame header is the frame type and the payload length.
+_FRAME_HEADER = struct.Struct('>BI')
+# Credit is a flag for resetting the credits, objects and bytes.
+_CREDIT = struct.Struct('>BII')
+_CREDIT_RESET = 0x1
+_CREDIT_UNLIMITED = 0xFFFFFFFF
+
+# Objects of these types are sent as raw bytes without the serializer.
+_RAW_TYPES = (bytes, bytearray, memoryview)
+
+# Payloads larger than this are written from the caller's
+# buffer instead of being copied after the frame header.
+_COPY_THRESHOLD = 0x10000
+
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+# Number of bytes read from files that can't use os.sendfile
+# and written to files that are received at once.
+_FILE_CHUNK_SIZE = 0x10000
+
 
 def _check_max_size(max_size):
     if not isinstance(max_size, int):
@@ -28,6 +94,32 @@ def _check_max_size(max_size):
         raise ValueError('max_size cannot be negative.')
 
 
+def _pack_frame_header(frame_type, data_len):
+    # AppVeyor and Travis CI don't like it when you allocate >4GB.
+    if data_len > 0xFFFFFFFF:  # Skip coverage.
+        raise PipeObjectTooLargeError()
+
+    return _FRAME_HEADER.pack(frame_type, data_len)
+
+
+def _pack_frame(frame_type, data):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return _pack_frame_header(frame_type, len(data)) + data
+
+
+def _byte_view(buffer):
+    """ Returns a flat view of the bytes of a buffer, copying
+    only buffers that can't be viewed as contiguous bytes. """
+    view = memoryview(buffer)
+    if view.itemsize != 1 or view.ndim != 1:
+        try:
+            view = view.cast('B')
+        except (AttributeError, TypeError):  # Skip coverage.
+            view = memoryview(view.tobytes())
+    return view
+
+
 class PipeError(Exception):
     """ Generic error for :class:`picklepipe.BaseSerializingPipe` """
     pass
@@ -62,13 +154,28 @@ class PipeDeserializingError(PipeError):
 class PipeObjectTooLargeError(PipeError):
     """ Exception for when an object is too large for the
     pipe's max_size attribute. """
+    def __init__(self, frame_type=None, prefix=b''):
+        self.frame_type = frame_type
+        self.prefix = prefix
+
+
+class PipeSessionLost(PipeError):
+    """ Exception for when a resumable session can't be
+    resumed because the peer doesn't have the same session. """
     pass
 
 
 class BaseSerializingPipe(object):
     """ Wraps an already connected socket and uses that
     socket as a interface to send serialized objects to a peer. """
-    def __init__(self, sock, serializer, max_size=None):
+    #: Highest protocol of the serializer that the pipe supports.
+    highest_protocol = 0
+
+    #: Protocol that objects are serialized with before the peer's
+    #: handshake arrives. Every peer must be able to load this protocol.
+    baseline_protocol = 0
+
+    def __init__(self, sock, serializer, max_size=None, protocol=None):
         """
         :param sock: Socket to wrap.
         :param serializer:
@@ -78,22 +185,57 @@ class BaseSerializingPipe(object):
             Maximum size of a serialized object that this pipe is willing
             to deserialize. This value is meant to limit the pipe's maximum
             memory usage while deserializing objects.
+        :param int protocol: Serializer protocol to favor.
         """
-        # Setting up the socket and serializer.
+        # Setting up the socket and serializer. Selectors are only
+        # created once a read or write actually has to wait.
         self._buffer = b''
         self._serializer = serializer
+        self._selector = None
+        self._write_selector = None
         self._sock = sock  # type: socket.socket
         self._sock.setblocking(False)
 
-        # Adding the socket to the selector.
-        self._selector = selectors2.DefaultSelector()
-        self._selector.register(self._sock, selectors2.EVENT_READ)
+        # Frames waiting to be written together while coalescing writes.
+        self._linger = None
+        self._coalesce_bytes = 0
+        self._coalesce_lock = None
+        self._schedule_flush = None
+        self._pending = bytearray()
+        self._flush_scheduled = False
+        self._nodelay = None
+        self._buffer_pool = None
+        self._tracing = False
+        self._trace_callback = None
 
         # Setting up the max_size attribute.
         if max_size is None:
             max_size = DEFAULT_MAX_SIZE
         _check_max_size(max_size)
         self._max_size = max_size
+        self._send_timeout = DEFAULT_SEND_TIMEOUT
+
+        # Objects are sent optimistically with the baseline protocol
+        # until the peer's handshake has been received.
+        if protocol is None:
+            protocol = self.highest_protocol
+        self._preferred_protocol = protocol
+        self._protocol = min(protocol, self.baseline_protocol)
+        self._serializer = self._make_serializer(self._protocol)
+        self._local_capabilities = CAPABILITY_TRACE
+        self._peer_capabilities = 0
+        self._protocol_sent = False
+        self._protocol_recv = False
+
+        # Frames read while waiting for stream credits and
+        # the credits granted by the peer for sending a stream.
+        self._backlog = collections.deque()
+        self._credit_objects = 0
+        self._credit_bytes = 0
+        self._credit_bytes_max = 0
+        self._credit_ended = False
+
+        self._send_protocol()
 
     def __enter__(self):
         return self
@@ -104,6 +246,39 @@ class BaseSerializingPipe(object):
     def __del__(self):
         self.close()
 
+    @property
+    def protocol(self):
+        """ Highest protocol available between a peer and the current
+        pipe owner. Until the handshake is complete this is the
+        baseline protocol that objects are being sent with. """
+        return self._protocol
+
+    @property
+    def capabilities(self):
+        """ Bitmap of the capabilities that are supported by both
+        the peer and the current pipe owner. Until the handshake
+        is complete no capabilities are shared. """
+        if not self._protocol_recv:
+            return 0
+        return self._local_capabilities & self._peer_capabilities
+
+    @property
+    def handshake_complete(self):
+        """ Attribute is True if the peer's handshake has been received. """
+        return self._protocol_recv
+
+    def poll_handshake(self, timeout=0.0):
+        """ Makes progress on receiving the peer's handshake without
+        blocking, meant to be called when the pipe is readable in
+        a selector loop. Objects may be sent before the handshake
+        is complete using the pipe's baseline protocol.
+
+        :param float timeout: Number of seconds to wait for the handshake.
+        :return: True if the handshake is complete.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        return self._poll_protocol(timeout)
+
     @property
     def max_size(self):
         """ Current setting for maximum size. """
@@ -120,51 +295,270 @@ class BaseSerializingPipe(object):
         _check_max_size(max_size)
         self._max_size = max_size
 
+    @property
+    def send_timeout(self):
+        """ Current setting for the send timeout. """
+        return self._send_timeout
+
+    def set_send_timeout(self, send_timeout):
+        """
+        Sets how long sending waits for the peer to read data before
+        raising :class:`picklepipe.PipeTimeout`. If part of a frame was
+        already written the pipe can't be used anymore and is closed.
+
+        :param float send_timeout:
+            Number of seconds to wait for the socket to become writable
+            or ``None`` to wait forever.
+        """
+        if send_timeout is not None and send_timeout < 0:
+            raise ValueError('send_timeout cannot be negative.')
+        self._send_timeout = send_timeout
+
+    @property
+    def linger(self):
+        """ Current setting for the linger time of coalesced writes
+        or ``None`` if writes aren't being coalesced. """
+        return self._linger
+
+    def set_coalescing(self, linger, max_bytes=DEFAULT_COALESCE_BYTES):
+        """
+        Sets whether frames are buffered and written together instead
+        of being written as they're sent. Buffered frames are written
+        once ``max_bytes`` are buffered, ``linger`` seconds after the
+        first of them was sent, when :meth:`flush` is called or before
+        the pipe waits to receive from the peer. While coalescing, TCP
+        sockets have ``TCP_NODELAY`` set and are corked where supported
+        while a flush is written. If sending raises :class:`picklepipe.PipeTimeout`
+        frames that weren't written stay buffered.
+
+        :param float linger:
+            Number of seconds a frame may wait to be written
+            or ``None`` to write frames as they're sent.
+        :param int max_bytes: Number of bytes to buffer before writing.
+        :raises: :class:`picklepipe.PipeTimeout` if disabling coalescing
+            couldn't flush the buffered frames in time.
+        """
+        if linger is None:
+            if self._linger is not None:
+                self.flush()
+                self._linger = None
+                if self._nodelay is not None:
+                    self._set_tcp_option('TCP_NODELAY', self._nodelay)
+                    self._nodelay = None
+            return
+        if linger < 0:
+            raise ValueError('linger cannot be negative.')
+        if max_bytes <= 0:
+            raise ValueError('max_bytes must be positive.')
+        if self._coalesce_lock is None:
+            # Only pipes that coalesce writes need threads.
+            import threading
+            from .coalesce import schedule_flush
+            self._coalesce_lock = threading.RLock()
+            self._schedule_flush = schedule_flush
+        if self._linger is None and self._sock is not None:
+            try:
+                self._nodelay = self._sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+            except (OSError, socket.error):
+                self._nodelay = None
+            else:
+                self._set_tcp_option('TCP_NODELAY', 1)
+        self._coalesce_bytes = max_bytes
+        self._linger = linger
+
+    def flush(self):
+        """ Writes every frame that is buffered while coalescing writes.
+
+        :raises: :class:`picklepipe.PipeTimeout` if the peer stops reading.
+            Frames that weren't written stay buffered.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        if self._coalesce_lock is None:
+            return
+        with self._coalesce_lock:
+            self._flush_locked()
+
+    @property
+    def tracing(self):
+        """ Attribute is True if objects sent on the pipe are traced. """
+        return self._tracing
+
+    def set_tracing(self, enabled):
+        """
+        Enables or disables tracing of sent objects. A traced object
+        carries the time it was sent, the time spent serializing it and
+        an optional trace ID to the peer, which passes a
+        :class:`picklepipe.FrameTrace` of the object to its trace callback.
+
+        Objects are only traced once the handshake is complete and if
+        the peer supports tracing, see :attr:`capabilities`. Raw bytes and
+        objects sent with a header are never traced.
+
+        :param bool enabled: True to trace every object sent.
+        """
+        self._tracing = enabled
+
+    def set_trace_callback(self, callback):
+        """
+        Sets the callback that is called with a :class:`picklepipe.FrameTrace`
+        for every traced object received, right before the object is returned.
+
+        :param callback: Callable taking a single argument or ``None``.
+        """
+        self._trace_callback = callback
+
+    @property
+    def buffer_pool(self):
+        """ :class:`picklepipe.BufferPool` that receive buffers are taken from or ``None``. """
+        return self._buffer_pool
+
+    def set_buffer_pool(self, buffer_pool):
+        """
+        Sets a pool to take buffers for receiving objects from. Each buffer
+        is given back to the pool once its object is deserialized instead
+        of allocating a new buffer for every object received. The
+        serializer must be able to load objects from a ``memoryview``.
+
+        :param buffer_pool:
+            :class:`picklepipe.BufferPool` to use or ``None`` to
+            allocate a new buffer for every object.
+        """
+        self._buffer_pool = buffer_pool
+
     def close(self):
         """ Closes the pipe instance as well as the internal socket. """
         if self._sock is None:
             return
+        if self._pending:
+            try:
+                self._flush_due()
+            except PipeError:  # Skip coverage.
+                pass
+        for selector in (self._selector, self._write_selector):
+            if selector is not None:
+                try:
+                    selector.close()
+                except Exception:  # Skip coverage.
+                    pass
         try:
             self._sock.close()
-            self._selector.unregister(self._sock)
-            self._selector.close()
         except Exception:  # Skip coverage.
             pass
         self._sock = None
         self._selector = None
+        self._write_selector = None
 
     @property
     def closed(self):
         """ Attribute is True if the pipe instance is closed. """
         return self._sock is None
 
+    def is_healthy(self):
+        """ Checks without blocking that an idle pipe is still usable.
+        A pipe is unhealthy if it's closed or if the peer has closed
+        its end or sent data which hasn't been received yet.
+        Completes the handshake if the peer's handshake has arrived.
+
+        :return: True if the pipe is healthy.
+        """
+        if self._sock is None:
+            return False
+        try:
+            if self._poll_protocol(0.0) and self._buffer:
+                return False
+            self._sock.recv(1, socket.MSG_PEEK)
+        except (OSError, socket.error) as e:
+            return e.errno in _ASYNC_BLOCKING_ERRNOS
+        except PipeClosed:
+            return False
+        # Either the peer closed its end or it sent unexpected data.
+        return False
+
     def fileno(self):
         """ Returns the file descriptor for the
         internal interface being used. """
         return self._sock.fileno()
 
-    def send_object(self, obj):
+    def send_object(self, obj, header=None, trace_id=None):
         """ Serializes and sends and object to the peer.
 
+        ``bytes``, ``bytearray`` and ``memoryview`` objects sent without
+        a header skip the serializer and are written directly from
+        their buffer. The peer receives them as ``bytes``.
+
         :param obj: Object to send to the peer.
+        :param header:
+            Optional small routing header. If given the object is sent
+            in an envelope so routers can read the header with
+            :meth:`recv_raw` without deserializing the object.
+        :param trace_id:
+            Optional ``bytes`` or ``str`` that traces the object, see
+            :meth:`set_tracing`. Objects with a trace ID are traced even
+            if tracing isn't enabled.
         :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
         """
-        try:
-            data = self._serializer.dumps(obj)
-        except Exception as e:
-            raise PipeSerializingError(e)
-        data_len = len(data)
+        self._poll_protocol(0.0)
+        if header is None:
+            if ((self._tracing or trace_id is not None) and
+                    self.capabilities & CAPABILITY_TRACE):
+                self._send_traced(obj, trace_id)
+            else:
+                self._send_frame(*self._encode_object(obj))
+        else:
+            data = self._dumps(obj)
+            self._send_frame(FRAME_ENVELOPE, _pack_envelope(self._dumps(header), data))
 
-        # AppVeyor and Travis CI don't like it when you allocate >4GB.
-        if data_len > 0xFFFFFFFF:  # Skip coverage.
-            raise PipeObjectTooLargeError()
+    def send_raw(self, envelope):
+        """ Sends an envelope whose payload is already serialized,
+        such as one received from another pipe with :meth:`recv_raw`.
+        The payload is sent without being serialized again.
 
-        try:
-            self._sock.sendall(struct.pack('>I', len(data)))
-            self._sock.sendall(data)
-        except (OSError, socket.error):
-            self.close()
-            raise PipeClosed()
+        :param envelope: :class:`picklepipe.Envelope` to send.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        self._poll_protocol(0.0)
+        if envelope._raw:
+            self._send_frame(FRAME_BYTES, envelope.payload)
+            return
+        if envelope.header is None:
+            self._send_frame(FRAME_OBJECT, envelope.payload)
+            return
+        header_data = envelope._header_data
+        if header_data is None:
+            header_data = self._dumps(envelope.header)
+        self._send_frame(FRAME_ENVELOPE, _pack_envelope(header_data, envelope.payload))
+
+    def recv_raw(self, timeout=None):
+        """ Receives an object from the peer without deserializing it.
+        Only the routing header, if the object was sent with one,
+        is deserialized.
+
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: :class:`picklepipe.Envelope` with the header and serialized payload.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        with Timeout(timeout) as t:
+            if not self._poll_protocol(t.remaining):
+                raise PipeTimeout()
+            frame_type, data = self._recv_frame(t)
+        if frame_type == FRAME_OBJECT:
+            envelope = Envelope(None, data)
+        elif frame_type == FRAME_TRACED:
+            trace, _, data = self._split_trace(data)
+            self._report_trace(trace)
+            envelope = Envelope(None, data)
+        elif frame_type in (FRAME_BYTES, FRAME_FILE):
+            # Files are forwarded by send_raw() as raw bytes.
+            envelope = Envelope(None, data)
+            envelope._raw = True
+        elif frame_type == FRAME_ENVELOPE:
+            header_data, payload = self._split_envelope(data)
+            envelope = Envelope(self._load_payload(header_data), payload)
+            envelope._header_data = header_data
+        else:
+            raise PipeDeserializingError(ValueError('Unknown frame type %d.' % frame_type))
+        envelope._loads = self._load_payload
+        return envelope
 
     def recv_object(self, timeout=None):
         """ Receives a pickled object from the peer.
@@ -173,45 +567,682 @@ class BaseSerializingPipe(object):
         :return: Pickled object or None if timed out.
         :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
         """
-        try:
+        with Timeout(timeout) as t:
+            if not self._poll_protocol(t.remaining):
+                raise PipeTimeout()
+            if self._buffer_pool is not None:
+                return self._recv_pooled(t)
+            frame_type, data = self._recv_frame(t)
+        return self._load_frame(frame_type, data)
+
+    def recv_payload_into(self, buffer, timeout=None):
+        """ Receives the payload of raw bytes sent with :meth:`send_object`
+        or of a file sent with :meth:`send_file` directly into a buffer
+        owned by the caller such as a ``bytearray``, an ``array`` or an ``mmap``.
+
+        :param buffer: Writable buffer to receive the payload into.
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: Number of bytes received into the buffer.
+        :raises: :class:`picklepipe.PipeDeserializingError` if the next frame
+            isn't raw bytes or a file. The frame is kept for :meth:`recv_object`.
+        :raises: :class:`picklepipe.PipeTimeout` if the payload doesn't arrive in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        :raises: ValueError if the payload doesn't fit in the buffer. The
+            frame is kept and can be received into a larger buffer.
+        """
+        view = _byte_view(buffer)
+        if view.readonly:
+            raise ValueError('buffer must be writable.')
+        with Timeout(timeout) as t:
+            if not self._poll_protocol(t.remaining):
+                raise PipeTimeout()
+            while True:
+                if self._backlog:
+                    frame_type, data = self._backlog[0]
+                    data_len = len(data)
+                else:
+                    data = None
+                    frame_type, data_len = self._peek_frame_header(t)
+                if frame_type == FRAME_CREDIT:
+                    self._recv_frame(t)
+                    continue
+                if frame_type not in (FRAME_BYTES, FRAME_FILE):
+                    raise PipeDeserializingError(ValueError('Next frame is not raw bytes.'))
+                if data_len > len(view):
+                    raise ValueError('Payload of %d bytes doesn\'t fit in the buffer.' % data_len)
+                if data is not None:
+                    self._backlog.popleft()
+                    view[:data_len] = data
+                else:
+                    self._read_bytes(_FRAME_HEADER.size)
+                    self._read_payload_into(frame_type, view[:data_len], t)
+                return data_len
+
+    def send_iter(self, iterable, timeout=None):
+        """ Sends every object from an iterable or generator as a stream
+        to a peer that is receiving it with :meth:`recv_iter`. The
+        receiver grants credits and this never has more objects or bytes
+        outstanding than the receiver allows. At most one object is taken
+        from the iterable ahead of the credits to send it.
+
+        :param iterable: Iterable or generator of objects to send.
+        :param float timeout: Number of seconds to wait for credits each time.
+        :raises: :class:`picklepipe.PipeTimeout` if the receiver doesn't grant credits in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        with Timeout(timeout) as t:
+            self._wait_for_credit(t, 0)
+        for obj in iterable:
+            self._poll_protocol(0.0)
+            frame_type, data = self._encode_object(obj)
             with Timeout(timeout) as t:
-                len_data = self._read_bytes(4, timeout=t.remaining)
-                if len(len_data) != 4:
-                    self._buffer += len_data
-                    raise PipeTimeout()
-                data_len = struct.unpack('>I', len_data)[0]
-                if data_len == 0:
-                    raise PipeDeserializingError(ValueError('Object cannot be zero width.'))
-                if data_len > self._max_size:
-                    # A sticky situation where we now need to void the object
-                    # that is trying to be sent to us. Thing is we need to also
-                    # complete this voiding before our timeout so if we can't
-                    # finish voiding we should be conservative and close the pipe.
-                    # Otherwise just notify that the object was too large.
-                    data_to_read = data_len
-                    while data_to_read > 0:
-                        data = self._read_bytes(min(0xFFFFFF, data_to_read),
-                                                timeout=t.remaining)
-                        data_to_read -= len(data)
-                        if not data and t.timed_out:
-                            break
-                    if data_to_read == 0:
-                        raise PipeObjectTooLargeError()
-                    else:
-                        self.close()
-                        raise PipeClosed()
-                pickle_data = self._read_bytes(data_len, timeout=t.remaining)
-                if len(pickle_data) != data_len:
-                    self._buffer += len_data + pickle_data
+                self._wait_for_credit(t, len(data))
+            self._send_frame(frame_type, data)
+            self._credit_objects -= 1
+            if self._credit_bytes is not None:
+                self._credit_bytes -= len(data)
+        self._send_frame(FRAME_STREAM_END, b'')
+
+        # Credits left over from this stream and any that the receiver
+        # returns after it are discarded, the next stream waits for a new window.
+        self._credit_objects = 0
+        self._credit_bytes = 0
+        self._credit_ended = True
+
+    def recv_iter(self, window=DEFAULT_STREAM_WINDOW, window_bytes=None, timeout=None):
+        """ Generator which receives a stream of objects sent with
+        :meth:`send_iter` until the stream ends. Credits are granted
+        to the sender as objects are consumed so at most ``window``
+        objects and ``window_bytes`` bytes are in flight at once.
+
+        :param int window: Maximum number of objects in flight.
+        :param int window_bytes:
+            Maximum number of serialized bytes in flight or ``None`` for
+            no limit. A single object larger than the window is still
+            sent once nothing else is in flight.
+        :param float timeout: Number of seconds to wait for each object.
+        :raises: :class:`picklepipe.PipeTimeout` if an object doesn't arrive in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        if window <= 0 or window > 0xFFFF:
+            raise ValueError('window must be between 1 and 65535.')
+        if window_bytes is not None and not 0 < window_bytes < _CREDIT_UNLIMITED:
+            raise ValueError('window_bytes must be positive.')
+        self._send_credit(_CREDIT_RESET, window,
+                          _CREDIT_UNLIMITED if window_bytes is None else window_bytes)
+
+        consumed_objects = 0
+        consumed_bytes = 0
+        while True:
+            with Timeout(timeout) as t:
+                if not self._poll_protocol(t.remaining):
                     raise PipeTimeout()
+                frame_type, data = self._recv_frame(t)
+            if frame_type == FRAME_STREAM_END:
+                return
+            obj = self._load_frame(frame_type, data)
+            yield obj
+
+            # Return credits in batches once the object has been consumed.
+            consumed_objects += 1
+            consumed_bytes += len(data)
+            if (consumed_objects >= max(1, window // 2) or
+                    (window_bytes is not None and consumed_bytes >= window_bytes // 2)):
+                self._send_credit(0, consumed_objects,
+                                  0 if window_bytes is None else consumed_bytes)
+                consumed_objects = 0
+                consumed_bytes = 0
+
+    def send_file(self, fileobj, offset=0, count=None):
+        """ Sends the contents of a file to the peer as a single frame.
+        Files with a file descriptor are written to the socket with
+        ``os.sendfile`` where it's available so the contents never
+        pass through Python, other files are read in chunks.
+
+        :param fileobj: File opened in binary mode to send.
+        :param int offset: Position in the file to start sending from.
+        :param int count:
+            Number of bytes to send or ``None`` to send until the end of the file.
+        :raises: :class:`picklepipe.PipeObjectTooLargeError` if more than 4GB is sent.
+        :raises: :class:`picklepipe.PipeSerializingError` if the file ends before
+            ``count`` bytes were sent. The pipe is closed.
+        :raises: :class:`picklepipe.PipeTimeout` if the peer stops reading. If part
+            of the file was already written the pipe is closed.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        if self._sock is None:
+            raise PipeClosed()
+        self.flush()
+        if offset < 0:
+            raise ValueError('offset cannot be negative.')
+        if count is None:
+            fileobj.seek(0, os.SEEK_END)
+            count = max(0, fileobj.tell() - offset)
+        elif count < 0:
+            raise ValueError('count cannot be negative.')
+        header = _pack_frame_header(FRAME_FILE, count)
+
+        try:
+            sent = self._write_bytes([header], self._send_timeout)
+            if sent == len(header):
+                sent += self._write_file(fileobj, offset, count, self._send_timeout)
+        except EOFError as e:
+            self.close()
+            raise PipeSerializingError(e)
+        except (OSError, socket.error, SelectorError):
+            self.close()
+            raise PipeClosed()
+        if sent != len(header) + count:
+            if sent:
+                self.close()
+            raise PipeTimeout()
+
+    def recv_to_file(self, fileobj, timeout=None):
+        """ Receives a file sent with :meth:`send_file` and writes
+        its contents to a file in bounded chunks without holding the
+        whole contents in memory. Files aren't limited by ``max_size``.
+
+        :param fileobj: File opened in binary mode to write the contents to.
+        :param float timeout: Number of seconds to wait for the whole file.
+        :return: Number of bytes written to the file.
+        :raises: :class:`picklepipe.PipeDeserializingError` if the next frame
+            isn't a file. The frame is kept for :meth:`recv_object`.
+        :raises: :class:`picklepipe.PipeTimeout` if the file doesn't arrive in time.
+            If part of the file was already received the pipe is closed.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        with Timeout(timeout) as t:
+            if not self._poll_protocol(t.remaining):
+                raise PipeTimeout()
+            while True:
+                if self._backlog:
+                    frame = self._backlog.popleft()
+                else:
+                    frame_type, data_len = self._peek_frame_header(t)
+                    if frame_type == FRAME_FILE:
+                        self._read_bytes(_FRAME_HEADER.size)
+                        return self._read_file(fileobj, data_len, t)
+                    frame = self._read_frame(t)
+                if frame[0] == FRAME_FILE:
+                    fileobj.write(frame[1])
+                    return len(frame[1])
+                if frame[0] != FRAME_CREDIT:
+                    self._backlog.appendleft(frame)
+                    raise PipeDeserializingError(ValueError('Next frame is not a file.'))
+                self._add_credit(frame[1])
+
+    def _send_credit(self, flags, objects, data_bytes):
+        self._send_frame(FRAME_CREDIT, _CREDIT.pack(flags, objects, data_bytes))
+
+    def _add_credit(self, data):
+        try:
+            flags, objects, data_bytes = _CREDIT.unpack(data)
+        except struct.error as e:
+            raise PipeDeserializingError(e)
+        if flags & _CREDIT_RESET:
+            self._credit_ended = False
+            self._credit_objects = objects
+            if data_bytes == _CREDIT_UNLIMITED:
+                self._credit_bytes = None
+            else:
+                self._credit_bytes = self._credit_bytes_max = data_bytes
+        elif not self._credit_ended:
+            self._credit_objects += objects
+            if self._credit_bytes is not None:
+                self._credit_bytes += data_bytes
+
+    def _has_credit(self, data_len):
+        if self._credit_objects <= 0:
+            return False
+        if self._credit_bytes is None:
+            return True
+        # Objects larger than the whole window may be sent once nothing is in flight.
+        return self._credit_bytes >= min(data_len, self._credit_bytes_max)
+
+    def _wait_for_credit(self, t, data_len):
+        """ Reads frames from the peer until there are enough
+        credits, other frames are kept for receiving later. """
+        while not self._has_credit(data_len):
+            if not self._poll_protocol(t.remaining):
+                raise PipeTimeout()
+            frame_type, data = self._read_frame(t)
+            if frame_type == FRAME_CREDIT:
+                self._add_credit(data)
+            else:
+                self._backlog.append((frame_type, data))
+
+    def _make_serializer(self, protocol):
+        """ Returns the serializer to use for a protocol. Pipes that
+        negotiate a protocol with their peer override this. """
+        return self._serializer
+
+    def _send_protocol(self):
+        if not self._protocol_sent:
+            self._write_frame(_HANDSHAKE.pack(self._preferred_protocol,
+                                              FRAMING_VERSION,
+                                              self._local_capabilities))
+            self._protocol_sent = True
+
+    def _recv_protocol(self, timeout=DEFAULT_HANDSHAKE_TIMEOUT):
+        """ Waits for the peer's handshake and closes the
+        pipe if it doesn't arrive within the timeout. """
+        if not self._poll_protocol(timeout):
+            self.close()
+            raise PipeClosed()
+
+    def _poll_protocol(self, timeout):
+        """ Resolves what the highest protocol and capabilities
+        are that are shared with the peer if the peer's
+        handshake arrives before the timeout. """
+        if self._protocol_recv:
+            return True
+        if self._sock is None:
+            raise PipeClosed()
+        try:
+            data = self._read_bytes(_HANDSHAKE.size, timeout=timeout)
+            if len(data) != _HANDSHAKE.size:
+                self._unread_bytes(data)
+                return False
+            peer_protocol, peer_framing, peer_capabilities = _HANDSHAKE.unpack(data)
+        except (OSError, socket.error, SelectorError, struct.error):
+            self.close()
+            raise PipeClosed()
+        if peer_framing < FRAMING_VERSION:
+            self.close()
+            raise PipeClosed()
+        self._protocol = min(self._preferred_protocol, peer_protocol)
+        self._peer_capabilities = peer_capabilities
+        self._protocol_recv = True
+        self._serializer = self._make_serializer(self._protocol)
+        return True
+
+    def _send_frame(self, frame_type, data):
+        if self._sock is None:
+            raise PipeClosed()
+        if len(data) <= _COPY_THRESHOLD:
+            self._write_frame(_pack_frame(frame_type, data))
+        else:
+            self._write_frame(_pack_frame_header(frame_type, len(data)), data)
+
+    def _send_traced(self, obj, trace_id):
+        start = monotonic()
+        frame_type, data = self._encode_object(obj)
+        if frame_type != FRAME_OBJECT:
+            self._send_frame(frame_type, data)
+            return
+        header = _pack_trace(frame_type, time.time(), monotonic() - start, trace_id)
+        if self._sock is None:
+            raise PipeClosed()
+        self._write_frame(_pack_frame_header(FRAME_TRACED, len(header) + len(data)) + header,
+                          data)
+
+    def _split_trace(self, data):
+        try:
+            trace, frame_type, data = _unpack_trace(data)
+        except (ValueError, struct.error) as e:
+            raise PipeDeserializingError(e)
+        if frame_type != FRAME_OBJECT:
+            raise PipeDeserializingError(ValueError('Unknown traced frame type %d.' % frame_type))
+        return trace, frame_type, data
+
+    def _report_trace(self, trace):
+        if self._trace_callback is not None:
+            self._trace_callback(trace)
+
+    def _write_nonblocking(self, data):
+        """ Writes as much of the data as the socket accepts
+        without waiting and returns the number of bytes written. """
+        if self._sock is None:
+            raise PipeClosed()
+        if self._pending:
+            self._flush_due()
+            if self._pending:
+                return 0
+        try:
+            return self._sock.send(data)
+        except (OSError, socket.error) as e:
+            if e.errno in _ASYNC_BLOCKING_ERRNOS:
+                return 0
+            self.close()
+            raise PipeClosed()
+
+    def _write_frame(self, *buffers):
+        """ Writes a whole frame made up of one or more buffers
+        in a single write. A frame that is only partially written
+        leaves the stream in an unknown state so the pipe is closed. """
+        if self._linger is not None:
+            with self._coalesce_lock:
+                self._coalesce_frame(buffers)
+            return
+        try:
+            sent = self._write_bytes(buffers, self._send_timeout)
+        except (OSError, socket.error, SelectorError):
+            self.close()
+            raise PipeClosed()
+        if sent != sum(len(buffer) for buffer in buffers):
+            if sent:
+                self.close()
+            raise PipeTimeout()
+
+    def _coalesce_frame(self, buffers):
+        """ Buffers a frame while coalescing writes and writes
+        the buffer together with the frame once it's full. """
+        if self._sock is None:
+            raise PipeClosed()
+        size = sum(len(buffer) for buffer in buffers)
+        if len(self._pending) + size < self._coalesce_bytes:
+            for buffer in buffers:
+                self._pending += buffer
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                self._schedule_flush(self, self._linger)
+            return
+        self._flush_locked(buffers)
+
+    def _flush_locked(self, buffers=()):
+        """ Writes the buffered frames followed by more buffers. Whatever
+        isn't written stays buffered so the stream is never corrupted. """
+        if not self._pending and not buffers:
+            return
+        if self._sock is None:
+            raise PipeClosed()
+        views = [self._pending] + list(buffers)
+        cork = self._set_tcp_option('TCP_CORK', 1)
+        try:
+            sent = self._write_bytes(views, self._send_timeout)
+        except (OSError, socket.error, SelectorError):
+            self.close()
+            raise PipeClosed()
+        finally:
+            if cork:
+                self._set_tcp_option('TCP_CORK', 0)
+        if sent == sum(len(view) for view in views):
+            self._pending = bytearray()
+            return
+        written = min(sent, len(self._pending))
+        del self._pending[:written]
+        sent -= written
+        for buffer in buffers:
+            if sent < len(buffer):
+                self._pending += memoryview(buffer)[sent:]
+            sent = max(0, sent - len(buffer))
+        raise PipeTimeout()
+
+    def _flush_due(self):
+        """ Writes as much of the buffered frames as possible without
+        waiting. Called by the flusher thread once the linger time is up. """
+        lock = self._coalesce_lock
+        if lock is None or not lock.acquire(False):
+            if self._linger is not None:
+                self._schedule_flush(self, self._linger)
+            return
+        try:
+            self._flush_scheduled = False
+            if not self._pending or self._sock is None:
+                return
+            try:
+                sent = self._sock.send(self._pending)
+            except (OSError, socket.error) as e:
+                if e.errno not in _ASYNC_BLOCKING_ERRNOS:
+                    self._pending = bytearray()
+                    self.close()
+                    return
+                sent = 0
+            del self._pending[:sent]
+            if self._pending and self._linger is not None:
+                self._flush_scheduled = True
+                self._schedule_flush(self, self._linger)
+        finally:
+            lock.release()
+
+    def _set_tcp_option(self, name, value):
+        """ Sets a TCP socket option if the platform and socket
+        support it and returns True if the option was set. """
+        option = getattr(socket, name, None)
+        if option is None or self._sock is None:
+            return False
+        try:
+            self._sock.setsockopt(socket.IPPROTO_TCP, option, value)
+        except (OSError, socket.error):
+            return False
+        return True
+
+    def _peek_frame_header(self, t):
+        """ Waits for the next frame header and returns its frame
+        type and payload length without consuming the header. """
+        try:
+            header = self._read_bytes(_FRAME_HEADER.size, timeout=t.remaining)
+        except (OSError, socket.error, SelectorError):
+            self.close()
+            raise PipeClosed()
+        self._unread_bytes(header)
+        if len(header) != _FRAME_HEADER.size:
+            raise PipeTimeout()
+        return _FRAME_HEADER.unpack(header)
+
+    def _recv_pooled(self, t):
+        """ Receives an object into a buffer taken from the buffer pool.
+        Other frames and objects larger than ``max_size`` are received as usual. """
+        frame_type, data_len = FRAME_CREDIT, 0
+        if not self._backlog:
+            frame_type, data_len = self._peek_frame_header(t)
+        if frame_type != FRAME_OBJECT or not 0 < data_len <= self._max_size:
+            frame_type, data = self._recv_frame(t)
+            return self._load_frame(frame_type, data)
+
+        self._read_bytes(_FRAME_HEADER.size)
+        buffer = self._buffer_pool.acquire(data_len)
+        try:
+            view = memoryview(buffer)[:data_len]
+            self._read_payload_into(FRAME_OBJECT, view, t)
+            return self._load_payload(view)
+        finally:
+            self._buffer_pool.release(buffer)
+
+    def _read_payload_into(self, frame_type, view, t):
+        """ Reads a frame payload into a view once its header is consumed.
+        If the payload doesn't arrive in time the frame is put back. """
+        received = min(len(self._buffer), len(view))
+        view[:received] = self._buffer[:received]
+        self._buffer = self._buffer[received:]
+        try:
+            while received < len(view):
                 try:
-                    return self._serializer.loads(pickle_data)
-                except Exception as e:
-                    raise PipeDeserializingError(e)
-        except (OSError, socket.error, selectors2.SelectorError, struct.error):
+                    n = self._sock.recv_into(view[received:])
+                except (OSError, socket.error) as e:
+                    if e.errno not in _ASYNC_BLOCKING_ERRNOS:
+                        raise
+                    if t.timed_out or not self._wait_readable(t.remaining):
+                        header = _FRAME_HEADER.pack(frame_type, len(view))
+                        self._unread_bytes(header + view[:received].tobytes())
+                        raise PipeTimeout()
+                    continue
+                if not n:
+                    self.close()
+                    raise PipeClosed()
+                received += n
+        except (OSError, socket.error, SelectorError):
             self.close()
             raise PipeClosed()
 
+    def _recv_frame(self, t, prefix_size=0):
+        """ Receives the next frame from the peer within
+        the :class:`picklepipe.timeout.Timeout` given. If the frame
+        is too large the first ``prefix_size`` bytes of its payload
+        are kept on the :class:`picklepipe.PipeObjectTooLargeError`.
+        Credit frames are applied instead of being returned. """
+        if self._backlog:
+            return self._backlog.popleft()
+        while True:
+            frame_type, data = self._read_frame(t, prefix_size)
+            if frame_type != FRAME_CREDIT:
+                return frame_type, data
+            self._add_credit(data)
+
+    def _read_frame(self, t, prefix_size=0):
+        try:
+            header = self._read_bytes(_FRAME_HEADER.size, timeout=t.remaining)
+            if len(header) != _FRAME_HEADER.size:
+                self._unread_bytes(header)
+                raise PipeTimeout()
+            frame_type, data_len = _FRAME_HEADER.unpack(header)
+            if data_len > self._max_size:
+                # A sticky situation where we now need to void the object
+                # that is trying to be sent to us. Thing is we need to also
+                # complete this voiding before our timeout so if we can't
+                # finish voiding we should be conservative and close the pipe.
+                # Otherwise just notify that the object was too large.
+                prefix = self._read_bytes(min(prefix_size, data_len), timeout=t.remaining)
+                data_to_read = data_len - len(prefix)
+                while data_to_read > 0:
+                    data = self._read_bytes(min(0xFFFFFF, data_to_read),
+                                            timeout=t.remaining)
+                    data_to_read -= len(data)
+                    if not data and t.timed_out:
+                        break
+                if data_to_read == 0:
+                    raise PipeObjectTooLargeError(frame_type, prefix)
+                else:
+                    self.close()
+                    raise PipeClosed()
+            if frame_type == FRAME_TRACED:
+                received_at, start = time.time(), monotonic()
+            data = self._read_bytes(data_len, timeout=t.remaining)
+            if len(data) != data_len:
+                self._unread_bytes(header + data)
+                raise PipeTimeout()
+            if frame_type == FRAME_TRACED:
+                data = _mark_received(data, received_at, monotonic() - start)
+            return frame_type, data
+        except (OSError, socket.error, SelectorError, struct.error):
+            self.close()
+            raise PipeClosed()
+
+    def _write_file(self, fileobj, offset, count, timeout):
+        """ Writes part of a file to the socket, waiting up to the
+        timeout each time for the socket to become writable.
+        Returns the number of bytes that were written. """
+        fd = None
+        if getattr(os, 'sendfile', None) is not None:
+            try:
+                fd = fileobj.fileno()
+            except (AttributeError, IOError, ValueError):
+                fd = None
+
+        total = 0
+        while total < count:
+            if fd is not None:
+                try:
+                    sent = os.sendfile(self._sock.fileno(), fd, offset + total, count - total)
+                except (OSError, socket.error) as e:
+                    if not total and e.errno in (errno.EINVAL, errno.ENOSYS):
+                        # The file doesn't support os.sendfile, read it instead.
+                        fd = None
+                        continue
+                    if e.errno not in _ASYNC_BLOCKING_ERRNOS:
+                        raise
+                    sent = None
+                if sent == 0:
+                    raise EOFError('File ended before %d bytes were sent.' % count)
+                sent = sent or 0
+            else:
+                fileobj.seek(offset + total)
+                chunk = fileobj.read(min(_FILE_CHUNK_SIZE, count - total))
+                if not chunk:
+                    raise EOFError('File ended before %d bytes were sent.' % count)
+                sent = self._write_bytes([chunk], timeout)
+                if sent != len(chunk):
+                    return total + sent
+            total += sent
+            if not sent and not self._wait_writable(timeout):
+                break
+        return total
+
+    def _read_file(self, fileobj, data_len, t):
+        """ Writes the payload of a file frame to a file in
+        chunks. Once part of the payload has been consumed the
+        pipe can't recover from a timeout so it is closed. """
+        data_to_read = data_len
+        try:
+            while data_to_read > 0:
+                data = self._read_bytes(min(_FILE_CHUNK_SIZE, data_to_read),
+                                        timeout=t.remaining)
+                if data:
+                    fileobj.write(data)
+                    data_to_read -= len(data)
+                elif t.timed_out:
+                    self.close()
+                    raise PipeTimeout()
+        except (OSError, socket.error, SelectorError):
+            self.close()
+            raise PipeClosed()
+        except PipeError:
+            raise
+        except Exception:
+            self.close()
+            raise
+        return data_len
+
+    def _serializer_key(self):
+        """ Returns a key that is equal for pipes which serialize
+        objects into the same bytes, pipes with customized
+        serializers include their customizations. """
+        return type(self), self._protocol
+
+    def _encode_object(self, obj):
+        """ Returns the frame type and payload to send an object with. """
+        if isinstance(obj, _RAW_TYPES):
+            return FRAME_BYTES, _byte_view(obj)
+        return FRAME_OBJECT, self._dumps(obj)
+
+    def _dumps(self, obj):
+        try:
+            return self._serializer.dumps(obj)
+        except Exception as e:
+            raise PipeSerializingError(e)
+
+    def _record_dumps(self, obj, size, elapsed):
+        """ Called with objects that were serialized for this pipe
+        and how long that took. Pipes that profile what they send
+        override this, wrappers serializing elsewhere call it. """
+        pass
+
+    def _split_envelope(self, data):
+        try:
+            return _unpack_envelope(data)
+        except (ValueError, struct.error) as e:
+            raise PipeDeserializingError(e)
+
+    def _load_frame(self, frame_type, data):
+        """ Turns a received frame back into an object. """
+        if frame_type in (FRAME_BYTES, FRAME_FILE):
+            return data
+        if frame_type == FRAME_TRACED:
+            trace, frame_type, data = self._split_trace(data)
+            start = monotonic()
+            obj = self._load_frame(frame_type, data)
+            trace.deserialize_time = monotonic() - start
+            self._report_trace(trace)
+            return obj
+        if frame_type == FRAME_ENVELOPE:
+            _, data = self._split_envelope(data)
+        elif frame_type != FRAME_OBJECT:
+            raise PipeDeserializingError(ValueError('Unknown frame type %d.' % frame_type))
+        return self._load_payload(data)
+
+    def _load_payload(self, data):
+        if not data:
+            raise PipeDeserializingError(ValueError('Object cannot be zero width.'))
+        try:
+            return self._serializer.loads(data)
+        except Exception as e:
+            raise PipeDeserializingError(e)
+
+    def _unread_bytes(self, data):
+        """ Puts bytes back at the front of the read buffer. """
+        if data:
+            self._buffer = data + self._buffer
+
     def _read_bytes(self, n, timeout=None):
         if len(self._buffer) > n:
             buffer = self._buffer[:n]
@@ -222,17 +1253,61 @@ class BaseSerializingPipe(object):
         with Timeout(timeout) as t:
             while len(buffer) < n:
                 try:
-                    events = self._selector.select(t.remaining)
-                    if events:
-                        _, event = events[0]
-                        if event & selectors2.EVENT_READ:
-                            buffer += self._sock.recv(n - len(buffer))
-                    if t.timed_out:
+                    data = self._sock.recv(n - len(buffer))
+                except (OSError, socket.error) as e:
+                    if e.errno not in _ASYNC_BLOCKING_ERRNOS:
+                        raise
+                    if t.timed_out or not self._wait_readable(t.remaining):
                         break
-                except selectors2.SelectorError:
-                    return buffer  # Skip coverage.
+                    continue
+                if not data:
+                    self.close()
+                    raise PipeClosed()
+                buffer += data
         return buffer
 
+    def _write_bytes(self, buffers, timeout=None):
+        """ Writes the buffers to the non-blocking socket, waiting up to
+        the timeout each time for the socket to become writable.
+        Returns the number of bytes that were written. """
+        views = collections.deque(_byte_view(buffer) for buffer in buffers if len(buffer))
+        total = 0
+        while views:
+            try:
+                if _HAS_SENDMSG and len(views) > 1:
+                    sent = self._sock.sendmsg(views)
+                else:
+                    sent = self._sock.send(views[0])
+            except (OSError, socket.error) as e:
+                if e.errno not in _ASYNC_BLOCKING_ERRNOS:
+                    raise
+                sent = 0
+            total += sent
+            remaining = sent
+            while remaining and remaining >= len(views[0]):
+                remaining -= len(views.popleft())
+            if remaining:
+                views[0] = views[0][remaining:]
+            if views and not sent and not self._wait_writable(timeout):
+                break
+        return total
+
+    def _wait_readable(self, timeout):
+        # Frames the peer may be waiting for shouldn't linger
+        # while this end is waiting for the peer.
+        if self._pending:
+            self._flush_due()
+        if self._selector is None:
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._sock, selectors.EVENT_READ)
+        return bool(self._selector.select(timeout))
+
+    def _wait_writable(self, timeout):
+        if self._write_selector is None:
+            self._write_selector = selectors.DefaultSelector()
+            self._write_selector.register(self._sock, selectors.EVENT_WRITE)
+        return bool(self._write_selector.select(timeout))
+
 
 def make_pipe_pair(pipe_type, *args, **kwargs):
     """
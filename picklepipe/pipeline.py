@@ -0,0 +1,181 @@
+import collections
+
+from .pipe import (FRAME_OBJECT,
+                   PipeClosed,
+                   PipeError,
+                   PipeTimeout,
+                   PipeSerializingError,
+                   PipeDeserializingError)
+from .timeout import Timeout, monotonic
+
+__all__ = [
+    'PipelinedPipe'
+]
+
+# Default number of objects that may be serializing
+# or deserializing in the executor at once.
+DEFAULT_MAX_PENDING = 64
+
+
+def _dumps(serializer, obj):
+    start = monotonic()
+    data = serializer.dumps(obj)
+    return data, monotonic() - start
+
+
+def _loads(serializer, data):
+    return serializer.loads(data)
+
+
+class _Loaded(object):
+    """ Stands in for a future of a frame that was loaded inline. """
+    def __init__(self, pipe, frame_type, data):
+        self._error = None
+        self._obj = None
+        try:
+            self._obj = pipe._load_frame(frame_type, data)
+        except PipeError as e:
+            self._error = e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._obj
+
+
+class _Failed(object):
+    """ Stands in for a future of a frame that couldn't be read
+    ahead so the error is raised in order with the other objects. """
+    def __init__(self, error):
+        self._error = error
+
+    def result(self):
+        raise self._error
+
+
+class PipelinedPipe(object):
+    """ Wraps a :class:`picklepipe.BaseSerializingPipe` and runs
+    serialization of outgoing objects and deserialization of received
+    frames in an executor such as a ``concurrent.futures.ThreadPoolExecutor``
+    or ``ProcessPoolExecutor``. Frames are still written and objects are
+    still returned strictly in the order they were sent.
+
+    When using a process pool the pipe's serializer is pickled and sent
+    to the worker processes along with each object. """
+    def __init__(self, pipe, executor, max_pending=DEFAULT_MAX_PENDING):
+        """
+        Creates a :class:`picklepipe.PipelinedPipe` wrapping a pipe.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` to wrap.
+        :param executor: Executor implementing ``.submit(fn, *args)``.
+        :param int max_pending:
+            Maximum number of objects serializing or deserializing at once.
+        """
+        if max_pending <= 0:
+            raise ValueError('max_pending must be positive.')
+        self._pipe = pipe
+        self._executor = executor
+        self._max_pending = max_pending
+        self._sending = collections.deque()
+        self._receiving = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def closed(self):
+        """ Attribute is True if the wrapped pipe is closed. """
+        return self._pipe.closed
+
+    @property
+    def pending(self):
+        """ Number of objects queued for sending that aren't written yet. """
+        return len(self._sending)
+
+    def close(self):
+        """ Closes the wrapped pipe without flushing queued objects. """
+        self._pipe.close()
+
+    def fileno(self):
+        """ Returns the file descriptor of the wrapped pipe. """
+        return self._pipe.fileno()
+
+    def send_object(self, obj):
+        """ Queues an object to be serialized in the executor. Objects
+        that have finished serializing are written in the order they were
+        queued. Blocks only if ``max_pending`` objects are already queued.
+
+        :param obj: Object to send to the peer.
+        :raises: :class:`picklepipe.PipeSerializingError` if any queued object
+            that is being written can't be serialized.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        self._sending.append((obj, self._executor.submit(_dumps, self._pipe._serializer, obj)))
+        while self._sending and (len(self._sending) > self._max_pending or
+                                 self._sending[0][1].done()):
+            self._write_next()
+
+    def flush(self):
+        """ Waits for every queued object to serialize and writes them.
+
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        while self._sending:
+            self._write_next()
+
+    def recv_object(self, timeout=None):
+        """ Receives an object from the peer. Frames that have already
+        arrived are read ahead and deserialized in the executor.
+
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: Object received from the peer.
+        :raises: :class:`picklepipe.PipeTimeout` if no object arrived in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        if not self._receiving:
+            if self._pipe.closed:
+                raise PipeClosed()
+            with Timeout(timeout) as t:
+                if not self._pipe.poll_handshake(t.remaining):
+                    raise PipeTimeout()
+                self._submit_frame(*self._pipe._recv_frame(t))
+        self._read_ahead()
+
+        future = self._receiving.popleft()
+        try:
+            return future.result()
+        except PipeError:
+            raise
+        except Exception as e:
+            raise PipeDeserializingError(e)
+
+    def _write_next(self):
+        obj, future = self._sending.popleft()
+        try:
+            data, elapsed = future.result()
+        except Exception as e:
+            raise PipeSerializingError(e)
+        self._pipe._record_dumps(obj, len(data), elapsed)
+        self._pipe._send_frame(FRAME_OBJECT, data)
+
+    def _read_ahead(self):
+        """ Submits frames that can be read without waiting. Errors are
+        queued behind the objects that were read before them. """
+        with Timeout(0.0) as t:
+            while len(self._receiving) < self._max_pending and not self._pipe.closed:
+                try:
+                    self._submit_frame(*self._pipe._recv_frame(t))
+                except PipeTimeout:
+                    return
+                except PipeError as e:
+                    self._receiving.append(_Failed(e))
+
+    def _submit_frame(self, frame_type, data):
+        if frame_type == FRAME_OBJECT and data:
+            future = self._executor.submit(_loads, self._pipe._serializer, data)
+        else:
+            future = _Loaded(self._pipe, frame_type, data)
+        self._receiving.append(future)
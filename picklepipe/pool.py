@@ -0,0 +1,173 @@
+import socket
+import threading
+import collections
+import contextlib
+
+from .pipe import (DEFAULT_HANDSHAKE_TIMEOUT,
+                   PipeClosed)
+from .timeout import monotonic
+
+__all__ = [
+    'PipePool'
+]
+
+
+class PipePool(object):
+    """ Keeps warm pipes for each endpoint so that short-lived jobs
+    don't pay for a new connection and protocol handshake every time. """
+    def __init__(self, pipe_type, max_idle=8, idle_timeout=60.0,
+                 connect_timeout=None, **kwargs):
+        """
+        Creates a :class:`picklepipe.PipePool` instance.
+
+        :param type pipe_type: Type of pipe to create for each connection.
+        :param int max_idle: Maximum number of idle pipes kept per endpoint.
+        :param float idle_timeout:
+            Number of seconds a pipe may stay idle before it is evicted.
+            ``None`` means idle pipes are never evicted.
+        :param float connect_timeout: Number of seconds to wait when connecting.
+        :param kwargs: Key-word arguments to pass to the pipes init.
+        """
+        self._pipe_type = pipe_type
+        self._max_idle = max_idle
+        self._idle_timeout = idle_timeout
+        self._connect_timeout = connect_timeout
+        self._kwargs = kwargs
+
+        self._lock = threading.Lock()
+        self._idle = {}  # address -> deque of (pipe, released_at)
+        self._in_use = {}  # pipe -> address
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def acquire(self, address):
+        """ Returns a healthy idle pipe connected to the address
+        or creates a new one if there are none available.
+
+        :param tuple address: Address of the endpoint.
+        :return: Pipe instance connected to the endpoint.
+        :raises: :class:`picklepipe.PipeClosed` if a connection can't be made.
+        """
+        if self._closed:
+            raise PipeClosed()
+        evicted = []
+        pipe = None
+        with self._lock:
+            idle = self._idle.get(address)
+            now = monotonic()
+            while idle:
+                candidate, released_at = idle.pop()
+                if self._is_expired(released_at, now) or not candidate.is_healthy():
+                    evicted.append(candidate)
+                    continue
+                pipe = candidate
+                break
+        for stale in evicted:
+            stale.close()
+        if pipe is None:
+            pipe = self._connect(address)
+        with self._lock:
+            self._in_use[pipe] = address
+        return pipe
+
+    def release(self, pipe):
+        """ Returns a pipe acquired from the pool so that it can be reused.
+        Pipes that are closed, unhealthy or beyond ``max_idle`` are closed.
+
+        :param pipe: Pipe previously returned by :meth:`picklepipe.PipePool.acquire`.
+        """
+        with self._lock:
+            address = self._in_use.pop(pipe, None)
+            if (address is not None and not self._closed and
+                    pipe.is_healthy()):
+                idle = self._idle.setdefault(address, collections.deque())
+                if len(idle) < self._max_idle:
+                    idle.append((pipe, monotonic()))
+                    return
+        pipe.close()
+
+    @contextlib.contextmanager
+    def connection(self, address):
+        """ Context manager that acquires a pipe and releases it
+        on exit. The pipe is closed instead if an exception occurs.
+
+        :param tuple address: Address of the endpoint.
+        """
+        pipe = self.acquire(address)
+        try:
+            yield pipe
+        except Exception:
+            with self._lock:
+                self._in_use.pop(pipe, None)
+            pipe.close()
+            raise
+        else:
+            self.release(pipe)
+
+    def warm(self, address, count):
+        """ Opens pipes to an endpoint ahead of time until
+        ``count`` idle pipes are available for it.
+
+        :param tuple address: Address of the endpoint.
+        :param int count: Number of idle pipes to keep ready.
+        """
+        missing = min(count, self._max_idle) - self.idle_count(address)
+        for _ in range(missing):
+            pipe = self._connect(address)
+            pipe.poll_handshake(self._connect_timeout or DEFAULT_HANDSHAKE_TIMEOUT)
+            with self._lock:
+                self._in_use[pipe] = address
+            self.release(pipe)
+
+    def idle_count(self, address):
+        """ Number of idle pipes currently kept for an endpoint. """
+        with self._lock:
+            return len(self._idle.get(address, ()))
+
+    def evict_idle(self):
+        """ Closes all idle pipes which have expired or are no longer healthy.
+
+        :return: Number of pipes that were evicted.
+        """
+        evicted = []
+        now = monotonic()
+        with self._lock:
+            for address, idle in list(self._idle.items()):
+                keep = collections.deque()
+                for pipe, released_at in idle:
+                    if self._is_expired(released_at, now) or not pipe.is_healthy():
+                        evicted.append(pipe)
+                    else:
+                        keep.append((pipe, released_at))
+                if keep:
+                    self._idle[address] = keep
+                else:
+                    del self._idle[address]
+        for pipe in evicted:
+            pipe.close()
+        return len(evicted)
+
+    def close(self):
+        """ Closes all idle pipes. Pipes that are in use are
+        closed when they are released back to the pool. """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, {}
+        for pipes in idle.values():
+            for pipe, _ in pipes:
+                pipe.close()
+
+    def _connect(self, address):
+        try:
+            sock = socket.create_connection(address, self._connect_timeout)
+        except (OSError, socket.error):
+            raise PipeClosed()
+        return self._pipe_type(sock, **self._kwargs)
+
+    def _is_expired(self, released_at, now):
+        return self._idle_timeout is not None and now - released_at > self._idle_timeout
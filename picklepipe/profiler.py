@@ -0,0 +1,234 @@
+import io
+import pickle
+import threading
+import collections
+try:
+    import copyreg
+except ImportError:  # Skip coverage.
+    import copy_reg as copyreg
+
+from .timeout import monotonic
+
+__all__ = [
+    'PayloadProfiler'
+]
+
+# Default number of objects that are counted for every object that is sampled.
+DEFAULT_SAMPLE_EVERY = 100
+
+# The pure Python pickler can be extended to record every object it saves.
+_PyPickler = getattr(pickle, '_Pickler', pickle.Pickler)
+
+
+def _type_name(obj):
+    cls = type(obj)
+    name = getattr(cls, '__qualname__', cls.__name__)
+    if cls.__module__ in ('builtins', '__builtin__'):
+        return name
+    return '%s.%s' % (cls.__module__, name)
+
+
+def _add(stats, key, size, elapsed):
+    entry = stats.get(key)
+    if entry is None:
+        entry = stats[key] = {'bytes': 0, 'dumps_time': 0.0}
+    entry['bytes'] += size
+    entry['dumps_time'] += elapsed
+
+
+class _Frame(object):
+    __slots__ = ['path', 'children', 'child_size', 'child_time']
+
+    def __init__(self, path, children):
+        self.path = path
+        self.children = children
+        self.child_size = 0
+        self.child_time = 0.0
+
+
+class _RecordingPickler(_PyPickler):
+    """ Pickler that records the bytes written and time spent
+    for every object it saves, excluding the objects inside it. """
+    def __init__(self, output, protocol, dispatch_table=None, reducer_override=None):
+        _PyPickler.__init__(self, output, protocol)
+        self._output = output
+        if dispatch_table:
+            table = dict(copyreg.dispatch_table)
+            table.update(dispatch_table)
+            self.dispatch_table = table
+        if reducer_override is not None:
+            self.reducer_override = reducer_override
+        self._frames = []
+        self._attribute_dicts = set()
+        self.records = []  # (type name, path, bytes, seconds)
+
+    def save(self, obj, *args):
+        parent = self._frames[-1] if self._frames else None
+        path = ''
+        if parent is not None:
+            path = parent.path
+            children = parent.children
+            if children and children[0][0] == id(obj):
+                path += children.popleft()[1]
+        frame = _Frame(path, self._child_paths(obj))
+        self._frames.append(frame)
+        start_position = self._position()
+        start = monotonic()
+        try:
+            _PyPickler.save(self, obj, *args)
+        finally:
+            self._frames.pop()
+        elapsed = monotonic() - start
+        size = self._position() - start_position
+        if parent is not None:
+            parent.child_size += size
+            parent.child_time += elapsed
+        self.records.append((_type_name(obj), path or '.', size - frame.child_size,
+                             elapsed - frame.child_time))
+
+    def _position(self):
+        position = self._output.tell()
+        current_frame = getattr(getattr(self, 'framer', None), 'current_frame', None)
+        if current_frame is not None:
+            position += current_frame.tell()
+        return position
+
+    def _child_paths(self, obj):
+        """ Returns the ids and path suffixes of the objects inside an object
+        in the order the pickler saves them. The same object can be inside
+        an object more than once so paths are matched by position rather
+        than by id alone. Items of sequences and sets share a path so
+        they're added together, dict keys have the path of their dict. """
+        children = collections.deque()
+        if isinstance(obj, dict):
+            path = '.%s' if id(obj) in self._attribute_dicts else '[%r]'
+            for key, value in obj.items():
+                children.append((id(key), ''))
+                children.append((id(value), path % (key,)))
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            children.extend((id(item), '[*]') for item in obj)
+        else:
+            # The object's attributes are saved from its state dict.
+            state = getattr(obj, '__dict__', None)
+            if isinstance(state, dict) and not isinstance(obj, type):
+                self._attribute_dicts.add(id(state))
+        return children
+
+
+class PayloadProfiler(object):
+    """ Attributes the bytes and ``dumps`` time of objects sent on
+    :class:`picklepipe.PicklePipe` instances to object types and attribute
+    paths, see :meth:`picklepipe.PicklePipe.set_profiler`.
+
+    Every object sent is counted by its type. Every ``sample_every``-th
+    object is pickled again with a recording pickler that attributes its
+    bytes to the types and paths of the objects inside it. The recording
+    pickler is slow so the time it measures is scaled to the time the
+    pipe actually spent serializing the sampled object. A profiler can be
+    shared by several pipes. """
+    def __init__(self, sample_every=DEFAULT_SAMPLE_EVERY):
+        """
+        Creates a :class:`picklepipe.PayloadProfiler` instance.
+
+        :param int sample_every:
+            Number of objects counted for every object that is sampled.
+            Use ``1`` to sample every object.
+        """
+        if sample_every <= 0:
+            raise ValueError('sample_every must be positive.')
+        self._sample_every = sample_every
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Discards everything that has been recorded. """
+        with self._lock:
+            self._objects = 0
+            self._bytes = 0
+            self._dumps_time = 0.0
+            self._types = {}
+            self._sampled_objects = 0
+            self._sampled_bytes = 0
+            self._nested_types = {}
+            self._paths = {}
+
+    def report(self):
+        """ Returns what has been recorded as a dict with:
+
+        * ``objects``, ``bytes`` and ``dumps_time`` of every object sent.
+        * ``types`` with the ``objects``, ``bytes`` and ``dumps_time``
+          of the objects sent by their type.
+        * ``sampled_objects`` and ``sampled_bytes`` of the sampled objects.
+        * ``nested_types`` and ``paths`` with the ``bytes`` and ``dumps_time``
+          of the sampled objects by the type and by the path of the objects
+          inside them, not counting objects inside those. Paths look like
+          ``.items[*]['name']``, items of sequences and sets share a path.
+
+        :return: Dict of what has been recorded.
+        """
+        with self._lock:
+            return {'objects': self._objects,
+                    'bytes': self._bytes,
+                    'dumps_time': self._dumps_time,
+                    'types': dict((key, dict(value)) for key, value in self._types.items()),
+                    'sampled_objects': self._sampled_objects,
+                    'sampled_bytes': self._sampled_bytes,
+                    'nested_types': dict((key, dict(value))
+                                         for key, value in self._nested_types.items()),
+                    'paths': dict((key, dict(value)) for key, value in self._paths.items())}
+
+    def format_report(self, limit=10):
+        """ Returns the report as text with the types and paths
+        that have the most bytes first.
+
+        :param int limit: Number of rows of each table.
+        :return: Report as text.
+        """
+        report = self.report()
+        lines = ['%d objects, %d bytes, %.6f s dumps, %d sampled' % (
+            report['objects'], report['bytes'], report['dumps_time'],
+            report['sampled_objects'])]
+        for title, key in (('Sent types', 'types'),
+                           ('Nested types', 'nested_types'),
+                           ('Paths', 'paths')):
+            lines.append('')
+            lines.append('%-50s %12s %12s' % (title, 'bytes', 'dumps_time'))
+            rows = sorted(report[key].items(), key=lambda item: -item[1]['bytes'])
+            for name, stats in rows[:limit]:
+                lines.append('%-50s %12d %12.6f' % (name, stats['bytes'], stats['dumps_time']))
+        return '\n'.join(lines)
+
+    def _record(self, obj, size, elapsed, protocol, dispatch_table=None, reducer_override=None):
+        """ Records an object that a pipe spent some
+        time serializing into a number of bytes. """
+        with self._lock:
+            sample = self._objects % self._sample_every == 0
+            self._objects += 1
+            self._bytes += size
+            self._dumps_time += elapsed
+            entry = self._types.get(_type_name(obj))
+            if entry is None:
+                entry = self._types[_type_name(obj)] = {'objects': 0, 'bytes': 0,
+                                                        'dumps_time': 0.0}
+            entry['objects'] += 1
+            entry['bytes'] += size
+            entry['dumps_time'] += elapsed
+        if not sample:
+            return
+
+        output = io.BytesIO()
+        pickler = _RecordingPickler(output, protocol, dispatch_table, reducer_override)
+        try:
+            pickler.dump(obj)
+        except Exception:
+            # The object was serialized by the pipe so this
+            # only happens for reducers the pickler can't use.
+            return
+        recorded_time = sum(record[3] for record in pickler.records)
+        scale = elapsed / recorded_time if recorded_time > 0 else 0.0
+        with self._lock:
+            self._sampled_objects += 1
+            self._sampled_bytes += size
+            for type_name, path, record_size, record_time in pickler.records:
+                _add(self._nested_types, type_name, record_size, record_time * scale)
+                _add(self._paths, path, record_size, record_time * scale)
@@ -0,0 +1,297 @@
+import os
+import struct
+import collections
+
+from .pipe import (FRAME_SESSION,
+                   FRAME_SEQ,
+                   FRAME_ACK,
+                   PipeClosed,
+                   PipeTimeout,
+                   PipeSessionLost,
+                   PipeDeserializingError)
+from .timeout import Timeout
+
+__all__ = [
+    'ResumablePipe'
+]
+
+# Default number of sent frames kept until the peer acknowledges them.
+DEFAULT_MAX_REPLAY = 1024
+
+# Hello is the session ID, the sequence number of the next frame that the
+# sender expects to receive and flags. It's the first frame on every pipe.
+_HELLO = struct.Struct('>16sQB')
+_HELLO_RESUME = 0x1
+# Every frame carries its sequence number and the frame type of its payload.
+_SEQ = struct.Struct('>QB')
+# Acknowledgement is the sequence number of the next expected frame.
+_ACK = struct.Struct('>Q')
+
+
+class ResumablePipe(object):
+    """ Wraps a :class:`picklepipe.BaseSerializingPipe` in a session that
+    survives the connection being lost. Every frame is numbered and kept
+    in a bounded replay buffer until the peer acknowledges it. After
+    reconnecting, :meth:`resume` continues the session on the new pipe
+    and sends again every frame the peer hasn't received.
+
+    While the connection is lost objects are still accepted into the
+    replay buffer until it's full. The side that accepts connections
+    should use :meth:`accept` to match new pipes with their session. """
+    def __init__(self, pipe, max_replay=DEFAULT_MAX_REPLAY, session_id=None):
+        """
+        Creates a :class:`picklepipe.ResumablePipe` starting a new session.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` to wrap.
+        :param int max_replay:
+            Maximum number of sent frames kept until the peer acknowledges
+            them. Sending waits for acknowledgements once it's full.
+        :param bytes session_id: 16 byte session ID, random if not given.
+        """
+        if max_replay <= 0:
+            raise ValueError('max_replay must be positive.')
+        if session_id is None:
+            session_id = os.urandom(16)
+        if len(session_id) != 16:
+            raise ValueError('session_id must be 16 bytes.')
+        self._session_id = session_id
+        self._max_replay = max_replay
+        self._ack_interval = max(1, max_replay // 2)
+        self._replay = collections.deque()  # (seq, frame_type, data)
+        self._received = collections.deque()
+        self._send_seq = 0
+        self._recv_seq = 0
+        self._unacked = 0
+        self._pipe = None
+        self._broken = False
+        self._attach(pipe)
+
+    @classmethod
+    def accept(cls, pipe, sessions, timeout=None, **kwargs):
+        """ Reads the session ID from a newly accepted pipe and either
+        resumes the existing session or starts a new one.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` that was accepted.
+        :param dict sessions:
+            Sessions by session ID, new sessions are added to it.
+        :param float timeout: Number of seconds to wait for the session ID.
+        :param kwargs: Key-word arguments for a new :class:`picklepipe.ResumablePipe`.
+        :return: :class:`picklepipe.ResumablePipe` that the pipe belongs to.
+        :raises: :class:`picklepipe.PipeSessionLost` if the peer is resuming
+            a session that isn't in ``sessions``.
+        :raises: :class:`picklepipe.PipeTimeout` if the session ID doesn't arrive in time.
+        """
+        session_id, peer_next, flags = _recv_hello(pipe, timeout)
+        session = sessions.get(session_id)
+        if (session is None) == bool(flags & _HELLO_RESUME):
+            pipe.close()
+            raise PipeSessionLost()
+        if session is None:
+            session = sessions[session_id] = cls(pipe, session_id=session_id, **kwargs)
+        else:
+            session._attach(pipe, resume=True)
+            session._resume_from(peer_next)
+        return session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def session_id(self):
+        """ 16 byte ID of the session. """
+        return self._session_id
+
+    @property
+    def pending(self):
+        """ Number of sent frames that the peer hasn't acknowledged. """
+        return len(self._replay)
+
+    @property
+    def disconnected(self):
+        """ Attribute is True if the connection was lost and
+        the session is waiting to be resumed. """
+        return self._broken or self._pipe.closed
+
+    @property
+    def closed(self):
+        """ Attribute is True if the wrapped pipe is closed. """
+        return self._pipe.closed
+
+    def close(self):
+        """ Closes the wrapped pipe. The session can still be resumed. """
+        self._pipe.close()
+
+    def fileno(self):
+        """ Returns the file descriptor of the wrapped pipe. """
+        return self._pipe.fileno()
+
+    def resume(self, pipe, timeout=None):
+        """ Continues the session on a newly connected pipe. Frames that
+        the peer hasn't received are sent again in order.
+
+        :param pipe: :class:`picklepipe.BaseSerializingPipe` connected to the peer.
+        :param float timeout: Number of seconds to wait for the peer's session ID.
+        :raises: :class:`picklepipe.PipeSessionLost` if the peer doesn't have
+            the same session or is missing frames that were already acknowledged.
+        :raises: :class:`picklepipe.PipeTimeout` if the peer's session ID doesn't arrive in time.
+        :raises: :class:`picklepipe.PipeClosed` if the other end of the pipe is closed.
+        """
+        self._attach(pipe, resume=True)
+        session_id, peer_next, flags = _recv_hello(pipe, timeout)
+        if session_id != self._session_id or not flags & _HELLO_RESUME:
+            pipe.close()
+            raise PipeSessionLost()
+        self._resume_from(peer_next)
+
+    def send_object(self, obj):
+        """ Serializes and sends an object to the peer. The object is
+        kept for replay until the peer acknowledges it. If the connection
+        is lost the object is sent once the session is resumed.
+
+        :param obj: Object to send to the peer.
+        :raises: :class:`picklepipe.PipeTimeout` if the replay buffer stays full.
+        :raises: :class:`picklepipe.PipeClosed` if the connection is lost and
+            the replay buffer is full.
+        """
+        self._wait_for_room()
+        pipe = self._pipe
+        if not self._broken:
+            try:
+                pipe._poll_protocol(0.0)
+            except PipeClosed:
+                self._broken = True
+        frame_type, data = pipe._encode_object(obj)
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        frame = (self._send_seq, frame_type, data)
+        self._send_seq += 1
+        self._replay.append(frame)
+        if not self._broken:
+            try:
+                self._write(frame)
+            except PipeClosed:
+                self._broken = True
+
+    def recv_object(self, timeout=None):
+        """ Receives an object from the peer.
+
+        :param float timeout: Number of seconds to wait before timing out.
+        :return: Object received from the peer.
+        :raises: :class:`picklepipe.PipeTimeout` if no object arrived in time.
+        :raises: :class:`picklepipe.PipeClosed` if the connection is lost.
+        """
+        # Acknowledge everything received once there's nothing
+        # left to read so that the peer can drop its replay buffer.
+        if not self._received and self._unacked:
+            self._send_ack()
+        with Timeout(timeout) as t:
+            while not self._received:
+                self._read(t)
+        frame_type, data = self._received.popleft()
+        return self._pipe._load_frame(frame_type, data)
+
+    def _attach(self, pipe, resume=False):
+        if self._pipe is not None and self._pipe is not pipe:
+            self._pipe.close()
+        self._pipe = pipe
+        self._broken = False
+        self._unacked = 0
+        pipe._send_frame(FRAME_SESSION, _HELLO.pack(self._session_id, self._recv_seq,
+                                                    _HELLO_RESUME if resume else 0))
+
+    def _resume_from(self, peer_next):
+        """ Drops frames the peer has received and sends the rest again. """
+        self._ack(peer_next)
+        first = self._replay[0][0] if self._replay else self._send_seq
+        if first != peer_next:
+            self._pipe.close()
+            raise PipeSessionLost()
+        try:
+            for frame in self._replay:
+                self._write(frame)
+        except PipeClosed:
+            self._broken = True
+            raise
+
+    def _wait_for_room(self):
+        if len(self._replay) < self._max_replay:
+            return
+        if self._broken or self._pipe.closed:
+            raise PipeClosed()
+        with Timeout(self._pipe.send_timeout) as t:
+            while len(self._replay) >= self._max_replay:
+                # The peer may be waiting on acknowledgements as well.
+                if self._unacked:
+                    self._send_ack()
+                self._read(t)
+
+    def _write(self, frame):
+        seq, frame_type, data = frame
+        self._pipe._send_frame(FRAME_SEQ, _SEQ.pack(seq, frame_type) + data)
+
+    def _send_ack(self):
+        self._unacked = 0
+        try:
+            self._pipe._send_frame(FRAME_ACK, _ACK.pack(self._recv_seq))
+        except PipeClosed:
+            self._broken = True
+            raise
+
+    def _ack(self, next_seq):
+        if next_seq > self._send_seq:
+            raise PipeSessionLost()
+        while self._replay and self._replay[0][0] < next_seq:
+            self._replay.popleft()
+
+    def _read(self, t):
+        """ Reads one frame from the peer and handles it. """
+        if self._broken:
+            raise PipeClosed()
+        pipe = self._pipe
+        try:
+            if not pipe.poll_handshake(t.remaining):
+                raise PipeTimeout()
+            frame_type, data = pipe._recv_frame(t)
+        except PipeClosed:
+            self._broken = True
+            raise
+        try:
+            if frame_type == FRAME_SEQ:
+                seq, inner_type = _SEQ.unpack_from(data)
+                if seq > self._recv_seq:
+                    raise PipeSessionLost()
+                if seq < self._recv_seq:
+                    return  # Already received before the session was resumed.
+                self._recv_seq += 1
+                self._received.append((inner_type, data[_SEQ.size:]))
+                self._unacked += 1
+                if self._unacked >= self._ack_interval:
+                    self._send_ack()
+            elif frame_type == FRAME_ACK:
+                self._ack(_ACK.unpack(data)[0])
+            elif frame_type == FRAME_SESSION:
+                session_id, peer_next, _ = _HELLO.unpack(data)
+                if session_id != self._session_id:
+                    raise PipeSessionLost()
+                self._ack(peer_next)
+            else:
+                raise PipeDeserializingError(ValueError('Unknown frame type %d.' % frame_type))
+        except struct.error as e:
+            raise PipeDeserializingError(e)
+
+
+def _recv_hello(pipe, timeout):
+    with Timeout(timeout) as t:
+        if not pipe.poll_handshake(t.remaining):
+            raise PipeTimeout()
+        frame_type, data = pipe._recv_frame(t)
+    try:
+        if frame_type != FRAME_SESSION:
+            raise ValueError('Expected the session ID.')
+        return _HELLO.unpack(data)
+    except (ValueError, struct.error) as e:
+        pipe.close()
+        raise PipeDeserializingError(e)
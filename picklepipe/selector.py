@@ -0,0 +1,15 @@
+# Use the selectors module on Python 3.4+ and
+# only fall back to the selectors2 backport before that.
+try:
+    import selectors
+except ImportError:  # Skip coverage.
+    import selectors2 as selectors
+
+__all__ = [
+    'selectors',
+    'SelectorError'
+]
+
+# selectors2 raises its own error type while the
+# selectors module raises OSError from the system call.
+SelectorError = getattr(selectors, 'SelectorError', OSError)
@@ -0,0 +1,230 @@
+import collections
+import random
+import socket
+import threading
+import time
+
+from .selector import selectors
+from .socketpair import socketpair
+from .timeout import monotonic
+
+__all__ = [
+    'LinkShape',
+    'make_shaped_socketpair',
+    'make_shaped_pipe_pair'
+]
+
+# Default number of bytes a link holds in flight in each direction.
+DEFAULT_BUFFER_SIZE = 0x10000
+
+
+class LinkShape(object):
+    """ Describes the network conditions of a simulated link for
+    :func:`picklepipe.make_shaped_socketpair`. Chunk sizes, jitter and
+    stalls are drawn from a random generator seeded with ``seed`` in the
+    order bytes are sent, so the same seed shapes the same byte stream
+    in the same way. """
+    def __init__(self, latency=0.0, jitter=0.0, bandwidth=None, max_chunk=None,
+                 stall_rate=0.0, stall_time=0.0, buffer_size=DEFAULT_BUFFER_SIZE, seed=0):
+        """
+        Creates a :class:`picklepipe.LinkShape` instance.
+
+        :param float latency: Seconds every chunk is delayed by in each direction.
+        :param float jitter: Up to this many seconds are added to the latency of a chunk.
+        :param int bandwidth: Bytes per second in each direction or ``None`` for no limit.
+        :param int max_chunk:
+            Bytes are delivered in chunks of 1 to ``max_chunk`` bytes
+            so the peer sees short reads. ``None`` delivers the bytes
+            in the chunks they were read from the sender.
+        :param float stall_rate: Probability of the link stalling before a chunk.
+        :param float stall_time: Seconds the link stalls for.
+        :param int buffer_size:
+            Bytes held in flight in each direction before the
+            sender's writes are cut short or have to wait.
+        :param seed: Seed for the random generator of each direction.
+        """
+        if latency < 0 or jitter < 0 or stall_time < 0:
+            raise ValueError('latency, jitter and stall_time cannot be negative.')
+        if bandwidth is not None and bandwidth <= 0:
+            raise ValueError('bandwidth must be positive.')
+        if max_chunk is not None and max_chunk <= 0:
+            raise ValueError('max_chunk must be positive.')
+        if not 0.0 <= stall_rate <= 1.0:
+            raise ValueError('stall_rate must be between 0.0 and 1.0.')
+        if buffer_size <= 0:
+            raise ValueError('buffer_size must be positive.')
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.max_chunk = max_chunk
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.buffer_size = buffer_size
+        self.seed = seed
+
+    def __repr__(self):
+        return ('<LinkShape latency=%r jitter=%r bandwidth=%r max_chunk=%r '
+                'stall_rate=%r seed=%r>' % (self.latency, self.jitter, self.bandwidth,
+                                            self.max_chunk, self.stall_rate, self.seed))
+
+
+class _Schedule(object):
+    """ Splits the bytes sent in one direction into chunks
+    and decides when each chunk is delivered to the peer. """
+    def __init__(self, shape, seed):
+        self._shape = shape
+        self._random = random.Random(seed)
+        self._chunk_left = 0
+        self._delay = 0.0
+        self._link_free = 0.0
+        self._last_delivery = 0.0
+
+    def split(self, data, now):
+        """ Returns a list of ``(deliver_at, chunk)`` for bytes read at a time. """
+        shape = self._shape
+        chunks = []
+        while data:
+            if not self._chunk_left:
+                self._next_chunk(now)
+            if shape.max_chunk is None:
+                chunk, data = data, b''
+                self._chunk_left = 0
+            else:
+                chunk, data = data[:self._chunk_left], data[self._chunk_left:]
+                self._chunk_left -= len(chunk)
+            start = max(now, self._link_free)
+            if shape.bandwidth is not None:
+                start += float(len(chunk)) / shape.bandwidth
+            self._link_free = start
+
+            # TCP doesn't reorder bytes so jitter only ever holds chunks back.
+            self._last_delivery = max(self._last_delivery, start + self._delay)
+            chunks.append((self._last_delivery, chunk))
+        return chunks
+
+    def _next_chunk(self, now):
+        shape = self._shape
+        rng = self._random
+        if shape.max_chunk is not None:
+            self._chunk_left = rng.randint(1, shape.max_chunk)
+        self._delay = shape.latency + rng.random() * shape.jitter
+        if rng.random() < shape.stall_rate:
+            self._link_free = max(now, self._link_free) + shape.stall_time
+
+
+class _Relay(object):
+    """ Thread that forwards bytes from one socket to another on a schedule. """
+    def __init__(self, link, src, dst, schedule):
+        self._link = link
+        self._src = src
+        self._dst = dst
+        self._schedule = schedule
+        self._thread = threading.Thread(target=self._run, name='picklepipe-shaping')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        buffer_size = self._link.shape.buffer_size
+        queue = collections.deque()
+        queued = 0
+        eof = False
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self._src, selectors.EVENT_READ)
+            while True:
+                now = monotonic()
+                while queue and queue[0][0] <= now:
+                    _, chunk = queue.popleft()
+                    queued -= len(chunk)
+                    self._dst.sendall(chunk)
+                    now = monotonic()
+                if eof and not queue:
+                    break
+                wait = max(0.0, queue[0][0] - now) if queue else None
+                if eof or queued >= buffer_size:
+                    time.sleep(wait)
+                    continue
+                if not selector.select(wait):
+                    continue
+                data = self._src.recv(buffer_size - queued)
+                if not data:
+                    eof = True
+                    continue
+                for deliver_at, chunk in self._schedule.split(data, monotonic()):
+                    queue.append((deliver_at, chunk))
+                    queued += len(chunk)
+            self._link.finish(self._dst, socket.SHUT_WR)
+        except (OSError, socket.error, ValueError):
+            # The receiving end is gone, the sender's writes fail from now on
+            # while bytes still queued in the other direction are delivered.
+            self._link.finish(self._src, socket.SHUT_RD)
+            self._link.finish(self._dst, socket.SHUT_RDWR)
+        finally:
+            selector.close()
+            self._link.release()
+
+
+class _ShapedLink(object):
+    """ Two relays connecting a pair of sockets through a shaped link. """
+    def __init__(self, shape):
+        self.shape = shape
+        self._lock = threading.Lock()
+        self._running = 2
+        self._sockets = []
+
+    def connect(self):
+        a, relay_a = socketpair()
+        b, relay_b = socketpair()
+        self._sockets = [relay_a, relay_b]
+        for sock in (a, b, relay_a, relay_b):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.shape.buffer_size)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.shape.buffer_size)
+        _Relay(self, relay_a, relay_b, _Schedule(self.shape, '%r:a' % (self.shape.seed,))).start()
+        _Relay(self, relay_b, relay_a, _Schedule(self.shape, '%r:b' % (self.shape.seed,))).start()
+        return a, b
+
+    def finish(self, sock, how):
+        try:
+            sock.shutdown(how)
+        except (OSError, socket.error):
+            pass
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            if self._running:
+                return
+        for sock in self._sockets:
+            sock.close()
+
+
+def make_shaped_socketpair(shape):
+    """
+    Returns a pair of connected sockets whose bytes travel through a
+    simulated link with the latency, bandwidth, short reads and writes
+    and stalls of a :class:`picklepipe.LinkShape`. Each direction is
+    relayed by a background thread. The sockets are real sockets so they
+    can be wrapped by any pipe type and used with selectors.
+
+    :param shape: :class:`picklepipe.LinkShape` of the link.
+    :return: Tuple with two connected sockets.
+    """
+    return _ShapedLink(shape).connect()
+
+
+def make_shaped_pipe_pair(pipe_type, shape, *args, **kwargs):
+    """
+    Like :func:`picklepipe.make_pipe_pair` but the pipes are connected
+    through a simulated link, see :func:`picklepipe.make_shaped_socketpair`.
+
+    :param type pipe_type: Type of pipe to connect to one another.
+    :param shape: :class:`picklepipe.LinkShape` of the link.
+    :param args: Arguments to pass to the pipes init.
+    :param kwargs: Key-word arguments to pass to the pipes init.
+    :return: Tuple with two connected pipes.
+    """
+    a, b = make_shaped_socketpair(shape)
+    return (pipe_type(a, *args, **kwargs),
+            pipe_type(b, *args, **kwargs))
@@ -0,0 +1,81 @@
+import struct
+
+__all__ = [
+    'FrameTrace'
+]
+
+# Traced frames start with the type of the traced frame, the wall clock
+# time the frame was sent, the seconds spent serializing the object,
+# flags and the length of the trace ID that follows.
+_TRACE_HEADER = struct.Struct('>BddBH')
+_TRACE_TEXT_ID = 0x1
+
+# Received traced frames are kept with the wall clock time their
+# header was read and the seconds spent reading their payload.
+_RECEIVED = struct.Struct('>dd')
+
+
+def _pack_trace(frame_type, sent_at, serialize_time, trace_id):
+    flags = 0
+    if trace_id is None:
+        trace_id = b''
+    elif not isinstance(trace_id, bytes):
+        trace_id = trace_id.encode('utf-8')
+        flags |= _TRACE_TEXT_ID
+    if len(trace_id) > 0xFFFF:
+        raise ValueError('trace_id cannot be longer than 65535 bytes.')
+    return _TRACE_HEADER.pack(frame_type, sent_at, serialize_time,
+                              flags, len(trace_id)) + trace_id
+
+
+def _mark_received(data, received_at, read_time):
+    return _RECEIVED.pack(received_at, read_time) + data
+
+
+def _unpack_trace(data):
+    """ Returns the trace and the type and payload of
+    the traced frame from a received traced frame. """
+    received_at, read_time = _RECEIVED.unpack(data[:_RECEIVED.size])
+    header_end = _RECEIVED.size + _TRACE_HEADER.size
+    (frame_type, sent_at, serialize_time,
+     flags, id_len) = _TRACE_HEADER.unpack(data[_RECEIVED.size:header_end])
+    if header_end + id_len > len(data):
+        raise ValueError('Trace ID is longer than the frame.')
+    trace_id = data[header_end:header_end + id_len] or None
+    if trace_id is not None and flags & _TRACE_TEXT_ID:
+        trace_id = trace_id.decode('utf-8')
+    payload = data[header_end + id_len:]
+    trace = FrameTrace(trace_id, len(payload), sent_at, serialize_time,
+                       received_at - sent_at, read_time)
+    return trace, frame_type, payload
+
+
+class FrameTrace(object):
+    """ Timings of a single traced object that are passed to the callback
+    set with :meth:`picklepipe.BaseSerializingPipe.set_trace_callback`.
+    ``queue_delay`` compares the wall clocks of the sender and receiver
+    so it is only meaningful if their clocks are synchronized. """
+    __slots__ = ['trace_id', 'size', 'sent_at', 'serialize_time',
+                 'queue_delay', 'read_time', 'deserialize_time']
+
+    def __init__(self, trace_id, size, sent_at, serialize_time, queue_delay, read_time):
+        #: Trace ID the object was sent with or ``None``.
+        self.trace_id = trace_id
+        #: Number of bytes of the serialized object.
+        self.size = size
+        #: Wall clock time the sender started writing the frame.
+        self.sent_at = sent_at
+        #: Seconds the sender spent serializing the object.
+        self.serialize_time = serialize_time
+        #: Seconds from sending the frame until the receiver read its header,
+        #: time spent on the network and waiting in socket buffers.
+        self.queue_delay = queue_delay
+        #: Seconds spent reading the frame's payload after its header.
+        self.read_time = read_time
+        #: Seconds spent deserializing the object or ``None``
+        #: if the frame was received without deserializing it.
+        self.deserialize_time = None
+
+    def __repr__(self):
+        return ('<FrameTrace trace_id=%r size=%d queue_delay=%.6f read_time=%.6f>' %
+                (self.trace_id, self.size, self.queue_delay, self.read_time))
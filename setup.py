@@ -28,7 +28,7 @@ if __name__ == '__main__':
         maintainer='Seth Michael Larson',
         maintainer_email='sethmichaellarson@protonmail.com',
         install_requires=['monotonic',
-                          'selectors2'],
+                          'selectors2; python_version < "3.4"'],
         keywords=['picklepipe'],
         packages=['picklepipe'],
         zip_safe=False,
@@ -1,8 +1,12 @@
+import io
+import os
 import socket
 import struct
-import selectors2
+import tempfile
+import threading
 import unittest
 import picklepipe
+from picklepipe.selector import selectors
 
 
 def _safe_close(pipe):
@@ -29,9 +33,9 @@ class BasePipeTestCase(unittest.TestCase):
 
     def patch_default_selector(self):
         from picklepipe import pipe
-        old_default = pipe.selectors2.DefaultSelector
-        self.addCleanup(setattr, pipe.selectors2, 'DefaultSelector', old_default)
-        pipe.selectors2.DefaultSelector = pipe.selectors2.SelectSelector
+        old_default = pipe.selectors.DefaultSelector
+        self.addCleanup(setattr, pipe.selectors, 'DefaultSelector', old_default)
+        pipe.selectors.DefaultSelector = pipe.selectors.SelectSelector
 
     def test_send_single_object(self):
         rd, wr = self.make_pipe_pair()
@@ -53,17 +57,20 @@ class BasePipeTestCase(unittest.TestCase):
 
     def test_only_sent_object_length(self):
         rd, wr = self.make_pipe_pair()
-        rd._buffer = b'\x00\x00\x00\x01'
+        rd._recv_protocol()
+        rd._buffer = b'\x00\x00\x00\x00\x01'
         self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.3)
 
     def test_only_sent_part_of_object_length(self):
         rd, wr = self.make_pipe_pair()
+        rd._recv_protocol()
         rd._buffer = b'\x00\x00\x00'
         self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.3)
 
     def test_only_sent_part_of_object(self):
         rd, wr = self.make_pipe_pair()
-        rd._buffer = struct.pack('>I', 4) + b'\x00\x00\x00'
+        rd._recv_protocol()
+        rd._buffer = struct.pack('>BI', 0, 4) + b'\x00\x00\x00'
         self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.3)
 
     def test_same_protocol(self):
@@ -73,6 +80,8 @@ class BasePipeTestCase(unittest.TestCase):
         wr = self.PIPE_TYPE(w, protocol=2)
         self.addCleanup(wr.close)
 
+        self.assertIs(wr.poll_handshake(timeout=1.0), True)
+        self.assertIs(rd.poll_handshake(timeout=1.0), True)
         self.assertEqual(wr.protocol, 2)
         self.assertEqual(rd.protocol, 2)
 
@@ -83,6 +92,8 @@ class BasePipeTestCase(unittest.TestCase):
         wr = self.PIPE_TYPE(w, protocol=2)
         self.addCleanup(wr.close)
 
+        self.assertIs(wr.poll_handshake(timeout=1.0), True)
+        self.assertIs(rd.poll_handshake(timeout=1.0), True)
         self.assertEqual(wr.protocol, 1)
         self.assertEqual(rd.protocol, 1)
 
@@ -115,7 +126,7 @@ class BasePipeTestCase(unittest.TestCase):
     def test_recv_unpicklable_object(self):
         rd, wr = self.make_pipe_pair()
         rd._recv_protocol()
-        rd._buffer = struct.pack('>I', 6) + b'abc123'
+        rd._buffer = struct.pack('>BI', 0, 6) + b'abc123'
         self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_object, timeout=0.3)
         self.assertIs(rd.closed, False)
 
@@ -189,14 +200,16 @@ class BasePipeTestCase(unittest.TestCase):
 
     def test_pipe_selectable(self):
         rd, wr = self.make_pipe_pair()
-        selector = selectors2.DefaultSelector()
-        selector.register(rd, selectors2.EVENT_READ)
-        selector.register(wr, selectors2.EVENT_WRITE)
+        rd.poll_handshake(timeout=1.0)
+        wr.poll_handshake(timeout=1.0)
+        selector = selectors.DefaultSelector()
+        selector.register(rd, selectors.EVENT_READ)
+        selector.register(wr, selectors.EVENT_WRITE)
 
         events = selector.select(timeout=0.1)
         self.assertEqual(len(events), 1)
         self.assertEqual(events[0][0].fileobj, wr)
-        self.assertEqual(events[0][1], selectors2.EVENT_WRITE)
+        self.assertEqual(events[0][1], selectors.EVENT_WRITE)
 
         wr.send_object('abc')
 
@@ -205,7 +218,7 @@ class BasePipeTestCase(unittest.TestCase):
         index = 1 if events[0][0].fileobj == wr else 0
 
         self.assertEqual(events[index][0].fileobj, rd)
-        self.assertEqual(events[index][1], selectors2.EVENT_READ)
+        self.assertEqual(events[index][1], selectors.EVENT_READ)
 
     def test_pipe_init_max_size(self):
         for size in [0xFFFFFFFF + 1, -1, 'abc']:
@@ -226,7 +239,7 @@ class BasePipeTestCase(unittest.TestCase):
     def test_recv_zero_width_object(self):
         rd, _ = self.make_pipe_pair()
         rd._recv_protocol()
-        rd._buffer = b'\x00\x00\x00\x00'
+        rd._buffer = b'\x00\x00\x00\x00\x00'
         self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_object, timeout=0.3)
         self.assertIs(rd.closed, False)
 
@@ -234,7 +247,7 @@ class BasePipeTestCase(unittest.TestCase):
         rd, _ = self.make_pipe_pair()
         rd._recv_protocol()
         rd.set_max_size(128)
-        rd._buffer = struct.pack('>I', 129) + (b'x' * 129)
+        rd._buffer = struct.pack('>BI', 0, 129) + (b'x' * 129)
         self.assertRaises(picklepipe.PipeObjectTooLargeError, rd.recv_object, timeout=0.3)
         self.assertIs(rd.closed, False)
 
@@ -245,6 +258,489 @@ class BasePipeTestCase(unittest.TestCase):
 
         # This test puts the pipe into an unknown state of only partially
         # receiving a too-large object for the pipe.
-        rd._buffer = struct.pack('>I', 129) + (b'x' * 128)
+        rd._buffer = struct.pack('>BI', 0, 129) + (b'x' * 128)
         self.assertRaises(picklepipe.PipeClosed, rd.recv_object, timeout=0.3)
         self.assertIs(rd.closed, True)
+
+    def test_send_before_handshake(self):
+        r, w = self.make_socketpair()
+        wr = self.PIPE_TYPE(w)
+        self.addCleanup(wr.close)
+
+        self.assertIs(wr.poll_handshake(), False)
+        self.assertIs(wr.handshake_complete, False)
+        wr.send_object('abc')
+
+        rd = self.PIPE_TYPE(r)
+        self.addCleanup(rd.close)
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        self.assertIs(rd.handshake_complete, True)
+        self.assertIs(wr.poll_handshake(timeout=1.0), True)
+
+    def test_capabilities(self):
+        rd, wr = self.make_pipe_pair()
+        self.assertEqual(rd.capabilities, 0)
+        rd.poll_handshake(timeout=1.0)
+        self.assertEqual(rd.capabilities, picklepipe.CAPABILITY_TRACE)
+
+    def test_protocol_before_handshake(self):
+        r, w = self.make_socketpair()
+        wr = self.PIPE_TYPE(w)
+        self.addCleanup(wr.close)
+        self.addCleanup(r.close)
+
+        self.assertEqual(wr.protocol, min(wr.highest_protocol, wr.baseline_protocol))
+        self.assertEqual(wr.capabilities, 0)
+        self.assertIs(wr.closed, False)
+
+    def test_fileno_has_no_side_effects(self):
+        rd, wr = self.make_pipe_pair()
+        rd.fileno()
+        self.assertIs(rd.handshake_complete, False)
+        wr.close()
+        rd.fileno()
+        self.assertIs(rd.closed, False)
+
+    def test_send_timeout_when_peer_stops_reading(self):
+        rd, wr = self.make_pipe_pair()
+        wr.poll_handshake(timeout=1.0)
+        wr.set_send_timeout(0.1)
+        self.assertEqual(wr.send_timeout, 0.1)
+        self.assertRaises(ValueError, wr.set_send_timeout, -1)
+        try:
+            for i in range(100000):
+                wr.send_object(i)
+        except picklepipe.PipeTimeout:
+            pass
+        else:
+            self.fail('Didn\'t raise picklepipe.PipeTimeout')
+
+        # Whole frames are written at once so the pipe is still usable.
+        self.assertIs(wr.closed, False)
+
+    def test_peer_closed_during_recv(self):
+        rd, wr = self.make_pipe_pair()
+        rd._recv_protocol()
+        wr.close()
+        self.assertRaises(picklepipe.PipeClosed, rd.recv_object)
+        self.assertIs(rd.closed, True)
+
+    def test_send_object_larger_than_socket_buffer(self):
+        rd, wr = self.make_pipe_pair()
+        obj = [b'x' * 1024] * 4096
+        result = []
+        thread = threading.Thread(target=lambda: result.append(rd.recv_object(timeout=5.0)))
+        thread.start()
+        wr.send_object(obj)
+        thread.join(5.0)
+        self.assertEqual(result, [obj])
+
+    def test_send_object_with_header(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object([1, 2, 3], header='route')
+        self.assertEqual(rd.recv_object(timeout=1.0), [1, 2, 3])
+
+    def test_recv_raw_and_forward(self):
+        rd, wr = self.make_pipe_pair()
+        router_rd, router_wr = self.make_pipe_pair()
+        rd.poll_handshake(timeout=1.0)
+        router_wr.poll_handshake(timeout=1.0)
+
+        wr.send_object({'a': 1}, header='route')
+        envelope = rd.recv_raw(timeout=1.0)
+        self.assertEqual(envelope.header, 'route')
+        self.assertEqual(envelope.load(), {'a': 1})
+
+        router_wr.send_raw(envelope)
+        forwarded = router_rd.recv_raw(timeout=1.0)
+        self.assertEqual(forwarded.header, 'route')
+        self.assertEqual(forwarded.payload, envelope.payload)
+        self.assertEqual(forwarded.load(), {'a': 1})
+
+    def test_recv_raw_without_header(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object('abc')
+        envelope = rd.recv_raw(timeout=1.0)
+        self.assertIs(envelope.header, None)
+        self.assertEqual(envelope.load(), 'abc')
+
+        wr.send_raw(picklepipe.Envelope('route', envelope.payload))
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+
+    def test_recv_raw_bad_envelope(self):
+        rd, wr = self.make_pipe_pair()
+        rd._recv_protocol()
+        rd._buffer = struct.pack('>BII', 2, 4, 100)
+        self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_raw, timeout=0.3)
+        self.assertIs(rd.closed, False)
+
+    def test_send_iter_recv_iter(self):
+        rd, wr = self.make_pipe_pair()
+        objs = list(range(100))
+        thread = threading.Thread(target=wr.send_iter, args=(iter(objs),),
+                                  kwargs={'timeout': 5.0})
+        thread.start()
+        self.assertEqual(list(rd.recv_iter(window=4, timeout=5.0)), objs)
+        thread.join(5.0)
+
+    def test_send_iter_back_to_back_streams(self):
+        rd, wr = self.make_pipe_pair()
+        for objs in ([1, 2, 3], [4, 5, 6]):
+            thread = threading.Thread(target=wr.send_iter, args=(objs,),
+                                      kwargs={'timeout': 5.0})
+            thread.start()
+            self.assertEqual(list(rd.recv_iter(window=4, timeout=5.0)), objs)
+            thread.join(5.0)
+
+            # Credits of the stream that ended don't carry over to the next one.
+            self.assertRaises(picklepipe.PipeTimeout, wr.send_iter, [7], timeout=0.2)
+            self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.1)
+
+    def test_send_iter_respects_window(self):
+        rd, wr = self.make_pipe_pair()
+        pulled = []
+
+        def generate():
+            for i in range(10):
+                pulled.append(i)
+                yield i
+
+        # Grant two objects of credit and never return any.
+        rd._send_credit(picklepipe.pipe._CREDIT_RESET, 2, picklepipe.pipe._CREDIT_UNLIMITED)
+        self.assertRaises(picklepipe.PipeTimeout, wr.send_iter, generate(), timeout=0.2)
+
+        # Only one object more than there were credits was taken from the generator.
+        self.assertEqual(pulled, [0, 1, 2])
+
+    def test_send_iter_window_bytes(self):
+        rd, wr = self.make_pipe_pair()
+        objs = [b'x' * 1000] * 20
+        thread = threading.Thread(target=wr.send_iter, args=(objs,), kwargs={'timeout': 5.0})
+        thread.start()
+        received = list(rd.recv_iter(window=100, window_bytes=2500, timeout=5.0))
+        thread.join(5.0)
+        self.assertEqual(received, objs)
+
+    def test_send_iter_object_larger_than_window_bytes(self):
+        rd, wr = self.make_pipe_pair()
+        objs = [b'x' * 5000, b'y']
+        thread = threading.Thread(target=wr.send_iter, args=(objs,), kwargs={'timeout': 5.0})
+        thread.start()
+        received = list(rd.recv_iter(window_bytes=100, timeout=5.0))
+        thread.join(5.0)
+        self.assertEqual(received, objs)
+
+    def test_objects_received_while_waiting_for_credit(self):
+        rd, wr = self.make_pipe_pair()
+        rd.send_object('abc')
+        rd._send_credit(picklepipe.pipe._CREDIT_RESET, 1, picklepipe.pipe._CREDIT_UNLIMITED)
+        wr.send_iter(['x'], timeout=1.0)
+        self.assertEqual(wr.recv_object(timeout=1.0), 'abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'x')
+
+    def test_send_raw_bytes(self):
+        rd, wr = self.make_pipe_pair()
+        for obj in [b'abc', bytearray(b'abc'), memoryview(b'abc')]:
+            wr.send_object(obj)
+            self.assertEqual(rd.recv_object(timeout=1.0), b'abc')
+
+    def test_raw_bytes_skip_serializer(self):
+        rd, wr = self.make_pipe_pair()
+        wr._serializer = rd._serializer = None
+        wr.send_object(b'abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), b'abc')
+
+    def test_raw_bytes_mixed_with_objects(self):
+        rd, wr = self.make_pipe_pair()
+        objs = [b'abc', [1, 2, 3], b'', 'abc', b'x' * 200000]
+        thread = threading.Thread(target=lambda: [wr.send_object(obj) for obj in objs])
+        thread.start()
+        for obj in objs:
+            self.assertEqual(rd.recv_object(timeout=1.0), obj)
+        thread.join(1.0)
+
+    def test_raw_bytes_from_memoryview_slice(self):
+        rd, wr = self.make_pipe_pair()
+        data = bytearray(range(256)) * 1024
+        wr.send_object(memoryview(data)[100:100000])
+        self.assertEqual(rd.recv_object(timeout=1.0), bytes(data[100:100000]))
+
+    def test_forward_raw_bytes(self):
+        rd, wr = self.make_pipe_pair()
+        rd2, wr2 = self.make_pipe_pair()
+        wr.send_object(b'abc')
+        envelope = rd.recv_raw(timeout=1.0)
+        self.assertEqual(envelope.load(), b'abc')
+        wr2.send_raw(envelope)
+        self.assertEqual(rd2.recv_object(timeout=1.0), b'abc')
+
+    def make_temp_file(self, data):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        f = open(path, 'rb')
+        self.addCleanup(f.close)
+        return f
+
+    def test_send_file(self):
+        rd, wr = self.make_pipe_pair()
+        data = os.urandom(1024 * 1024)
+        source = self.make_temp_file(data)
+        thread = threading.Thread(target=wr.send_file, args=(source,))
+        thread.start()
+        target = io.BytesIO()
+        self.assertEqual(rd.recv_to_file(target, timeout=5.0), len(data))
+        thread.join(5.0)
+        self.assertEqual(target.getvalue(), data)
+
+    def test_send_file_offset_and_count(self):
+        rd, wr = self.make_pipe_pair()
+        source = self.make_temp_file(b'abcdefghij')
+        wr.send_file(source, offset=2, count=5)
+        target = io.BytesIO()
+        self.assertEqual(rd.recv_to_file(target, timeout=1.0), 5)
+        self.assertEqual(target.getvalue(), b'cdefg')
+
+    def test_send_file_without_file_descriptor(self):
+        rd, wr = self.make_pipe_pair()
+        data = b'abc' * 100000
+        thread = threading.Thread(target=wr.send_file, args=(io.BytesIO(data),))
+        thread.start()
+        target = io.BytesIO()
+        self.assertEqual(rd.recv_to_file(target, timeout=5.0), len(data))
+        thread.join(5.0)
+        self.assertEqual(target.getvalue(), data)
+
+    def test_send_file_shorter_than_count(self):
+        rd, wr = self.make_pipe_pair()
+        source = self.make_temp_file(b'abc')
+        self.assertRaises(picklepipe.PipeSerializingError, wr.send_file, source, count=10)
+        self.assertIs(wr.closed, True)
+
+    def test_recv_to_file_keeps_objects(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object([1, 2, 3])
+        wr.send_file(io.BytesIO(b'abc'))
+        target = io.BytesIO()
+        self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_to_file, target, timeout=1.0)
+        self.assertEqual(rd.recv_object(timeout=1.0), [1, 2, 3])
+        self.assertEqual(rd.recv_to_file(target, timeout=1.0), 3)
+        self.assertEqual(target.getvalue(), b'abc')
+
+    def test_recv_to_file_timeout(self):
+        rd, wr = self.make_pipe_pair()
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_to_file, io.BytesIO(), timeout=0.1)
+        self.assertIs(rd.closed, False)
+
+    def test_recv_raw_file(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_file(io.BytesIO(b'abc'))
+        envelope = rd.recv_raw(timeout=1.0)
+        self.assertEqual(envelope.payload, b'abc')
+        self.assertEqual(envelope.load(), b'abc')
+
+        # Forwarding the envelope sends the file's contents as raw bytes.
+        rd.send_raw(envelope)
+        self.assertEqual(wr.recv_object(timeout=1.0), b'abc')
+
+    def test_recv_object_from_file(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_file(io.BytesIO(b'abc'))
+        self.assertEqual(rd.recv_object(timeout=1.0), b'abc')
+
+    def test_recv_payload_into(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object(b'abc')
+        wr.send_file(io.BytesIO(b'defg'))
+        buffer = bytearray(8)
+        self.assertEqual(rd.recv_payload_into(buffer, timeout=1.0), 3)
+        self.assertEqual(rd.recv_payload_into(memoryview(buffer)[3:], timeout=1.0), 4)
+        self.assertEqual(bytes(buffer[:7]), b'abcdefg')
+
+    def test_recv_payload_into_too_small(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object(b'abcdef')
+        buffer = bytearray(4)
+        self.assertRaises(ValueError, rd.recv_payload_into, buffer, timeout=1.0)
+        self.assertRaises(ValueError, rd.recv_payload_into, b'readonly', timeout=1.0)
+        self.assertEqual(rd.recv_object(timeout=1.0), b'abcdef')
+
+    def test_recv_payload_into_keeps_objects(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object([1, 2, 3])
+        self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_payload_into,
+                          bytearray(64), timeout=1.0)
+        self.assertEqual(rd.recv_object(timeout=1.0), [1, 2, 3])
+
+    def test_recv_payload_into_timeout(self):
+        rd, wr = self.make_pipe_pair()
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_payload_into,
+                          bytearray(4), timeout=0.1)
+        self.assertIs(rd.closed, False)
+
+    def test_recv_object_with_buffer_pool(self):
+        rd, wr = self.make_pipe_pair()
+        pool = picklepipe.BufferPool()
+        rd.set_buffer_pool(pool)
+        self.assertIs(rd.buffer_pool, pool)
+        objs = [[1, 2, 3], b'abc', 'x' * 10000, [1, 2, 3]]
+        for obj in objs:
+            wr.send_object(obj)
+        for obj in objs:
+            self.assertEqual(rd.recv_object(timeout=1.0), obj)
+        self.assertGreater(pool.retained, 0)
+
+    def test_buffer_pool_partial_frame(self):
+        rd, wr = self.make_pipe_pair()
+        rd.set_buffer_pool(picklepipe.BufferPool())
+        frame = picklepipe.pipe._pack_frame(*wr._encode_object('x' * 10000))
+
+        # Hold back the end of the frame so the receive times out part way.
+        wr._sock.sendall(frame[:-10])
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.1)
+        wr._sock.sendall(frame[-10:])
+        self.assertEqual(rd.recv_object(timeout=1.0), 'x' * 10000)
+
+    def make_traced_pair(self):
+        rd, wr = self.make_pipe_pair()
+        traces = []
+        rd.set_trace_callback(traces.append)
+        wr.poll_handshake(timeout=1.0)
+        return rd, wr, traces
+
+    def test_trace_id(self):
+        rd, wr, traces = self.make_traced_pair()
+        self.assertIs(wr.tracing, False)
+        wr.send_object([1, 2, 3], trace_id='abc')
+        wr.send_object([4, 5, 6], trace_id=b'def')
+        wr.send_object([7, 8, 9])
+        for obj in ([1, 2, 3], [4, 5, 6], [7, 8, 9]):
+            self.assertEqual(rd.recv_object(timeout=1.0), obj)
+
+        self.assertEqual([trace.trace_id for trace in traces], ['abc', b'def'])
+        trace = traces[0]
+        self.assertEqual(trace.size, len(wr._dumps([1, 2, 3])))
+        self.assertGreaterEqual(trace.serialize_time, 0.0)
+        self.assertGreaterEqual(trace.read_time, 0.0)
+        self.assertGreaterEqual(trace.deserialize_time, 0.0)
+        self.assertLess(abs(trace.queue_delay), 1.0)
+
+    def test_tracing_every_object(self):
+        rd, wr, traces = self.make_traced_pair()
+        wr.set_tracing(True)
+        self.assertIs(wr.tracing, True)
+        wr.send_object('abc')
+        wr.send_object(b'raw')
+        wr.send_object('def', header='x')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), b'raw')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'def')
+        self.assertEqual(len(traces), 1)
+        self.assertIs(traces[0].trace_id, None)
+
+    def test_tracing_needs_peer_capability(self):
+        rd, wr, traces = self.make_traced_pair()
+        wr._peer_capabilities = 0
+        wr.send_object('abc', trace_id='abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        self.assertEqual(traces, [])
+
+    def test_recv_raw_traced(self):
+        rd, wr, traces = self.make_traced_pair()
+        wr.send_object([1, 2, 3], trace_id='abc')
+        envelope = rd.recv_raw(timeout=1.0)
+        self.assertEqual(envelope.load(), [1, 2, 3])
+        self.assertEqual(traces[0].trace_id, 'abc')
+        self.assertIs(traces[0].deserialize_time, None)
+
+    def test_selectors_created_when_waiting(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object('abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        self.assertIs(wr._selector, None)
+        self.assertIs(wr._write_selector, None)
+
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.05)
+        self.assertIsNot(rd._selector, None)
+
+    def make_tcp_pair(self):
+        listener = socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+        rd, wr = self.PIPE_TYPE(server), self.PIPE_TYPE(client)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        return rd, wr
+
+    def test_coalescing_buffers_until_flush(self):
+        rd, wr = self.make_pipe_pair()
+        wr.set_coalescing(10.0)
+        self.assertEqual(wr.linger, 10.0)
+        for i in range(100):
+            wr.send_object(i)
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.1)
+        wr.flush()
+        self.assertEqual([rd.recv_object(timeout=1.0) for _ in range(100)], list(range(100)))
+
+    def test_coalescing_linger(self):
+        rd, wr = self.make_pipe_pair()
+        wr.set_coalescing(0.01)
+        wr.send_object('abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+
+    def test_coalescing_max_bytes(self):
+        rd, wr = self.make_pipe_pair()
+        wr.set_coalescing(10.0, max_bytes=1000)
+        for i in range(100):
+            wr.send_object(i)
+        self.assertEqual(rd.recv_object(timeout=1.0), 0)
+
+    def test_coalescing_flushes_before_waiting(self):
+        rd, wr = self.make_pipe_pair()
+        wr.set_coalescing(10.0)
+
+        def echo():
+            rd.send_object(rd.recv_object(timeout=1.0))
+        thread = threading.Thread(target=echo)
+        thread.start()
+        wr.send_object('ping')
+        self.assertEqual(wr.recv_object(timeout=1.0), 'ping')
+        thread.join(1.0)
+
+    def test_coalescing_large_frames(self):
+        rd, wr = self.make_pipe_pair()
+        wr.set_coalescing(10.0, max_bytes=1000)
+        objs = [b'x' * 5000, 'abc', b'y' * 200000]
+        thread = threading.Thread(target=lambda: [wr.send_object(obj) for obj in objs])
+        thread.start()
+        for obj in objs[:2]:
+            self.assertEqual(rd.recv_object(timeout=1.0), obj)
+        thread.join(1.0)
+        wr.flush()
+        self.assertEqual(rd.recv_object(timeout=1.0), objs[2])
+
+    def test_disable_coalescing_flushes(self):
+        rd, wr = self.make_pipe_pair()
+        wr.set_coalescing(10.0)
+        wr.send_object('abc')
+        wr.set_coalescing(None)
+        self.assertIs(wr.linger, None)
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+
+    def test_coalescing_sets_tcp_nodelay(self):
+        rd, wr = self.make_tcp_pair()
+        wr.set_coalescing(0.01)
+        self.assertTrue(wr._sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        wr.send_object('abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        wr.set_coalescing(None)
+        self.assertFalse(wr._sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+    def test_coalescing_invalid_arguments(self):
+        rd, wr = self.make_pipe_pair()
+        self.assertRaises(ValueError, wr.set_coalescing, -1.0)
+        self.assertRaises(ValueError, wr.set_coalescing, 1.0, max_bytes=0)
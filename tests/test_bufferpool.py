@@ -0,0 +1,38 @@
+import unittest
+import picklepipe
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_acquire_rounds_up_to_size_class(self):
+        pool = picklepipe.BufferPool(min_size=16, max_size=1024)
+        self.assertEqual(len(pool.acquire(1)), 16)
+        self.assertEqual(len(pool.acquire(17)), 32)
+        self.assertEqual(len(pool.acquire(1024)), 1024)
+
+    def test_release_reuses_buffer(self):
+        pool = picklepipe.BufferPool(min_size=16, max_size=1024)
+        buffer = pool.acquire(100)
+        pool.release(buffer)
+        self.assertEqual(pool.retained, 128)
+        self.assertIs(pool.acquire(65), buffer)
+        self.assertEqual(pool.retained, 0)
+
+    def test_large_buffers_are_not_kept(self):
+        pool = picklepipe.BufferPool(min_size=16, max_size=1024)
+        buffer = pool.acquire(2000)
+        self.assertEqual(len(buffer), 2000)
+        pool.release(buffer)
+        pool.release(bytearray(100))
+        self.assertEqual(pool.retained, 0)
+
+    def test_max_buffers(self):
+        pool = picklepipe.BufferPool(min_size=16, max_size=1024, max_buffers=2)
+        buffers = [pool.acquire(16) for _ in range(3)]
+        for buffer in buffers:
+            pool.release(buffer)
+        self.assertEqual(pool.retained, 32)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, picklepipe.BufferPool, min_size=0)
+        self.assertRaises(ValueError, picklepipe.BufferPool, min_size=64, max_size=32)
+        self.assertRaises(ValueError, picklepipe.BufferPool, max_buffers=-1)
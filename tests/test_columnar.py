@@ -0,0 +1,124 @@
+import array
+import unittest
+import picklepipe
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class TestColumnarPipe(unittest.TestCase):
+    PIPE_TYPE = picklepipe.PicklePipe
+
+    def make_columnar_pair(self, **kwargs):
+        rd, wr = picklepipe.make_pipe_pair(self.PIPE_TYPE)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        return (picklepipe.ColumnarPipe(rd, **kwargs),
+                picklepipe.ColumnarPipe(wr, **kwargs))
+
+    def make_records(self, count):
+        return [{'id': i, 'value': i * 0.5, 'name': 'n%d' % i, 'ok': i % 2 == 0}
+                for i in range(count)]
+
+    def test_send_batch(self):
+        rd, wr = self.make_columnar_pair()
+        records = self.make_records(100)
+        wr.send_batch(records)
+        batch = rd.recv_batch(timeout=1.0)
+        self.assertIsInstance(batch, picklepipe.RecordBatch)
+        self.assertEqual(len(batch), 100)
+        self.assertEqual(sorted(batch.keys), ['id', 'name', 'ok', 'value'])
+        self.assertEqual(list(batch), records)
+        self.assertEqual(batch[-1], records[-1])
+
+    def test_numeric_columns_are_arrays(self):
+        rd, wr = self.make_columnar_pair()
+        wr.send_batch(self.make_records(10))
+        batch = rd.recv_batch(timeout=1.0)
+        self.assertIsInstance(batch.column('id'), array.array)
+        self.assertIsInstance(batch.column('value'), array.array)
+        self.assertEqual(list(batch.column('id')), list(range(10)))
+        self.assertEqual(list(batch.column('name')), ['n%d' % i for i in range(10)])
+
+    def test_large_and_mixed_numbers(self):
+        rd, wr = self.make_columnar_pair()
+        records = [{'a': 2 ** 70, 'b': 1}, {'a': 1, 'b': 1.5}]
+        wr.send_batch(records)
+        self.assertEqual(list(rd.recv_batch(timeout=1.0)), records)
+
+    def test_columns_decoded_lazily(self):
+        rd, wr = self.make_columnar_pair()
+        wr.send_batch(self.make_records(10))
+        batch = rd.recv_batch(timeout=1.0)
+        self.assertTrue(all(kind is not None for kind, _ in batch._columns))
+        batch.column('id')
+        self.assertEqual(sum(kind is None for kind, _ in batch._columns), 1)
+
+    def test_send_record_batches(self):
+        rd, wr = self.make_columnar_pair(batch_size=3)
+        records = self.make_records(7)
+        for record in records:
+            wr.send_record(record)
+        self.assertEqual(wr.pending, 1)
+        wr.flush()
+        self.assertEqual(wr.pending, 0)
+        self.assertEqual([len(rd.recv_batch(timeout=1.0)) for _ in range(3)], [3, 3, 1])
+
+    def test_send_record_key_change(self):
+        rd, wr = self.make_columnar_pair()
+        records = [{'a': 1}, {'a': 2}, {'b': 3}, {'a': 4, 'b': 5}]
+        for record in records:
+            wr.send_record(record)
+        wr.flush()
+        self.assertEqual([rd.recv_record(timeout=1.0) for _ in records], records)
+
+    def test_recv_batch_after_recv_record(self):
+        rd, wr = self.make_columnar_pair()
+        records = self.make_records(5)
+        wr.send_batch(records)
+        self.assertEqual(rd.recv_record(timeout=1.0), records[0])
+        self.assertEqual(list(rd.recv_batch(timeout=1.0)), records[1:])
+
+    def test_records_with_different_keys(self):
+        rd, wr = self.make_columnar_pair()
+        self.assertRaises(picklepipe.PipeSerializingError, wr.send_batch, [{'a': 1}, {'a': 1, 'b': 2}])
+        self.assertRaises(picklepipe.PipeSerializingError, wr.send_batch, [{'a': 1}, {'b': 2}])
+
+    def test_plain_objects_are_records(self):
+        rd, wr = self.make_columnar_pair()
+        wr._pipe.send_object({'a': 1})
+        self.assertEqual(rd.recv_record(timeout=1.0), {'a': 1})
+
+    def test_smaller_than_separate_objects(self):
+        rd, wr = self.make_columnar_pair()
+        records = self.make_records(1000)
+        separate = sum(len(wr._pipe._dumps(record)) for record in records)
+        batch = picklepipe.columnar._encode_batch(records, list(records[0]), wr._pipe._dumps)
+        self.assertLess(len(batch), separate)
+
+    def test_corrupt_batch(self):
+        rd, wr = self.make_columnar_pair()
+        wr._pipe._send_frame(picklepipe.pipe.FRAME_BATCH, b'abc')
+        self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_batch, timeout=1.0)
+
+    def test_timeout(self):
+        rd, wr = self.make_columnar_pair()
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_record, timeout=0.1)
+
+    def test_invalid_batch_size(self):
+        rd, wr = picklepipe.make_pipe_pair(self.PIPE_TYPE)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        self.assertRaises(ValueError, picklepipe.ColumnarPipe, rd, batch_size=0)
+
+
+class TestColumnarMarshalPipe(TestColumnarPipe):
+    PIPE_TYPE = picklepipe.MarshalPipe
+
+
+class TestColumnarJSONPipe(TestColumnarPipe):
+    PIPE_TYPE = picklepipe.JSONPipe
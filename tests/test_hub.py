@@ -0,0 +1,146 @@
+import unittest
+import picklepipe
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class Value(object):
+    def __init__(self, value):
+        self.value = value
+
+
+def reduce_value(obj):
+    return Value, (obj.value * 100,)
+
+
+class TestPipeHub(unittest.TestCase):
+    def make_hub(self, **kwargs):
+        hub = picklepipe.PipeHub(**kwargs)
+        self.addCleanup(hub.close)
+        return hub
+
+    def make_subscriber(self, hub, *topics):
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        hub.subscribe(wr, *topics)
+        return rd, wr
+
+    def test_publish_to_topic(self):
+        hub = self.make_hub()
+        a, _ = self.make_subscriber(hub, 'x')
+        b, _ = self.make_subscriber(hub, 'x', 'y')
+        c, _ = self.make_subscriber(hub, 'y')
+
+        self.assertEqual(hub.publish('x', 'abc'), 2)
+        self.assertEqual(a.recv_object(timeout=1.0), 'abc')
+        self.assertEqual(b.recv_object(timeout=1.0), 'abc')
+        self.assertRaises(picklepipe.PipeTimeout, c.recv_object, timeout=0.1)
+
+    def test_serializes_once(self):
+        hub = self.make_hub()
+        subscribers = [self.make_subscriber(hub, 'x') for _ in range(3)]
+        calls = []
+
+        for _, wr in subscribers:
+            dumps = wr._dumps
+
+            def counting_dumps(obj, dumps=dumps):
+                calls.append(obj)
+                return dumps(obj)
+            wr._dumps = counting_dumps
+
+        hub.publish('x', [1, 2, 3])
+        self.assertEqual(len(calls), 1)
+        for rd, _ in subscribers:
+            self.assertEqual(rd.recv_object(timeout=1.0), [1, 2, 3])
+
+    def test_subscribers_with_different_reducers(self):
+        hub = self.make_hub()
+        plain, _ = self.make_subscriber(hub, 'x')
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe,
+                                           dispatch_table={Value: reduce_value})
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        hub.subscribe(wr, 'x')
+
+        self.assertEqual(hub.publish('x', Value(1)), 2)
+        self.assertEqual(plain.recv_object(timeout=1.0).value, 1)
+        self.assertEqual(rd.recv_object(timeout=1.0).value, 100)
+
+    def test_publish_raw_bytes(self):
+        hub = self.make_hub()
+        a, _ = self.make_subscriber(hub, 'x')
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.JSONPipe)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        hub.subscribe(wr, 'x')
+
+        self.assertEqual(hub.publish('x', b'abc'), 2)
+        self.assertEqual(a.recv_object(timeout=1.0), b'abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), b'abc')
+
+    def test_unsubscribe(self):
+        hub = self.make_hub()
+        rd, wr = self.make_subscriber(hub, 'x', 'y')
+        hub.unsubscribe(wr, 'x')
+        self.assertEqual(hub.publish('x', 1), 0)
+        self.assertEqual(hub.publish('y', 2), 1)
+        hub.unsubscribe(wr)
+        self.assertEqual(hub.subscribers, [])
+
+    def fill_slow_subscriber(self, hub, count):
+        slow, wr = self.make_subscriber(hub, 'x')
+        wr.poll_handshake(timeout=1.0)
+        payload = b'x' * 65536
+        for i in range(count):
+            hub.publish('x', (i, payload))
+        return slow, wr
+
+    def test_drop_oldest(self):
+        hub = self.make_hub(max_queue=2, policy=picklepipe.DROP_OLDEST)
+        slow, wr = self.fill_slow_subscriber(hub, 50)
+        self.assertEqual(hub.pending(wr), 2)
+        self.assertGreater(hub.dropped, 0)
+
+        received = []
+        while hub.pending(wr):
+            hub.pump()
+            received.append(slow.recv_object(timeout=1.0)[0])
+        while True:
+            try:
+                received.append(slow.recv_object(timeout=0.1)[0])
+            except picklepipe.PipeTimeout:
+                break
+        self.assertEqual(received[-1], 49)
+
+    def test_drop_newest(self):
+        hub = self.make_hub(max_queue=2, policy=picklepipe.DROP_NEWEST)
+        slow, wr = self.fill_slow_subscriber(hub, 50)
+        self.assertEqual(hub.pending(wr), 2)
+        self.assertEqual(hub.publish('x', 'abc'), 0)
+
+    def test_disconnect(self):
+        hub = self.make_hub(max_queue=2, policy=picklepipe.DISCONNECT)
+        other, _ = self.make_subscriber(hub, 'y')
+        slow, wr = self.fill_slow_subscriber(hub, 50)
+        self.assertIs(wr.closed, True)
+        self.assertNotIn(wr, hub.subscribers)
+        self.assertEqual(len(hub.subscribers), 1)
+
+    def test_closed_subscriber_is_removed(self):
+        hub = self.make_hub()
+        rd, wr = self.make_subscriber(hub, 'x')
+        rd.close()
+        for _ in range(3):
+            hub.publish('x', 'abc')
+        self.assertEqual(hub.subscribers, [])
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, picklepipe.PipeHub, max_queue=0)
+        self.assertRaises(ValueError, picklepipe.PipeHub, policy='abc')
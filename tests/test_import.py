@@ -0,0 +1,40 @@
+import subprocess
+import sys
+import unittest
+import picklepipe
+
+
+def _modules_after(code):
+    output = subprocess.check_output([sys.executable, '-c', code + '\n'
+                                      'import sys\n'
+                                      'print(" ".join(sys.modules))'])
+    return set(output.decode('ascii').split())
+
+
+class TestImport(unittest.TestCase):
+    @unittest.skipIf(sys.version_info < (3, 7), 'Submodules are imported lazily on Python 3.7+')
+    def test_import_is_lazy(self):
+        modules = _modules_after('import picklepipe')
+        for name in ['pickle', 'json', 'selectors2', 'threading',
+                     'picklepipe.picklepipe', 'picklepipe.jsonpipe']:
+            self.assertNotIn(name, modules)
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Submodules are imported lazily on Python 3.7+')
+    def test_lazy_attribute_imports_submodule(self):
+        modules = _modules_after('import picklepipe\n'
+                                 'picklepipe.JSONPipe')
+        self.assertIn('json', modules)
+        self.assertNotIn('pickle', modules)
+
+    def test_all_names_are_available(self):
+        for name in picklepipe.__all__:
+            self.assertTrue(hasattr(picklepipe, name), name)
+            self.assertIn(name, dir(picklepipe))
+
+    def test_unknown_attribute(self):
+        self.assertRaises(AttributeError, getattr, picklepipe, 'NotAPipe')
+
+    @unittest.skipIf(sys.version_info < (3, 4), 'selectors2 is used before Python 3.4')
+    def test_uses_stdlib_selectors(self):
+        import selectors
+        self.assertIs(picklepipe.selector.selectors, selectors)
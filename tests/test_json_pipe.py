@@ -46,3 +46,11 @@ class TestJSONPipe(unittest.TestCase):
                 self.assertIsInstance(e.exception, TypeError)
             else:
                 self.fail('Didn\'t raise picklepipe.PipeSerializingError')
+
+    def test_forward_envelope(self):
+        rd, wr = self.make_pipe_pair()
+        wr.send_object({'a': [1]}, header={'to': 'b'})
+        envelope = rd.recv_raw(timeout=1.0)
+        self.assertEqual(envelope.header, {'to': 'b'})
+        wr.send_raw(envelope)
+        self.assertEqual(rd.recv_object(timeout=1.0), {'a': [1]})
@@ -0,0 +1,151 @@
+import threading
+import time
+import unittest
+import picklepipe
+from picklepipe.timeout import Timeout
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class TestLanePipe(unittest.TestCase):
+    def make_lane_pair(self, **kwargs):
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        return picklepipe.LanePipe(rd, **kwargs), picklepipe.LanePipe(wr, **kwargs)
+
+    def test_send_on_lanes(self):
+        rd, wr = self.make_lane_pair(lanes=3)
+        wr.send_object('a', lane=2)
+        wr.send_object('b', lane=0)
+        wr.send_object('c', lane=1)
+        self.assertEqual(rd.recv_object(lane=1, timeout=1.0), 'c')
+        self.assertEqual(rd.recv_object(lane=0, timeout=1.0), 'b')
+        self.assertEqual(rd.recv_object(lane=2, timeout=1.0), 'a')
+
+    def test_large_object_is_chunked(self):
+        rd, wr = self.make_lane_pair(chunk_size=16)
+        obj = list(range(1000))
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(rd.recv_object(lane=1, timeout=5.0)))
+        thread.start()
+        wr.send_object(obj, lane=1)
+        thread.join(5.0)
+        self.assertEqual(result, [obj])
+
+    def test_high_priority_goes_between_chunks(self):
+        rd, wr = self.make_lane_pair(chunk_size=1024)
+        bulk = b'x' * (8 * 1024 * 1024)
+        bulk_thread = threading.Thread(target=wr.send_object, args=(bulk,), kwargs={'lane': 1})
+        bulk_thread.start()
+        self.addCleanup(bulk_thread.join, 5.0)
+
+        # Wait for the bulk send to fill the socket buffer before the heartbeat.
+        with Timeout(1.0) as t:
+            while not wr._draining and not t.timed_out:
+                time.sleep(0.01)
+        time.sleep(0.1)
+        heartbeat_thread = threading.Thread(target=wr.send_object,
+                                            args=('heartbeat',), kwargs={'lane': 0})
+        heartbeat_thread.start()
+        self.addCleanup(heartbeat_thread.join, 5.0)
+
+        self.assertEqual(rd.recv_object(lane=0, timeout=5.0), 'heartbeat')
+        self.assertEqual(len(rd._recv_queues[1]), 0)
+        self.assertEqual(rd.recv_object(lane=1, timeout=5.0), bulk)
+
+    def test_weighted_lanes(self):
+        rd, wr = self.make_lane_pair(weights=[3, 1])
+        for lane in range(2):
+            for _ in range(8):
+                wr._send_queues[lane].append(None)
+        picks = [wr._next_lane() for _ in range(8)]
+        self.assertEqual(picks.count(0), 6)
+        self.assertEqual(picks.count(1), 2)
+
+    def test_strict_lanes(self):
+        rd, wr = self.make_lane_pair(lanes=3)
+        wr._send_queues[2].append(None)
+        wr._send_queues[1].append(None)
+        self.assertEqual(wr._next_lane(), 1)
+
+    def test_concurrent_receivers(self):
+        rd, wr = self.make_lane_pair()
+        results = []
+
+        def recv_lane(lane):
+            results.append(rd.recv_object(lane=lane, timeout=2.0))
+
+        threads = [threading.Thread(target=recv_lane, args=(lane,)) for lane in range(2)]
+        for thread in threads:
+            thread.start()
+        wr.send_object(1, lane=1)
+        wr.send_object(0, lane=0)
+        for thread in threads:
+            thread.join(2.0)
+        self.assertEqual(sorted(results), [0, 1])
+
+    def test_too_large_object_on_lane(self):
+        rd, wr = self.make_lane_pair(chunk_size=16)
+        rd._pipe.set_max_size(64)
+        wr.send_object(b'x' * 128, lane=1)
+        wr.send_object('abc', lane=0)
+        self.assertEqual(rd.recv_object(lane=0, timeout=1.0), 'abc')
+        self.assertRaises(picklepipe.PipeObjectTooLargeError,
+                          rd.recv_object, lane=1, timeout=1.0)
+
+    def test_chunk_larger_than_max_size(self):
+        rd, wr = self.make_lane_pair(chunk_size=1024)
+        rd._pipe.set_max_size(64)
+        wr.send_object(b'x' * 4096, lane=1)
+        wr.send_object('abc', lane=1)
+        wr.send_object('def', lane=0)
+        self.assertEqual(rd.recv_object(lane=0, timeout=1.0), 'def')
+        self.assertRaises(picklepipe.PipeObjectTooLargeError,
+                          rd.recv_object, lane=1, timeout=1.0)
+        self.assertEqual(rd.recv_object(lane=1, timeout=1.0), 'abc')
+
+    def test_send_timeout_doesnt_skip_chunks(self):
+        rd, wr = self.make_lane_pair()
+        wr._pipe.set_send_timeout(0.2)
+        self.assertRaises(picklepipe.PipeTimeout, wr.send_object, b'x' * 8000000, lane=1)
+
+        # Part of the object was written so the pipe is closed rather
+        # than sending the rest of the object without the missing chunk.
+        self.assertIs(wr.closed, True)
+        self.assertRaises(picklepipe.PipeClosed, wr.send_object, 'heartbeat', lane=0)
+        self.assertRaises(picklepipe.PipeClosed, rd.recv_object, lane=1, timeout=5.0)
+
+    def test_send_timeout_before_first_chunk(self):
+        rd, wr = self.make_lane_pair()
+        sent = []
+
+        def send_frame(frame_type, data):
+            if not sent:
+                sent.append(data)
+                raise picklepipe.PipeTimeout()
+            return send_frame_orig(frame_type, data)
+        send_frame_orig = wr._pipe._send_frame
+        wr._pipe._send_frame = send_frame
+
+        # Nothing of the object was written so it's dropped and the pipe stays open.
+        self.assertRaises(picklepipe.PipeTimeout, wr.send_object, 'a', lane=1)
+        self.assertIs(wr.closed, False)
+        wr.send_object('b', lane=1)
+        self.assertEqual(rd.recv_object(lane=1, timeout=1.0), 'b')
+
+    def test_timeout(self):
+        rd, wr = self.make_lane_pair()
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.1)
+
+    def test_invalid_lane(self):
+        rd, wr = self.make_lane_pair(lanes=2)
+        self.assertRaises(ValueError, wr.send_object, 'abc', lane=2)
+        self.assertRaises(ValueError, picklepipe.LanePipe, rd._pipe, lanes=0)
+        self.assertRaises(ValueError, picklepipe.LanePipe, rd._pipe, weights=[1])
@@ -0,0 +1,170 @@
+import select
+import socket
+import threading
+import time
+import unittest
+import picklepipe
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class TestPipeListener(unittest.TestCase):
+    def make_listener(self):
+        listener = picklepipe.PipeListener(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, listener)
+        return listener
+
+    def connect(self, listener):
+        sock = socket.create_connection(listener.address)
+        pipe = picklepipe.PicklePipe(sock)
+        self.addCleanup(_safe_close, pipe)
+        return pipe
+
+    def test_accept_handshaken_pipe(self):
+        listener = self.make_listener()
+        client = self.connect(listener)
+        server = listener.accept(timeout=1.0)
+        self.addCleanup(_safe_close, server)
+
+        client.send_object('abc')
+        self.assertEqual(server.recv_object(timeout=1.0), 'abc')
+        server.send_object([1, 2])
+        self.assertEqual(client.recv_object(timeout=1.0), [1, 2])
+        self.assertIs(server.handshake_complete, True)
+
+    def test_silent_client_doesnt_stall_accept(self):
+        listener = self.make_listener()
+        silent = socket.create_connection(listener.address)
+        self.addCleanup(silent.close)
+        client = self.connect(listener)
+
+        with picklepipe.pipe.Timeout(0.5) as t:
+            for _ in range(2):
+                self.addCleanup(_safe_close, listener.accept(timeout=t.remaining))
+        self.assertIs(t.timed_out, False)
+        client.send_object('abc')
+
+    def test_accept_timeout(self):
+        listener = self.make_listener()
+        self.assertRaises(picklepipe.PipeTimeout, listener.accept, timeout=0.1)
+
+    def test_accept_loop(self):
+        listener = self.make_listener()
+        clients = [self.connect(listener) for _ in range(3)]
+        accepted = []
+        for pipe in listener:
+            self.addCleanup(_safe_close, pipe)
+            accepted.append(pipe)
+            if len(accepted) == len(clients):
+                break
+        for i, client in enumerate(clients):
+            client.send_object(i)
+            self.assertEqual(accepted[i].recv_object(timeout=1.0), i)
+
+    def test_accept_after_close(self):
+        listener = self.make_listener()
+        listener.close()
+        self.assertIs(listener.closed, True)
+        self.assertRaises(picklepipe.PipeClosed, listener.accept)
+
+
+class TestPipePool(unittest.TestCase):
+    def setUp(self):
+        self.listener = picklepipe.PipeListener(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, self.listener)
+        self.accepted = []
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+        self.addCleanup(self.thread.join, 1.0)
+
+    def _serve(self):
+        while not self.listener.closed:
+            try:
+                pipe = self.listener.accept(timeout=0.05)
+            except picklepipe.PipeError:
+                continue
+            self.accepted.append(pipe)
+
+    def make_pool(self, **kwargs):
+        pool = picklepipe.PipePool(picklepipe.PicklePipe, **kwargs)
+        self.addCleanup(pool.close)
+        self.addCleanup(self.listener.close)
+        return pool
+
+    def test_reuses_released_pipe(self):
+        pool = self.make_pool()
+        address = self.listener.address
+        pipe = pool.acquire(address)
+        pool.release(pipe)
+        self.assertEqual(pool.idle_count(address), 1)
+        self.assertIs(pool.acquire(address), pipe)
+        self.assertEqual(pool.idle_count(address), 0)
+
+    def test_connection_context_manager(self):
+        pool = self.make_pool()
+        address = self.listener.address
+        with pool.connection(address) as pipe:
+            pipe.send_object('abc')
+        self.assertEqual(pool.idle_count(address), 1)
+
+        try:
+            with pool.connection(address) as pipe:
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertIs(pipe.closed, True)
+        self.assertEqual(pool.idle_count(address), 0)
+
+    def test_max_idle(self):
+        pool = self.make_pool(max_idle=2)
+        address = self.listener.address
+        pipes = [pool.acquire(address) for _ in range(3)]
+        for pipe in pipes:
+            pool.release(pipe)
+        self.assertEqual(pool.idle_count(address), 2)
+        self.assertIs(pipes[2].closed, True)
+
+    def test_warm(self):
+        pool = self.make_pool()
+        address = self.listener.address
+        pool.warm(address, 3)
+        self.assertEqual(pool.idle_count(address), 3)
+
+    def test_idle_eviction(self):
+        pool = self.make_pool(idle_timeout=0.0)
+        address = self.listener.address
+        pipe = pool.acquire(address)
+        pool.release(pipe)
+        self.assertEqual(pool.evict_idle(), 1)
+        self.assertIs(pipe.closed, True)
+        self.assertEqual(pool.idle_count(address), 0)
+
+    def test_unhealthy_pipe_not_reused(self):
+        pool = self.make_pool()
+        address = self.listener.address
+        pipe = pool.acquire(address)
+        pool.release(pipe)
+
+        # Closing the server side of the connection makes the idle pipe readable.
+        with picklepipe.pipe.Timeout(1.0) as t:
+            while not self.accepted and not t.timed_out:
+                time.sleep(0.01)
+        for server in self.accepted:
+            server.close()
+        select.select([pipe], [], [], 1.0)
+        other = pool.acquire(address)
+        self.assertIsNot(other, pipe)
+        self.assertIs(pipe.closed, True)
+
+    def test_connect_failure(self):
+        pool = self.make_pool()
+        address = self.listener.address
+        self.listener.close()
+        self.thread.join(1.0)
+        self.assertRaises(picklepipe.PipeClosed, pool.acquire, address)
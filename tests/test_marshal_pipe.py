@@ -8,5 +8,7 @@ class MarshalTestCase(_base_pipe_testcase.BasePipeTestCase):
 
     def test_default_protocol(self):
         rd, wr = self.make_pipe_pair()
+        rd.poll_handshake(timeout=1.0)
+        wr.poll_handshake(timeout=1.0)
         self.assertEqual(rd.protocol, marshal.version)
         self.assertEqual(wr.protocol, marshal.version)
@@ -1,12 +1,95 @@
+import sys
 import pickle
+import threading
+import unittest
 import picklepipe
 from . import _base_pipe_testcase
 
 
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and (self.x, self.y) == (other.x, other.y)
+
+
+def reduce_point(point):
+    return Point, (point.x, point.y)
+
+
+def override_point(obj):
+    if type(obj) is Point:
+        return reduce_point(obj)
+    return NotImplemented
+
+
 class PickleTestCase(_base_pipe_testcase.BasePipeTestCase):
     PIPE_TYPE = picklepipe.PicklePipe
 
     def test_default_protocol(self):
         rd, wr = self.make_pipe_pair()
+        rd.poll_handshake(timeout=1.0)
+        wr.poll_handshake(timeout=1.0)
         self.assertEqual(rd.protocol, pickle.HIGHEST_PROTOCOL)
         self.assertEqual(wr.protocol, pickle.HIGHEST_PROTOCOL)
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'dispatch_table requires Python 3.3+')
+    def test_register_reducer(self):
+        rd, wr = self.make_pipe_pair()
+        default_size = len(wr._dumps(Point(1, 2)))
+        wr.register_reducer(Point, reduce_point)
+        self.assertLess(len(wr._dumps(Point(1, 2))), default_size)
+
+        wr.send_object([Point(1, 2), Point(3, 4)])
+        self.assertEqual(rd.recv_object(timeout=1.0), [Point(1, 2), Point(3, 4)])
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'dispatch_table requires Python 3.3+')
+    def test_reducers_kept_after_handshake(self):
+        rd, wr = picklepipe.make_pipe_pair(self.PIPE_TYPE, dispatch_table={Point: reduce_point})
+        self.addCleanup(rd.close)
+        self.addCleanup(wr.close)
+        wr.poll_handshake(timeout=1.0)
+        self.assertIs(wr._serializer._dispatch_table[Point], reduce_point)
+
+    @unittest.skipIf(sys.version_info < (3, 8), 'reducer_override requires Python 3.8+')
+    def test_reducer_override(self):
+        rd, wr = picklepipe.make_pipe_pair(self.PIPE_TYPE, reducer_override=override_point)
+        self.addCleanup(rd.close)
+        self.addCleanup(wr.close)
+        wr.send_object({'a': Point(1, 2)})
+        self.assertEqual(rd.recv_object(timeout=1.0), {'a': Point(1, 2)})
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'dispatch_table requires Python 3.3+')
+    def test_kept_pickler_after_error(self):
+        rd, wr = self.make_pipe_pair()
+        wr.register_reducer(Point, reduce_point)
+        self.assertRaises(picklepipe.PipeSerializingError, wr.send_object, [Point(1, 2), threading.Lock()])
+        wr.send_object(Point(1, 2))
+        self.assertEqual(rd.recv_object(timeout=1.0), Point(1, 2))
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'dispatch_table requires Python 3.3+')
+    def test_serializer_can_be_pickled(self):
+        rd, wr = self.make_pipe_pair()
+        wr.register_reducer(Point, reduce_point)
+        wr._dumps(Point(1, 2))
+        serializer = pickle.loads(pickle.dumps(wr._serializer))
+        self.assertEqual(serializer.dumps(Point(1, 2)), wr._dumps(Point(1, 2)))
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'dispatch_table requires Python 3.3+')
+    def test_concurrent_dumps(self):
+        rd, wr = self.make_pipe_pair()
+        wr.register_reducer(Point, reduce_point)
+        expected = pickle.loads(wr._dumps([Point(i, i) for i in range(100)]))
+        results = []
+
+        def dump():
+            for _ in range(100):
+                results.append(pickle.loads(wr._dumps([Point(i, i) for i in range(100)])))
+        threads = [threading.Thread(target=dump) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(result == expected for result in results))
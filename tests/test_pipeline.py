@@ -0,0 +1,109 @@
+import socket
+import unittest
+import picklepipe
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+except ImportError:  # Python 2.7 without the futures backport.
+    ThreadPoolExecutor = ProcessPoolExecutor = None
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+@unittest.skipIf(ThreadPoolExecutor is None, 'concurrent.futures is not available')
+class TestPipelinedPipe(unittest.TestCase):
+    EXECUTOR_TYPE = ThreadPoolExecutor
+
+    def make_pipelined_pair(self, **kwargs):
+        executor = self.EXECUTOR_TYPE(2)
+        self.addCleanup(executor.shutdown)
+        # Start the workers before the sockets exist so forked
+        # worker processes don't keep the peer's socket open.
+        executor.submit(int).result()
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        return (picklepipe.PipelinedPipe(rd, executor, **kwargs),
+                picklepipe.PipelinedPipe(wr, executor, **kwargs))
+
+    def test_objects_arrive_in_order(self):
+        rd, wr = self.make_pipelined_pair(max_pending=4)
+        objs = [list(range(i * 100)) for i in range(20)]
+        for obj in objs:
+            wr.send_object(obj)
+        wr.flush()
+        self.assertEqual(wr.pending, 0)
+        for obj in objs:
+            self.assertEqual(rd.recv_object(timeout=1.0), obj)
+
+    def test_interoperates_with_plain_pipe(self):
+        rd, wr = self.make_pipelined_pair()
+        wr._pipe.send_object('abc')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+
+    def test_serializing_error_on_flush(self):
+        rd, wr = self.make_pipelined_pair()
+        sock = socket.socket()
+        self.addCleanup(sock.close)
+        try:
+            # The error is raised once the object is being written.
+            wr.send_object(sock)
+            wr.flush()
+        except picklepipe.PipeSerializingError:
+            pass
+        else:
+            self.fail('Didn\'t raise picklepipe.PipeSerializingError')
+
+    def test_deserializing_error_keeps_order(self):
+        rd, wr = self.make_pipelined_pair()
+        wr._pipe._send_frame(picklepipe.pipe.FRAME_OBJECT, b'abc123')
+        wr.send_object('abc')
+        wr.flush()
+        self.assertRaises(picklepipe.PipeDeserializingError, rd.recv_object, timeout=1.0)
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+
+    def test_peer_closes_after_sending(self):
+        rd, wr = self.make_pipelined_pair()
+        wr.send_object('a')
+        wr.send_object('b')
+        wr.flush()
+        wr.close()
+        self.assertEqual(rd.recv_object(timeout=1.0), 'a')
+        self.assertEqual(rd.recv_object(timeout=1.0), 'b')
+        self.assertRaises(picklepipe.PipeClosed, rd.recv_object, timeout=1.0)
+        self.assertRaises(picklepipe.PipeClosed, rd.recv_object, timeout=1.0)
+
+    def test_too_large_object_keeps_order(self):
+        rd, wr = self.make_pipelined_pair()
+        rd._pipe.set_max_size(1000)
+        wr.send_object('first')
+        wr.send_object('x' * 5000)
+        wr.send_object('third')
+        wr.flush()
+        self.assertEqual(rd.recv_object(timeout=1.0), 'first')
+        self.assertRaises(picklepipe.PipeObjectTooLargeError, rd.recv_object, timeout=1.0)
+        self.assertEqual(rd.recv_object(timeout=1.0), 'third')
+
+    def test_timeout(self):
+        rd, wr = self.make_pipelined_pair()
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.1)
+
+    def test_invalid_max_pending(self):
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        self.assertRaises(ValueError, picklepipe.PipelinedPipe, rd, None, max_pending=0)
+
+
+@unittest.skipIf(ProcessPoolExecutor is None, 'concurrent.futures is not available')
+class TestPipelinedPipeProcessPool(TestPipelinedPipe):
+    EXECUTOR_TYPE = ProcessPoolExecutor
+
+    def test_serializing_error_on_flush(self):
+        # Sockets can't be sent to the worker processes at all.
+        pass
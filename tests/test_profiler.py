@@ -0,0 +1,153 @@
+import sys
+import unittest
+import picklepipe
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2.7 without the futures backport.
+    ThreadPoolExecutor = None
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class Order(object):
+    def __init__(self, order_id, items, note):
+        self.order_id = order_id
+        self.items = items
+        self.note = note
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def reduce_point(point):
+    return Point, (point.x, point.y)
+
+
+class TestPayloadProfiler(unittest.TestCase):
+    def make_profiled_pair(self, profiler, **kwargs):
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe, **kwargs)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        wr.set_profiler(profiler)
+        self.assertIs(wr.profiler, profiler)
+        return rd, wr
+
+    def make_order(self, i):
+        return Order(i, [{'sku': 'sku-%d' % j, 'qty': j} for j in range(10)], 'x' * 1000)
+
+    def test_counts_every_object(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=10)
+        rd, wr = self.make_profiled_pair(profiler)
+        for i in range(25):
+            wr.send_object(self.make_order(i))
+        wr.send_object([1, 2, 3])
+        for _ in range(26):
+            rd.recv_object(timeout=1.0)
+
+        report = profiler.report()
+        self.assertEqual(report['objects'], 26)
+        self.assertEqual(report['sampled_objects'], 3)
+        self.assertEqual(report['types'][__name__ + '.Order']['objects'], 25)
+        self.assertEqual(report['types']['list']['objects'], 1)
+        self.assertEqual(report['bytes'], sum(stats['bytes']
+                                              for stats in report['types'].values()))
+        self.assertGreater(report['dumps_time'], 0.0)
+
+    def test_attributes_bytes_to_paths(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=1)
+        rd, wr = self.make_profiled_pair(profiler)
+        wr.send_object(self.make_order(1))
+        rd.recv_object(timeout=1.0)
+
+        report = profiler.report()
+        paths = report['paths']
+        self.assertGreaterEqual(paths['.note']['bytes'], 1000)
+        self.assertIn(".items[*]['sku']", paths)
+        self.assertGreaterEqual(report['nested_types']['str']['bytes'], 1000)
+
+        # Attributed bytes add up to nearly all of the serialized bytes.
+        attributed = sum(stats['bytes'] for stats in paths.values())
+        self.assertLessEqual(attributed, report['sampled_bytes'])
+        self.assertGreater(attributed, report['sampled_bytes'] - 16)
+        self.assertAlmostEqual(sum(stats['dumps_time'] for stats in paths.values()),
+                               report['dumps_time'])
+
+    def test_shared_and_interned_values(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=1)
+        rd, wr = self.make_profiled_pair(profiler)
+        wr.send_object({'a': 5, 'b': None, 'c': 5, 'd': None, 'e': 'e'})
+        rd.recv_object(timeout=1.0)
+        paths = profiler.report()['paths']
+        for key in 'abcde':
+            self.assertIn('[%r]' % key, paths)
+
+    def test_shared_reference(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=1)
+        rd, wr = self.make_profiled_pair(profiler)
+        obj = {'first': 'x' * 3000}
+        obj['zlast'] = obj['first']
+        wr.send_object(obj)
+        rd.recv_object(timeout=1.0)
+
+        # The string is written under its first key, the second key is a memo reference.
+        paths = profiler.report()['paths']
+        self.assertGreaterEqual(paths["['first']"]['bytes'], 3000)
+        self.assertLess(paths["['zlast']"]['bytes'], 10)
+
+    @unittest.skipIf(sys.version_info < (3, 3), 'Reducers require Python 3.3 or later.')
+    def test_uses_pipe_reducers(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=1)
+        rd, wr = self.make_profiled_pair(profiler)
+        wr.register_reducer(Point, reduce_point)
+        wr.send_object(Point(1, 2))
+        self.assertEqual(rd.recv_object(timeout=1.0).x, 1)
+        report = profiler.report()
+        self.assertNotIn('.x', report['paths'])
+        self.assertIn(__name__ + '.Point', report['nested_types'])
+
+    def test_reset_and_format_report(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=1)
+        rd, wr = self.make_profiled_pair(profiler)
+        wr.send_object(self.make_order(1))
+        text = profiler.format_report(limit=3)
+        self.assertIn('.note', text)
+        self.assertIn('Nested types', text)
+        profiler.reset()
+        self.assertEqual(profiler.report()['objects'], 0)
+        self.assertEqual(profiler.report()['paths'], {})
+
+    @unittest.skipIf(ThreadPoolExecutor is None, 'concurrent.futures is not available')
+    def test_wrapped_pipes_are_recorded(self):
+        profiler = picklepipe.PayloadProfiler(sample_every=1)
+        rd, wr = self.make_profiled_pair(profiler)
+        lanes = picklepipe.LanePipe(wr)
+        lanes.send_object([1, 2, 3], lane=1)
+        self.assertEqual(profiler.report()['types']['list']['objects'], 1)
+
+        executor = ThreadPoolExecutor(1)
+        self.addCleanup(executor.shutdown)
+        pipelined = picklepipe.PipelinedPipe(wr, executor)
+        pipelined.send_object(self.make_order(1))
+        pipelined.flush()
+        report = profiler.report()
+        self.assertEqual(report['objects'], 2)
+        self.assertIn('.note', report['paths'])
+
+    def test_remove_profiler(self):
+        profiler = picklepipe.PayloadProfiler()
+        rd, wr = self.make_profiled_pair(profiler)
+        wr.set_profiler(None)
+        wr.send_object('abc')
+        self.assertEqual(profiler.report()['objects'], 0)
+
+    def test_invalid_sample_every(self):
+        self.assertRaises(ValueError, picklepipe.PayloadProfiler, sample_every=0)
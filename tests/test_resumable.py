@@ -0,0 +1,125 @@
+import threading
+import unittest
+import picklepipe
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class TestResumablePipe(unittest.TestCase):
+    def make_pipe_pair(self):
+        rd, wr = picklepipe.make_pipe_pair(picklepipe.PicklePipe)
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        return rd, wr
+
+    def make_session(self, **kwargs):
+        rd, wr = self.make_pipe_pair()
+        sessions = {}
+        client = picklepipe.ResumablePipe(wr, **kwargs)
+        server = picklepipe.ResumablePipe.accept(rd, sessions, timeout=1.0, **kwargs)
+        return client, server, sessions
+
+    def reconnect(self, client, server, sessions):
+        rd, wr = self.make_pipe_pair()
+        thread = threading.Thread(target=client.resume, args=(wr,), kwargs={'timeout': 1.0})
+        thread.start()
+        self.assertIs(picklepipe.ResumablePipe.accept(rd, sessions, timeout=1.0), server)
+        thread.join(1.0)
+
+    def test_send_and_recv(self):
+        client, server, sessions = self.make_session()
+        self.assertEqual(list(sessions), [client.session_id])
+        client.send_object('abc')
+        server.send_object([1, 2, 3])
+        self.assertEqual(server.recv_object(timeout=1.0), 'abc')
+        self.assertEqual(client.recv_object(timeout=1.0), [1, 2, 3])
+
+    def test_acknowledged_frames_are_dropped(self):
+        client, server, _ = self.make_session(max_replay=8)
+        for i in range(20):
+            client.send_object(i)
+            self.assertEqual(server.recv_object(timeout=1.0), i)
+        self.assertLessEqual(client.pending, 8)
+        self.assertRaises(picklepipe.PipeTimeout, server.recv_object, timeout=0.0)
+        self.assertRaises(picklepipe.PipeTimeout, client.recv_object, timeout=0.1)
+        self.assertEqual(client.pending, 0)
+
+    def test_resume_sends_lost_frames(self):
+        client, server, sessions = self.make_session()
+        for i in range(10):
+            client.send_object(i)
+        received = [server.recv_object(timeout=1.0) for _ in range(4)]
+
+        # The connection is lost along with the frames in flight.
+        client._pipe.close()
+        server._pipe.close()
+        self.assertRaises(picklepipe.PipeClosed, server.recv_object, timeout=1.0)
+        self.assertIs(client.disconnected, True)
+
+        self.reconnect(client, server, sessions)
+        self.assertIs(client.disconnected, False)
+        while len(received) < 10:
+            received.append(server.recv_object(timeout=1.0))
+        self.assertEqual(received, list(range(10)))
+        self.assertRaises(picklepipe.PipeTimeout, server.recv_object, timeout=0.1)
+
+    def test_send_while_disconnected(self):
+        client, server, sessions = self.make_session(max_replay=4)
+        client._pipe.close()
+        for i in range(4):
+            client.send_object(i)
+        self.assertRaises(picklepipe.PipeClosed, client.send_object, 4)
+
+        self.reconnect(client, server, sessions)
+        self.assertEqual([server.recv_object(timeout=1.0) for _ in range(4)], list(range(4)))
+
+    def test_replay_buffer_full(self):
+        client, server, _ = self.make_session(max_replay=4)
+        client._pipe.set_send_timeout(0.1)
+        for i in range(4):
+            client.send_object(i)
+        self.assertRaises(picklepipe.PipeTimeout, client.send_object, 4)
+
+    def test_replay_buffer_waits_for_acks(self):
+        client, server, _ = self.make_session(max_replay=4)
+        received = []
+
+        def receive():
+            for _ in range(100):
+                received.append(server.recv_object(timeout=1.0))
+        thread = threading.Thread(target=receive)
+        thread.start()
+        for i in range(100):
+            client.send_object(i)
+        thread.join(5.0)
+        self.assertEqual(received, list(range(100)))
+
+    def test_unknown_session(self):
+        client, server, _ = self.make_session()
+        client.send_object('abc')
+        server.recv_object(timeout=1.0)
+        rd, wr = self.make_pipe_pair()
+        thread = threading.Thread(target=self.assertRaises,
+                                  args=(picklepipe.PipeError, client.resume, wr),
+                                  kwargs={'timeout': 1.0})
+        thread.start()
+        self.assertRaises(picklepipe.PipeSessionLost,
+                          picklepipe.ResumablePipe.accept, rd, {}, timeout=1.0)
+        thread.join(1.0)
+
+    def test_session_mismatch(self):
+        client, server, _ = self.make_session()
+        rd, wr = self.make_pipe_pair()
+        other = picklepipe.ResumablePipe(rd)
+        self.assertRaises(picklepipe.PipeSessionLost, client.resume, wr, timeout=1.0)
+        other.close()
+
+    def test_invalid_arguments(self):
+        rd, wr = self.make_pipe_pair()
+        self.assertRaises(ValueError, picklepipe.ResumablePipe, wr, max_replay=0)
+        self.assertRaises(ValueError, picklepipe.ResumablePipe, wr, session_id=b'abc')
@@ -0,0 +1,106 @@
+import threading
+import unittest
+import picklepipe
+from picklepipe.shaping import _Schedule
+from picklepipe.timeout import monotonic
+
+
+def _safe_close(pipe):
+    try:
+        pipe.close()
+    except:
+        pass
+
+
+class TestShapedPipe(unittest.TestCase):
+    PIPE_TYPE = picklepipe.PicklePipe
+
+    def make_shaped_pair(self, **kwargs):
+        rd, wr = picklepipe.make_shaped_pipe_pair(self.PIPE_TYPE, picklepipe.LinkShape(**kwargs))
+        self.addCleanup(_safe_close, rd)
+        self.addCleanup(_safe_close, wr)
+        return rd, wr
+
+    def send_in_thread(self, pipe, objs):
+        def send():
+            for obj in objs:
+                pipe.send_object(obj)
+        thread = threading.Thread(target=send)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def test_short_reads_and_stalls(self):
+        rd, wr = self.make_shaped_pair(max_chunk=7, jitter=0.001, stall_rate=0.01,
+                                       stall_time=0.001, seed=1)
+        objs = [list(range(i * 50)) for i in range(20)]
+        self.send_in_thread(wr, objs)
+        for obj in objs:
+            self.assertEqual(rd.recv_object(timeout=5.0), obj)
+
+    def test_short_writes(self):
+        rd, wr = self.make_shaped_pair(buffer_size=4096, max_chunk=1024)
+        obj = b'x' * 1000000
+        self.send_in_thread(wr, [obj])
+        self.assertEqual(rd.recv_object(timeout=5.0), obj)
+
+    def test_latency(self):
+        rd, wr = self.make_shaped_pair(latency=0.1)
+        start = monotonic()
+        wr.send_object('abc')
+        self.assertRaises(picklepipe.PipeTimeout, rd.recv_object, timeout=0.02)
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        self.assertGreaterEqual(monotonic() - start, 0.1)
+
+    def test_bandwidth(self):
+        rd, wr = self.make_shaped_pair(bandwidth=1000000)
+        start = monotonic()
+        self.send_in_thread(wr, [b'x' * 200000])
+        self.assertEqual(len(rd.recv_object(timeout=5.0)), 200000)
+        self.assertGreaterEqual(monotonic() - start, 0.18)
+
+    def test_close_reaches_peer(self):
+        rd, wr = self.make_shaped_pair(latency=0.01)
+        wr.send_object('abc')
+        wr.close()
+        self.assertEqual(rd.recv_object(timeout=1.0), 'abc')
+        self.assertRaises(picklepipe.PipeClosed, rd.recv_object, timeout=1.0)
+
+    def test_send_to_closed_peer(self):
+        rd, wr = self.make_shaped_pair()
+        rd.close()
+        try:
+            for _ in range(100):
+                wr.send_object(b'x' * 65536)
+        except picklepipe.PipeClosed:
+            pass
+        else:
+            self.fail('Didn\'t raise picklepipe.PipeClosed')
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, picklepipe.LinkShape, latency=-1)
+        self.assertRaises(ValueError, picklepipe.LinkShape, bandwidth=0)
+        self.assertRaises(ValueError, picklepipe.LinkShape, max_chunk=0)
+        self.assertRaises(ValueError, picklepipe.LinkShape, stall_rate=2.0)
+        self.assertRaises(ValueError, picklepipe.LinkShape, buffer_size=0)
+
+
+class TestSchedule(unittest.TestCase):
+    def split(self, seed, data):
+        shape = picklepipe.LinkShape(latency=0.01, jitter=0.01, bandwidth=10000,
+                                     max_chunk=16, stall_rate=0.1, stall_time=0.05)
+        schedule = _Schedule(shape, seed)
+        return [chunk for piece in data for chunk in schedule.split(piece, 0.0)]
+
+    def test_same_seed_same_schedule(self):
+        data = [b'x' * 100, b'y' * 37, b'z' * 250]
+        self.assertEqual(self.split('1', data), self.split('1', data))
+        self.assertNotEqual(self.split('1', data), self.split('2', data))
+
+    def test_chunks_are_in_order(self):
+        chunks = self.split('1', [b'abcdefgh' * 100])
+        self.assertEqual(b''.join(chunk for _, chunk in chunks), b'abcdefgh' * 100)
+        self.assertTrue(all(len(chunk) <= 16 for _, chunk in chunks))
+        times = [deliver_at for deliver_at, _ in chunks]
+        self.assertEqual(times, sorted(times))
+        self.assertGreaterEqual(times[-1], 800 / 10000.0)
@@ -0,0 +1,38 @@
+import struct
+import unittest
+import picklepipe
+from picklepipe.tracing import _pack_trace, _mark_received, _unpack_trace
+
+
+class TestFrameTrace(unittest.TestCase):
+    def test_pack_and_unpack(self):
+        data = _pack_trace(0, 100.0, 0.25, 'abc') + b'payload'
+        trace, frame_type, payload = _unpack_trace(_mark_received(data, 101.5, 0.5))
+        self.assertEqual(frame_type, 0)
+        self.assertEqual(payload, b'payload')
+        self.assertEqual(trace.trace_id, 'abc')
+        self.assertEqual(trace.size, 7)
+        self.assertEqual(trace.sent_at, 100.0)
+        self.assertEqual(trace.serialize_time, 0.25)
+        self.assertEqual(trace.queue_delay, 1.5)
+        self.assertEqual(trace.read_time, 0.5)
+        self.assertIs(trace.deserialize_time, None)
+
+    def test_bytes_and_missing_trace_id(self):
+        data = _mark_received(_pack_trace(0, 0.0, 0.0, b'abc'), 0.0, 0.0)
+        self.assertEqual(_unpack_trace(data)[0].trace_id, b'abc')
+        data = _mark_received(_pack_trace(0, 0.0, 0.0, None), 0.0, 0.0)
+        self.assertIs(_unpack_trace(data)[0].trace_id, None)
+
+    def test_trace_id_too_long(self):
+        self.assertRaises(ValueError, _pack_trace, 0, 0.0, 0.0, b'x' * 0x10000)
+
+    def test_truncated_trace(self):
+        data = _mark_received(_pack_trace(0, 0.0, 0.0, b'abc'), 0.0, 0.0)
+        self.assertRaises(ValueError, _unpack_trace, data[:-1])
+        self.assertRaises(struct.error, _unpack_trace, data[:10])
+
+    def test_repr(self):
+        data = _mark_received(_pack_trace(0, 0.0, 0.0, 'abc'), 0.0, 0.0)
+        self.assertIn("'abc'", repr(_unpack_trace(data)[0]))
+        self.assertTrue(hasattr(picklepipe, 'FrameTrace'))